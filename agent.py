@@ -1,12 +1,13 @@
 import os
-from typing import List, Dict, Any
-from langchain.llms.base import LLM
-from langchain.agents import Tool
-from langchain_community.vectorstores import Chroma
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain.chains import RetrievalQA
-from pydantic import Field
-import requests
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from embedding_cache import DEFAULT_CACHE_PATH
+from response_cache import ResponseCache
+from vectorstore import get_corpus_version, open_vector_store
+from llm_client import LMStudioLLM
+from async_pipeline import ahandle_query, run_sync
+from tracing import DEFAULT_TRACE_PATH, configure_tracing, span
+import time
 import streamlit as st
 
 # Set Streamlit page configuration
@@ -87,156 +88,61 @@ with st.sidebar:
 if 'messages' not in st.session_state:
     st.session_state['messages'] = []
 
-# Custom LLM integration with LMStudio
-class LMStudioLLM(LLM):
-    endpoint: str = Field(...)  # Declare endpoint as a required field
-
-    def __init__(self, endpoint: str):
-        super().__init__(endpoint=endpoint)
-
-    def _call(self, prompt: str, stop: None = None, **kwargs: Any) -> str:
-        try:
-            import time
-            start_time = time.time()
-            response = requests.post(
-                f"{self.endpoint}/v1/chat/completions",
-                json={
-                    "model": "llama-3.2-3b-instruct",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": 1000,
-                },
-                timeout=100  # Add a timeout
-            )
-            end_time = time.time()
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                raise Exception(f"LLM Error: {response.status_code} - {response.text}")
-        except requests.exceptions.Timeout:
-            raise Exception("[ERROR] LLM request timed out.")
-        except Exception as e:
-            raise Exception(f"[ERROR] An unexpected error occurred: {str(e)}")
-
-    @property
-    def _llm_type(self) -> str:
-        return "lmstudio"
-
-    @property
-    def _identifying_params(self) -> Dict[str, Any]:
-        return {"endpoint": self.endpoint}
-
 # Streamlit Caching for resources
 @st.cache_resource
 def load_vector_store(persist_directory: str):
     st.write("[INFO] Loading vector store...")
-    embeddings = OpenAIEmbeddings()
-    vector_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    # Queries are embedded with the backend the store was built with (a local model needs no network
+    # round-trip), through the shared on-disk embedding cache. VECTOR_STORE_BACKEND=numpy searches the
+    # in-process NumPy index instead of Chroma.
+    vector_store = open_vector_store(persist_directory, cache_path=DEFAULT_CACHE_PATH,
+                                     backend=os.environ.get("VECTOR_STORE_BACKEND", "chroma"))
     st.write("[INFO] Vector store loaded successfully.")
     return vector_store
 
 @st.cache_resource
 def initialize_llm(endpoint: str):
     st.write("[INFO] Initializing LLM...")
-    llm = LMStudioLLM(endpoint=endpoint)
+    llm = LMStudioLLM(endpoint=endpoint, streaming=True)
     st.write("[INFO] LLM initialized successfully.")
     return llm
 
-# Tool Wrappers
-def summarize(query: str) -> str:
-    from summarizer import optimized_summarizer
-
-    try:
-        vector_store = load_vector_store(persist_directory="./chroma_db")
-        llm = initialize_llm(endpoint="http://127.0.0.1:1234")
-
-        retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 3})
-
-        st.write(f"[INFO] Processing query: {query}")
-        result = optimized_summarizer(query, retriever, llm)
-        return f"[Tool: Summarizer] {result}"
-
-    except Exception as e:
-        return f"[Tool: Summarizer] An error occurred: {str(e)}"
-
-def recommend(query: str) -> str:
-    from recommend import rag_recommender
-
-    try:
-        vector_store = load_vector_store(persist_directory="./chroma_db")
-        llm = initialize_llm(endpoint="http://127.0.0.1:1234")
-
-        retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-
-        st.write(f"[INFO] Processing query: {query}")
-        result = rag_recommender(query, retriever, llm)
-        return f"[Tool: Recommender] {result}"
-
-    except Exception as e:
-        return f"[Tool: Recommender] An error occurred: {str(e)}"
-
-def alternative(query: str) -> str:
-    from alternative import initialize_web_search_agent
+# Streams LLM tokens into a chat bubble as they arrive
+class StreamlitTokenHandler(BaseCallbackHandler):
+    run_inline = True  # Called on the event loop's thread, which owns the Streamlit script context
 
-    try:
-        llm = initialize_llm(endpoint="http://127.0.0.1:1234")
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+        self.start_time = time.time()
+        self.first_token_time = None
 
-        st.write("[INFO] Initializing Web Search Agent...")
-        web_search_agent = initialize_web_search_agent(llm)
-        st.write("[INFO] Web Search Agent initialized successfully.")
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.text += token
+        self.container.markdown(f"<div class='chat-bubble-assistant'>{self.text}</div>", unsafe_allow_html=True)
 
-        st.write(f"[INFO] Processing query: {query}")
-        result = web_search_agent.run(query)
-        return f"[Tool: Alternative Search] {result}"
-
-    except Exception as e:
-        return f"[Tool: Alternative Search] An error occurred: {str(e)}"
-
-def qa(query: str) -> str:
-    from rag_QA import test_rag_pipeline
-
-    try:
-        vector_store = load_vector_store(persist_directory="./chroma_db")
-        llm = initialize_llm(endpoint="http://127.0.0.1:1234")
-
-        retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm, retriever=retriever, return_source_documents=True
-        )
-
-        st.write(f"[INFO] Processing query: {query}")
-        result = test_rag_pipeline(qa_chain, query)
-
-        if "I don't know" in result or "No relevant information found" in result:
-            return None  # Indicate failure to find an answer
-        else:
-            return f"[Tool: QA] {result}"
-
-    except Exception as e:
-        return f"[Tool: QA] An error occurred: {str(e)}"
-
-def classify_query(query: str, llm: LLM) -> str:
-    if "recommend" in query.lower() or "recommendation" in query.lower():
-        return "Recommender"
-
-    question_words = ["what", "how", "when", "where", "why", "who", "can", "is", "are", "do", "does", "did", "list", "which", "whom", "whose"]
-    if any(query.lower().startswith(word) for word in question_words):
-        return "QA"
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return self.first_token_time - self.start_time if self.first_token_time else None
 
-    prompt = f"""
-You are an intelligent query classifier for an agent application. The application has four tools:
-1. Summarizer: For queries seeking a concise summary of information, even indirectly.
-2. Recommender: For queries requesting recommendations or alternatives.
-3. QA: For factual questions requiring precise answers.
-4. Alternative Search: For all other types of queries.
+# The streamed bubble is replaced by the final message in the chat history
+def finish_stream(handler: StreamlitTokenHandler):
+    handler.container.empty()
+    if handler.time_to_first_token is not None:
+        st.write(f"[INFO] Time to first token: {handler.time_to_first_token * 1000:.0f} ms")
 
-Based on the above tools, classify the following query:
-Query: "{query}"
+@st.cache_resource
+def initialize_response_cache():
+    embeddings = load_vector_store(persist_directory="./chroma_db").embeddings
+    return ResponseCache(embeddings=embeddings, similarity_threshold=0.95, ttl_seconds=3600, max_entries=500)
 
-Respond only with one of these tool names: Summarizer, Recommender, QA, or Alternative Search.
-    """
-    response = llm(prompt).strip()
-    valid_tools = {"Summarizer", "Recommender", "QA", "Alternative Search"}
-    return response if response in valid_tools else "QA"  # Default to QA
+# Per-stage spans go to traces.jsonl (`python tracing.py` prints percentiles), and to an
+# OpenTelemetry collector when OTEL_EXPORTER_OTLP_ENDPOINT is set
+@st.cache_resource
+def initialize_tracing():
+    configure_tracing(DEFAULT_TRACE_PATH, otlp_endpoint=os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"))
 
 # Main App
 def main():
@@ -249,30 +155,47 @@ def main():
     if st.button("Send") and query.strip() != "":
         st.session_state['messages'].append({"role": "user", "content": query})
 
-        try:
-            llm = initialize_llm(endpoint="http://127.0.0.1:1234")
-            tool_name = classify_query(query, llm)
-            st.write(f"[INFO] Routed to tool: {tool_name}")
-
-            tools = {
-                "Summarizer": summarize,
-                "Recommender": recommend,
-                "QA": qa,
-                "Alternative Search": alternative,
-            }
-
-            if tool_name in tools:
-                response = tools[tool_name](query)
-
-                if tool_name == "QA" and (response is None or "An error occurred" in response):
-                    st.write("[INFO] QA tool could not find an answer. Switching to Alternative Search.")
-                    response = tools["Alternative Search"](query)
-
-                st.session_state['messages'].append({"role": "assistant", "content": response})
-            else:
-                st.write("[ERROR] No matching tool found for the query.")
-        except Exception as e:
-            st.session_state['messages'].append({"role": "assistant", "content": f"An error occurred: {str(e)}"})
+        initialize_tracing()
+        with span("request", query_chars=len(query)) as request_span:
+            try:
+                # Answer repeated or near-identical questions from the response cache, skipping the LLM
+                start_time = time.time()
+                response_cache = initialize_response_cache()
+                corpus_version = get_corpus_version("./chroma_db")
+                with span("response_cache") as cache_span:
+                    cached = response_cache.get(query, corpus_version)
+                    cache_span.set(hit=cached["match"] if cached else None)
+
+                if cached:
+                    st.write(f"[INFO] Served from response cache ({cached['match']} match, tool: {cached['tool']})")
+                    request_span.set(tool=cached["tool"], cached=True)
+                    st.session_state['messages'].append({"role": "assistant", "content": cached["response"]})
+                else:
+                    # Routing, query embedding, retrieval and generation run on one event loop;
+                    # classification and the query embedding are issued concurrently
+                    vector_store = load_vector_store(persist_directory="./chroma_db")
+                    llm = initialize_llm(endpoint="http://127.0.0.1:1234")
+                    stream_handler = StreamlitTokenHandler(st.empty())
+                    tool_name, response = run_sync(
+                        ahandle_query(query, vector_store, llm, callbacks=[stream_handler], log=st.write)
+                    )
+                    finish_stream(stream_handler)
+                    request_span.set(tool=tool_name, cached=False)
+
+                    if "An error occurred" not in response:
+                        response_cache.put(query, corpus_version, tool_name, response,
+                                           latency=time.time() - start_time)
+                    st.session_state['messages'].append({"role": "assistant", "content": response})
+            except Exception as e:
+                request_span.error = str(e)
+                st.session_state['messages'].append({"role": "assistant", "content": f"An error occurred: {str(e)}"})
+
+    cache_stats = initialize_response_cache().stats()
+    st.sidebar.markdown(
+        f"**Response cache:** {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['exact_hits']} exact, {cache_stats['semantic_hits']} semantic), "
+        f"{cache_stats['latency_saved']:.1f}s saved"
+    )
 
     for message in st.session_state['messages']:
         if message['role'] == 'user':
@@ -1,49 +1,9 @@
 import os
-import requests
-from typing import Dict, Any, List
+from typing import Any
 from langchain.llms.base import LLM
 from langchain_community.tools import DuckDuckGoSearchResults, Tool
 from langchain.agents import initialize_agent
-from pydantic import Field
-
-# Custom LLM integration with LMStudio
-class LMStudioLLM(LLM):
-    endpoint: str = Field(...)  # Declare endpoint as a required field
-
-    def __init__(self, endpoint: str):
-        super().__init__(endpoint=endpoint)
-
-    def _call(self, prompt: str, stop: None = None, **kwargs: Any) -> str:
-        try:
-            import time
-            start_time = time.time()
-            response = requests.post(
-                f"{self.endpoint}/v1/chat/completions",
-                json={
-                    "model": "llama-3.2-3b-instruct",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": 1000,
-                },
-                timeout=100  # Add a timeout
-            )
-            end_time = time.time()
-            print(f"[DEBUG] LLM call duration: {end_time - start_time:.2f} seconds")
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                raise Exception(f"LLM Error: {response.status_code} - {response.text}")
-        except requests.exceptions.Timeout:
-            raise Exception("[ERROR] LLM request timed out.")
-        except Exception as e:
-            raise Exception(f"[ERROR] An unexpected error occurred: {str(e)}")
-
-    @property
-    def _llm_type(self) -> str:
-        return "lmstudio"
-
-    @property
-    def _identifying_params(self) -> Dict[str, Any]:
-        return {"endpoint": self.endpoint}
+from llm_client import LMStudioLLM
 
 # Initialize the DuckDuckGo Search Tool
 ddg_search = DuckDuckGoSearchResults()
@@ -0,0 +1,257 @@
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+from langchain.chains import RetrievalQA
+from langchain.llms.base import LLM
+
+from attribute_index import direct_answer
+from drug_graph import CHUNKS_PER_DRUG, describe, get_drug_graph, plan_recommendation
+from fact_sheets import lookup_fact_sheet, render_fact_sheet
+from hierarchical_summarizer import asummarize_label, get_summary_cache, summary_report, whole_label_request
+from llm_client import aclose_async_clients
+from hybrid_retriever import get_store_bm25_index, hybrid_search
+from query_analysis import QueryAnalysis, filtered_search, get_query_analyzer
+from recommend import arecommend_from_documents
+from reranker import RERANK_FETCH_K, context_report, rerank_and_pack
+from router import aclassify_query
+from summarizer import asummarize_documents
+from tracing import annotate, span
+
+# Chunks retrieved per tool
+TOOL_K = {"Summarizer": 3, "Recommender": 5, "QA": 5}
+# Once the search is narrowed to the drug's label, fewer chunks carry the same answer
+FILTERED_TOOL_K = {"Summarizer": 3, "QA": 3}
+# Sections fetched for the drugs a recommendation is about, and for the alternatives the graph proposes
+TARGET_INTENTS = ["contraindications", "interactions"]
+ALTERNATIVE_INTENTS = ["indications", "contraindications"]
+
+
+# Embedding the query is the first network round-trip of retrieval; it runs concurrently with classification
+async def aembed_query(vector_store, query: str) -> List[float]:
+    with span("embed_query", query_chars=len(query)) as current:
+        embedding = await vector_store.embeddings.aembed_query(query)
+        current.set(dimensions=len(embedding))
+        return embedding
+
+
+# Drug names and section intent detected in the query, from the names held in the store's manifest
+def analyze_query(vector_store, query: str) -> Optional[QueryAnalysis]:
+    persist_directory = getattr(vector_store, "_persist_directory", None)
+    if not persist_directory:
+        return None
+    return get_query_analyzer(persist_directory).analyze(query)
+
+
+# Chroma's client is synchronous, so the search runs on a worker thread instead of blocking the loop.
+# Vector and BM25 results are fused when the store has a keyword index; with an analysis, both
+# searches are pre-filtered by drug and section metadata.
+async def aretrieve(vector_store, query: str, k: int, embedding: Optional[List[float]] = None,
+                    analysis: Optional[QueryAnalysis] = None):
+    if embedding is None:
+        embedding = await aembed_query(vector_store, query)
+    with span("retrieve", k=k, files=len(analysis.files) if analysis else 0) as current:
+        index = get_store_bm25_index(vector_store)
+        if index is not None:
+            current.set(mode="hybrid")
+            docs = await asyncio.to_thread(hybrid_search, vector_store, index, query, embedding, k, analysis)
+        elif analysis and (analysis.files or analysis.sections):
+            current.set(mode="filtered")
+            docs = await asyncio.to_thread(filtered_search, vector_store, embedding, k, analysis)
+        else:
+            current.set(mode="vector")
+            docs = await asyncio.to_thread(vector_store.similarity_search_by_vector, embedding, k)
+        current.set(chunks=len(docs))
+        return docs
+
+
+def tool_k(tool_name: str, analysis: Optional[QueryAnalysis]) -> int:
+    if analysis and analysis.files:
+        return FILTERED_TOOL_K.get(tool_name, TOOL_K[tool_name])
+    return TOOL_K[tool_name]
+
+
+# Over-fetch, rerank and pack into the tool's token budget (see reranker.py). The tool's old top-k
+# is the baseline the saving is reported against.
+async def aretrieve_context(vector_store, query: str, tool_name: str, embedding=None,
+                            analysis: Optional[QueryAnalysis] = None, log: Callable[[str], None] = print):
+    docs = await aretrieve(vector_store, query, RERANK_FETCH_K[tool_name], embedding, analysis)
+    return pack(query, docs, tool_name, tool_k(tool_name, analysis), analysis, log)
+
+
+def pack(query: str, docs, tool_name: str, baseline_k: int, analysis: Optional[QueryAnalysis] = None,
+         log: Callable[[str], None] = print):
+    with span("rerank_pack", tool=tool_name, candidates=len(docs)) as current:
+        packed = rerank_and_pack(query, docs, tool_name, baseline_k, analysis)
+        current.set(chunks=len(packed.documents), context_tokens=packed.tokens, tokens_saved=packed.tokens_saved)
+    log(context_report(tool_name, packed))
+    return packed.documents
+
+
+# Recommendation context from the drug graph's plan: the asked-about drugs' contraindication and
+# interaction chunks and each alternative's indication and contraindication chunks, fetched per
+# label instead of searching the whole collection
+async def arecommendation_context(vector_store, query: str, targets: List[str], alternatives, embedding=None,
+                                  log: Callable[[str], None] = print):
+    if embedding is None:
+        embedding = await aembed_query(vector_store, query)
+    sections_by_intent = get_query_analyzer(vector_store._persist_directory).sections_by_intent
+
+    def lookup(file: str, intents: List[str]) -> QueryAnalysis:
+        sections = [section for intent in intents for section in sections_by_intent.get(intent, [])]
+        return QueryAnalysis(files=[file], sections=sections, intents=intents)
+
+    lookups = [lookup(file, TARGET_INTENTS) for file in targets] + \
+              [lookup(alternative.label, ALTERNATIVE_INTENTS) for alternative in alternatives]
+    results = await asyncio.gather(*(aretrieve(vector_store, query, CHUNKS_PER_DRUG, embedding, analysis)
+                                     for analysis in lookups))
+    docs = [doc for result in results for doc in result]
+    return pack(query, docs, "Recommender", TOOL_K["Recommender"], log=log)
+
+
+# Async Tools
+async def asummarize(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> str:
+    with span("summarize"):
+        return await _asummarize(query, vector_store, llm, callbacks, embedding, log)
+
+
+async def _asummarize(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> str:
+    try:
+        analysis = analyze_query(vector_store, query)
+        # One known drug and no particular section: the precomputed fact sheet answers without the LLM
+        fact_sheet = lookup_fact_sheet(vector_store._persist_directory, analysis) if analysis else None
+        if fact_sheet:
+            log(f"[INFO] Served from the fact sheet store: {fact_sheet[0]}")
+            annotate(served_from="fact_sheet")
+            return f"[Tool: Summarizer] {render_fact_sheet(*fact_sheet)}"
+        # "Summarize amoxicillin" covers the whole label: map-reduce over all of its sections
+        if whole_label_request(analysis):
+            summary = await asummarize_label(query, vector_store, analysis.files, llm, get_summary_cache(),
+                                             callbacks=callbacks)
+            if summary.sections:
+                log(summary_report(summary))
+                annotate(served_from="hierarchical", chunks=summary.chunks, llm_calls=summary.llm_calls,
+                         cached_calls=summary.cached_calls)
+                return f"[Tool: Summarizer] {summary.summary}"
+        docs = await aretrieve_context(vector_store, query, "Summarizer", embedding, analysis, log)
+        result = await asummarize_documents(query, docs, llm, callbacks=callbacks)
+        return f"[Tool: Summarizer] {result}"
+    except Exception as e:
+        return f"[Tool: Summarizer] An error occurred: {str(e)}"
+
+
+async def arecommend(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> str:
+    with span("recommend"):
+        return await _arecommend(query, vector_store, llm, callbacks, embedding, log)
+
+
+async def _arecommend(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> str:
+    try:
+        analysis = analyze_query(vector_store, query)
+        graph = get_drug_graph(vector_store._persist_directory) if analysis else None
+        targets, alternatives = plan_recommendation(graph, query, analysis)
+        if targets or alternatives:
+            log(f"[INFO] Drug graph: {len(targets)} named drugs, alternatives: "
+                f"{', '.join(alternative.label for alternative in alternatives) or 'none'}")
+            docs = await arecommendation_context(vector_store, query, targets, alternatives, embedding, log)
+            facts = describe(graph, targets, alternatives)
+            annotate(served_from="drug_graph", alternatives=len(alternatives))
+        else:
+            # Alternatives live in other drugs' labels, so the recommender searches the whole collection
+            docs = await aretrieve_context(vector_store, query, "Recommender", embedding, log=log)
+            facts = None
+        result = await arecommend_from_documents(query, docs, llm, callbacks=callbacks, facts=facts)
+        return f"[Tool: Recommender] {result}"
+    except Exception as e:
+        return f"[Tool: Recommender] An error occurred: {str(e)}"
+
+
+async def aqa(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> Optional[str]:
+    with span("qa") as current:
+        response = await _aqa(query, vector_store, llm, callbacks, embedding, log)
+        current.set(answered=response is not None)
+        return response
+
+
+async def _aqa(query: str, vector_store, llm: LLM, callbacks=None, embedding=None, log=print) -> Optional[str]:
+    try:
+        analysis = analyze_query(vector_store, query)
+        # A question about one section of one drug is answered with that section, citing it
+        answer = direct_answer(vector_store._persist_directory, analysis, query) if analysis else None
+        if answer:
+            log("[INFO] Answered from the attribute index.")
+            annotate(served_from="attribute_index")
+            return f"[Tool: QA] {answer}"
+        docs = await aretrieve_context(vector_store, query, "QA", embedding, analysis, log)
+        # Same "stuff" prompt RetrievalQA uses, fed with the documents we already retrieved
+        qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=vector_store.as_retriever())
+        response = await qa_chain.combine_documents_chain.ainvoke(
+            {"input_documents": docs, "question": query}, config={"callbacks": callbacks}
+        )
+        result = response["output_text"]
+
+        if "I don't know" in result or "No relevant information found" in result:
+            return None  # Indicate failure to find an answer
+        return f"[Tool: QA] {result}"
+    except Exception as e:
+        return f"[Tool: QA] An error occurred: {str(e)}"
+
+
+async def aalternative(query: str, llm: LLM, callbacks=None) -> str:
+    from alternative import initialize_web_search_agent
+
+    with span("alternative_search"):
+        try:
+            web_search_agent = initialize_web_search_agent(llm)
+            response = await web_search_agent.ainvoke({"input": query}, config={"callbacks": callbacks})
+            return f"[Tool: Alternative Search] {response['output']}"
+        except Exception as e:
+            annotate(failed=str(e))
+            return f"[Tool: Alternative Search] An error occurred: {str(e)}"
+
+
+# End-to-end async request: classification and query embedding overlap, then the routed tool runs,
+# with the same QA -> Alternative Search fallback as the synchronous app.
+async def ahandle_query(query: str, vector_store, llm: LLM, callbacks=None,
+                        log: Callable[[str], None] = print) -> Tuple[str, str]:
+    with span("handle_query", query_chars=len(query)) as current:
+        tool_name, response = await _ahandle_query(query, vector_store, llm, callbacks, log)
+        current.set(tool=tool_name)
+        return tool_name, response
+
+
+async def _ahandle_query(query: str, vector_store, llm: LLM, callbacks=None,
+                         log: Callable[[str], None] = print) -> Tuple[str, str]:
+    embedding_task = asyncio.create_task(aembed_query(vector_store, query))
+    try:
+        with span("classify_query") as current:
+            tool_name = await aclassify_query(query, llm)
+            current.set(tool=tool_name)
+    except Exception:
+        embedding_task.cancel()
+        raise
+    log(f"[INFO] Routed to tool: {tool_name}")
+
+    if tool_name == "Alternative Search":
+        embedding_task.cancel()
+        return tool_name, await aalternative(query, llm, callbacks)
+
+    embedding = await embedding_task
+    tools = {"Summarizer": asummarize, "Recommender": arecommend, "QA": aqa}
+    response = await tools[tool_name](query, vector_store, llm, callbacks=callbacks, embedding=embedding, log=log)
+
+    if tool_name == "QA" and (response is None or "An error occurred" in response):
+        log("[INFO] QA tool could not find an answer. Switching to Alternative Search.")
+        with span("qa_fallback", reason="no answer" if response is None else "error"):
+            return "Alternative Search", await aalternative(query, llm, callbacks)
+    return tool_name, response
+
+
+# Run a coroutine to completion from synchronous code (e.g. a Streamlit script run),
+# closing the loop's pooled HTTP clients afterwards
+def run_sync(coro):
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await aclose_async_clients()
+    return asyncio.run(runner())
@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dedup import BOILERPLATE_SECTIONS
+from label_chunker import MARKER_PATTERN, count_tokens, split_on_markers
+from label_sections import canonical_section
+from query_analysis import QueryAnalysis
+
+# (drug label, canonical section) -> section text, kept next to the index manifest
+ATTRIBUTE_INDEX_FILE = "attribute_index.json"
+
+# A section longer than this is left to RetrievalQA rather than pasted whole
+DIRECT_ANSWER_MAX_TOKENS = 400
+
+# Questions that ask for a whole section ("What are the contraindications for X", "How should X be
+# administered"), as opposed to a specific fact inside it ("Can I take X with alcohol")
+SECTION_QUESTIONS = {
+    "indications": r"used for|\bindications?\b|what does .* treat",
+    "dosage": r"\bdos(e|es|age|ing)\b|how (should|do i|to|is|are) .* (take|taken|administer(ed)?|use|used|given)|"
+              r"when (should|do) i take",
+    "dosage_forms": r"strengths?|dosage forms?",
+    "contraindications": r"contraindications?|who should not (take|use)",
+    "warnings": r"\bwarnings?\b|precautions?",
+    "boxed_warning": r"boxed warning|black box",
+    "adverse_reactions": r"side[- ]?effects?|adverse (reactions?|effects?|events?)",
+    "interactions": r"(drug )?interactions?|interact",
+    "overdosage": r"overdos(e|age)",
+    "how_supplied": r"how (should|is|are) .* (stored|supplied)|storage",
+}
+
+# Words that may surround a whole-section question without narrowing it
+QUESTION_WORDS = {
+    "what", "which", "who", "how", "is", "are", "the", "a", "an", "of", "for", "to", "with", "be", "in", "on",
+    "does", "do", "should", "can", "i", "me", "my", "tell", "about", "list", "give", "show", "there", "any",
+    "main", "common", "usual", "recommended", "maximum", "daily", "drug", "drugs", "medication", "medications",
+    "come", "symptoms", "known", "possible", "please",
+}
+
+_NUMBERED = re.compile(r"^\s*\d{1,2}(\.\d+)?\s*")
+# Run-on section holding the whole label text, where the scraper left some numbered sections empty
+RESIDUAL_SECTION = "Drug Label Information"
+
+
+def _clean(text: str) -> str:
+    text = text.replace("\xa0", " ")
+    text = re.sub(r"\)(?=[A-Z])", ") ", text)  # "(2.1)The upper dose" run-ons from the scraper
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# Entries of one label: canonical section -> [{"heading", "text"}] in label order. Numbered headings
+# are the full prescribing information; unnumbered ones are the Highlights (or the sections of an
+# older, unnumbered label).
+def label_attributes(data: Dict) -> Dict[str, List[Dict[str, str]]]:
+    attributes: Dict[str, List[Dict[str, str]]] = {}
+    for heading, content in data.items():
+        if heading == "product_name" or heading in BOILERPLATE_SECTIONS or not isinstance(content, str):
+            continue
+        section = canonical_section(heading)
+        text = _clean(content)
+        if section and text:
+            attributes.setdefault(section, []).append({"heading": heading.strip(), "text": text})
+
+    # A numbered section the scraper left empty ("4. CONTRAINDICATIONS": "") is recovered from the
+    # run-on label text at its section marker
+    recovered: Dict[str, List[str]] = {}
+    for path, segment in split_on_markers(data.get(RESIDUAL_SECTION) or "", [RESIDUAL_SECTION]):
+        section = canonical_section(path[0])
+        if not section or not _NUMBERED.match(path[0]) or \
+                any(_NUMBERED.match(entry["heading"]) for entry in attributes.get(section, [])):
+            continue
+        marker = MARKER_PATTERN.match(segment)
+        text = _clean(segment[marker.end():] if marker and marker.group("major") else segment)
+        if text:
+            recovered.setdefault(path[0], []).append(text)
+    for heading, texts in recovered.items():
+        attributes.setdefault(canonical_section(heading), []).append({"heading": heading, "text": " ".join(texts)})
+    return attributes
+
+
+def build_attribute_index(json_dir: str) -> Dict:
+    labels = {}
+    for file_name in sorted(os.listdir(json_dir)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+                labels[file_name.split(".json")[0]] = label_attributes(json.load(f))
+    return {"built_at": datetime.now(timezone.utc).isoformat(), "labels": labels}
+
+
+def save_attribute_index(persist_directory: str, index: Dict):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, ATTRIBUTE_INDEX_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(path + ".tmp", path)
+    entries = sum(len(sections) for sections in index["labels"].values())
+    print(f"[INFO] Attribute index: {entries} (drug, section) entries over {len(index['labels'])} labels.")
+
+
+def load_attribute_index(persist_directory: str) -> Dict:
+    path = os.path.join(persist_directory, ATTRIBUTE_INDEX_FILE)
+    if not os.path.exists(path):
+        return {"labels": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Loaded once per change of the index file
+_indexes: Dict[str, Tuple[float, Dict]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_attribute_index(persist_directory: str) -> Dict:
+    path = os.path.join(persist_directory, ATTRIBUTE_INDEX_FILE)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+    with _indexes_lock:
+        cached = _indexes.get(persist_directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, load_attribute_index(persist_directory))
+            _indexes[persist_directory] = cached
+        return cached[1]
+
+
+# True when the query asks for the whole section: once the drug name, the section phrase and
+# question filler are removed, nothing that would narrow the question is left
+def is_section_question(query: str, section: str, analysis: QueryAnalysis) -> bool:
+    lowered = query.lower()
+    pattern = SECTION_QUESTIONS.get(section)
+    if not pattern or not re.search(pattern, lowered):
+        return False
+    remainder = re.sub(pattern, " ", lowered)
+    drug_words = {word for file in analysis.files for word in re.findall(r"[a-z0-9]+", file.lower())}
+    leftover = [word for word in re.findall(r"[a-z0-9]+", remainder)
+                if word not in QUESTION_WORDS and word not in drug_words and word not in analysis.drug_terms]
+    return not leftover
+
+
+# The section text that answers the query, or None when the match is ambiguous: not exactly one
+# drug and one section, no entry, several candidate passages, or a passage too long to paste
+def select_entry(index: Dict, analysis: Optional[QueryAnalysis], query: str) -> Optional[Tuple[str, str, str]]:
+    if not analysis or len(analysis.files) != 1 or len(analysis.intents) != 1:
+        return None
+    file, section = analysis.files[0], analysis.intents[0]
+    if not is_section_question(query, section, analysis):
+        return None
+    entries = index["labels"].get(file, {}).get(section, [])
+    unnumbered = [entry for entry in entries if not _NUMBERED.match(entry["heading"])]
+    numbered = [entry for entry in entries if _NUMBERED.match(entry["heading"])]
+    if len(unnumbered) == 1:
+        heading = unnumbered[0]["heading"] + (" (Highlights)" if numbered else "")
+        text = unnumbered[0]["text"]
+    elif not unnumbered and numbered:
+        heading = numbered[0]["heading"] if len(numbered) == 1 else ", ".join(e["heading"] for e in numbered)
+        text = "\n".join(entry["text"] if len(numbered) == 1 else f"{entry['heading']}: {entry['text']}"
+                         for entry in numbered)
+    else:
+        return None
+    if count_tokens(text) > DIRECT_ANSWER_MAX_TOKENS:
+        return None
+    return file, heading, text
+
+
+def direct_answer(persist_directory: str, analysis: Optional[QueryAnalysis], query: str) -> Optional[str]:
+    entry = select_entry(get_attribute_index(persist_directory), analysis, query)
+    if entry is None:
+        return None
+    file, heading, text = entry
+    return f"{text}\n\nSource: {file}, section \"{heading}\"."
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the (drug, section) attribute index used for direct QA answers.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--queries", default=None,
+                        help="Intent dataset (e.g. datasets/intent/eval.json) to report the share of QA queries "
+                             "answered directly")
+    args = parser.parse_args()
+
+    save_attribute_index(args.persist_directory, build_attribute_index(args.json_dir))
+    if args.queries:
+        from query_analysis import get_query_analyzer
+
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [example["query"] for example in json.load(f) if example["tool"] == "QA"]
+        analyzer = get_query_analyzer(args.persist_directory)
+        answered = [query for query in queries if direct_answer(args.persist_directory, analyzer.analyze(query), query)]
+        for query in answered:
+            print(f"[INFO]   direct: {query}")
+        print(f"[INFO] Answered directly: {len(answered)}/{len(queries)} QA queries "
+              f"({len(answered) / max(len(queries), 1):.0%})")
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import hierarchical_summarizer
+from async_pipeline import ahandle_query, run_sync
+from attribute_index import build_attribute_index, save_attribute_index
+from drug_graph import DrugGraph
+from embedding_backends import HashingEmbeddings
+from hierarchical_summarizer import DEFAULT_SUMMARY_CACHE_PATH, SummaryCache
+from label_chunker import count_tokens
+from llm_client import LMStudioLLM
+from rag_QA import SAMPLE_QUERIES as QA_QUERIES
+from recommend import SAMPLE_QUERIES as RECOMMEND_QUERIES
+from router import get_intent_classifier
+from summarizer import SAMPLE_QUERIES as SUMMARY_QUERIES
+from tracing import configure_tracing, load_spans, stage_stats
+
+# Benchmark runs are appended here, one JSON object per run, tagged with the commit they measured
+DEFAULT_RESULTS_PATH = "./benchmark_results.jsonl"
+CONCURRENCY_LEVELS = [1, 4, 8]
+# A metric this much worse than the baseline run is reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+# Filler the fake server streams back; deterministic so prompt sizes are the same on every run
+_FILLER = ("The label recommends taking the medication as directed and reviewing contraindications, "
+           "warnings and drug interactions with a healthcare provider before starting treatment. ").split()
+
+
+# OpenAI-compatible /v1/chat/completions on a local port. Every completion waits `latency`
+# seconds before its first token and then produces `tokens_per_second`; streamed requests
+# receive their tokens as SSE events at that rate.
+class FakeLLMServer:
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 50.0, completion_tokens: int = 60):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _completion(self, payload: Dict) -> Tuple[str, List[str], int]:
+        prompt = " ".join(message["content"] for message in payload["messages"])
+        count = min(self.completion_tokens, payload.get("max_tokens") or self.completion_tokens)
+        # Router escalations ask for a tool name in a few tokens
+        words = ["QA"] if count <= 8 else [_FILLER[i % len(_FILLER)] for i in range(count)]
+        return prompt, [word + " " for word in words], count_tokens(prompt)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                _, tokens, prompt_tokens = server._completion(payload)
+                time.sleep(server.latency)
+                if payload.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for token in tokens:
+                        time.sleep(1 / server.tokens_per_second)
+                        event = f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n".encode()
+                        self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                    done = b"data: [DONE]\n\n"
+                    self.wfile.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+                    return
+                time.sleep(len(tokens) / server.tokens_per_second)
+                body = {"choices": [{"message": {"content": "".join(tokens).strip()}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}}
+                self._send(json.dumps(body).encode(), "application/json")
+
+        return Handler
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> "FakeLLMServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Queries from the modules' sample lists (Alternative Search needs the web and is left out)
+def sample_queries() -> List[str]:
+    return QA_QUERIES + RECOMMEND_QUERIES + SUMMARY_QUERIES
+
+
+def percentiles(values_ms: List[float]) -> Dict[str, float]:
+    if not values_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    values = np.array(values_ms)
+    return {f"p{p}_ms": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Preprocessing, indexing (vectors + BM25) and the side indexes, timed on a fresh store
+def benchmark_build(json_dir: str, persist_directory: str, embeddings) -> Dict:
+    from vectorstore import create_vector_store, preprocess_json_files
+
+    timings = {}
+    start = time.perf_counter()
+    documents = preprocess_json_files(json_dir)
+    timings["preprocess_s"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    create_vector_store(documents, persist_directory, embeddings)
+    timings["index_s"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    save_attribute_index(persist_directory, build_attribute_index(json_dir))
+    DrugGraph.build(json_dir).save(persist_directory)
+    timings["side_indexes_s"] = round(time.perf_counter() - start, 3)
+    timings["chunks"] = len(documents)
+    return timings
+
+
+def benchmark_routing(queries: List[str], rounds: int = 20) -> Dict:
+    classifier = get_intent_classifier()
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            classifier.predict(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return dict(percentiles(latencies), queries=len(latencies))
+
+
+# Every query `rounds` times through the full async pipeline with at most `concurrency` in flight.
+# Per-stage latencies come from the request traces.
+def benchmark_load(queries: List[str], vector_store, llm: LMStudioLLM, concurrency: int, rounds: int,
+                   trace_path: str) -> Dict:
+    configure_tracing(trace_path)
+    requests = [query for _ in range(rounds) for query in queries]
+    latencies, tools, errors = [], {}, 0
+
+    async def run_all():
+        nonlocal errors
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(query: str):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                tool_name, response = await ahandle_query(query, vector_store, llm, log=lambda _: None)
+                latencies.append((time.perf_counter() - start) * 1000)
+                tools[tool_name] = tools.get(tool_name, 0) + 1
+                errors += response is None or "An error occurred" in response
+
+        await asyncio.gather(*(one(query) for query in requests))
+
+    start = time.perf_counter()
+    run_sync(run_all())
+    seconds = time.perf_counter() - start
+    configure_tracing(None)
+
+    stages = {name: {key: round(value, 2) for key, value in row.items()}
+              for name, row in stage_stats(load_spans(trace_path)).items()}
+    return dict(percentiles(latencies), requests=len(requests), seconds=round(seconds, 3),
+                throughput_qps=round(len(requests) / seconds, 3), errors=errors, tools=tools, stages=stages)
+
+
+def run_benchmark(json_dir: str, concurrency_levels: List[int], rounds: int, latency: float,
+                  tokens_per_second: float, completion_tokens: int, llm_concurrency: int) -> Dict:
+    from langchain_community.vectorstores import Chroma
+
+    queries = sample_queries()
+    result = {
+        "commit": current_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {"json_dir": json_dir, "queries": len(queries), "rounds": rounds, "latency": latency,
+                   "tokens_per_second": tokens_per_second, "completion_tokens": completion_tokens,
+                   "llm_concurrency": llm_concurrency, "embeddings": "hashing-256"},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        persist_directory = os.path.join(workdir, "chroma_db")
+        embeddings = HashingEmbeddings()
+        print("[INFO] Building a fresh index...")
+        result["build"] = benchmark_build(json_dir, persist_directory, embeddings)
+        result["routing"] = benchmark_routing(queries)
+        vector_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+
+        result["load"] = {}
+        with FakeLLMServer(latency, tokens_per_second, completion_tokens) as server:
+            llm = LMStudioLLM(endpoint=server.endpoint, max_concurrency=llm_concurrency)
+            for concurrency in concurrency_levels:
+                # Each level starts from an empty summary cache, as a freshly deployed app would
+                cache = SummaryCache(os.path.join(workdir, f"summary_cache_{concurrency}.db"))
+                previous = hierarchical_summarizer._caches.get(DEFAULT_SUMMARY_CACHE_PATH)
+                hierarchical_summarizer._caches[DEFAULT_SUMMARY_CACHE_PATH] = cache
+                try:
+                    print(f"[INFO] {len(queries) * rounds} requests at concurrency {concurrency}...")
+                    result["load"][str(concurrency)] = benchmark_load(
+                        queries, vector_store, llm, concurrency, rounds,
+                        os.path.join(workdir, f"traces_{concurrency}.jsonl"))
+                finally:
+                    if previous is None:
+                        del hierarchical_summarizer._caches[DEFAULT_SUMMARY_CACHE_PATH]
+                    else:
+                        hierarchical_summarizer._caches[DEFAULT_SUMMARY_CACHE_PATH] = previous
+            result["llm_requests"] = server.requests
+    return result
+
+
+def save_result(path: str, result: Dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def load_results(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# (name, value, higher is better) for the headline metrics of a run
+def headline_metrics(result: Dict) -> List[Tuple[str, float, bool]]:
+    metrics = [("build.preprocess_s", result["build"]["preprocess_s"], False),
+               ("build.index_s", result["build"]["index_s"], False),
+               ("routing.p95_ms", result["routing"]["p95_ms"], False)]
+    for level, row in result["load"].items():
+        metrics += [(f"load@{level}.throughput_qps", row["throughput_qps"], True),
+                    (f"load@{level}.p50_ms", row["p50_ms"], False),
+                    (f"load@{level}.p95_ms", row["p95_ms"], False)]
+    return metrics
+
+
+# Metric-by-metric change against a baseline run; returns the report and the regressed metrics
+def compare(result: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> Tuple[str, List[str]]:
+    before = {name: value for name, value, _ in headline_metrics(baseline)}
+    lines = [f"{'metric':<28}{baseline['commit']:>14}{result['commit']:>14}{'change':>10}"]
+    regressions = []
+    for name, value, higher_is_better in headline_metrics(result):
+        if name not in before:
+            continue
+        change = (value - before[name]) / before[name] if before[name] else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:<28}{before[name]:>14.2f}{value:>14.2f}{change:>+10.1%}{flag}")
+    if result["config"] != baseline["config"]:
+        lines.append("[WARNING] The runs used different settings; the comparison may not be meaningful.")
+    return "\n".join(lines), regressions
+
+
+def find_baseline(results: List[Dict], ref: Optional[str], commit: str) -> Optional[Dict]:
+    candidates = [result for result in results if result["commit"] != commit]
+    if ref:
+        candidates = [result for result in results if result["commit"].startswith(ref)]
+    return candidates[-1] if candidates else None
+
+
+def run_report(result: Dict) -> str:
+    lines = [f"[INFO] Build: {result['build']['chunks']} chunks, preprocess {result['build']['preprocess_s']}s, "
+             f"index {result['build']['index_s']}s, side indexes {result['build']['side_indexes_s']}s",
+             f"[INFO] Routing (local classifier): p50 {result['routing']['p50_ms']} ms, "
+             f"p95 {result['routing']['p95_ms']} ms"]
+    for level, row in result["load"].items():
+        lines.append(f"[INFO] Concurrency {level}: {row['throughput_qps']} req/s, p50 {row['p50_ms']} ms, "
+                     f"p95 {row['p95_ms']} ms, p99 {row['p99_ms']} ms, {row['errors']} errors, tools {row['tools']}")
+        for name, stage in sorted(row["stages"].items(), key=lambda item: -item[1]["p50"]):
+            lines.append(f"         {name:<20} p50 {stage['p50']:>9.1f} ms  p95 {stage['p95']:>9.1f} ms  "
+                         f"n={int(stage['count'])}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the full pipeline against a fake LLM server.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS)
+    parser.add_argument("--rounds", type=int, default=3, help="Times each sample query is sent per level")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LMStudioLLM.max_concurrency")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH)
+    parser.add_argument("--compare", nargs="?", const="", default=None,
+                        help="Compare with the last run of this commit (default: the last run of another commit)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.json_dir, args.concurrency, args.rounds, args.latency, args.tokens_per_second,
+                           args.completion_tokens, args.llm_concurrency)
+    print(run_report(result))
+    previous_runs = load_results(args.results)
+    save_result(args.results, result)
+    print(f"[INFO] Results appended to {args.results} (commit {result['commit']}).")
+
+    if args.compare is not None:
+        baseline = find_baseline(previous_runs, args.compare or None, result["commit"])
+        if baseline is None:
+            print("[WARNING] No earlier run to compare with.")
+        else:
+            report, regressions = compare(result, baseline)
+            print(report)
+            if regressions and args.fail_on_regression:
+                raise SystemExit(f"[ERROR] Regressions: {', '.join(regressions)}")
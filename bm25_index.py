@@ -0,0 +1,198 @@
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BM25_FILE = "bm25_index.npz"
+
+# Words that carry no weight in label search
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "should", "the", "to", "what", "when", "which", "who", "with",
+}
+
+# Names are stored joined by a separator that cannot occur in file or section names
+_SEPARATOR = "\x1f"
+
+
+# Lowercased tokens that keep dotted/hyphenated identifiers whole ("0093-7214-01", "2.5", "mg/kg"),
+# plus their parts, and split "500mg" into "500" and "mg" as well
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*", text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.findall(r"[a-z]+|[0-9]+", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+# Okapi BM25 over the indexed chunks, stored as a CSR inverted index in a single .npz file:
+# per-term offsets into flat postings (chunk positions) and term frequencies, plus chunk lengths,
+# chunk IDs and the file/section of every chunk for metadata filtering.
+class BM25Index:
+    def __init__(self, ids, terms, offsets, postings, frequencies, lengths, file_names, file_codes,
+                 section_names, section_codes, corpus_version="unversioned", k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.vocab = {term: position for position, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.file_names = file_names
+        self.file_codes = file_codes
+        self.section_names = section_names
+        self.section_codes = section_codes
+        self.corpus_version = corpus_version
+        self.k1 = k1
+        self.b = b
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((len(ids) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # The file and section names are indexed along with the text, so "CONTRAINDICATIONS" or a drug
+    # name matches chunks of that section or label even when the chunk text doesn't repeat it
+    @classmethod
+    def build(cls, ids: Sequence[str], documents, corpus_version: str = "unversioned") -> "BM25Index":
+        file_names = sorted({doc.metadata["file"] for doc in documents})
+        section_names = sorted({doc.metadata["section"] for doc in documents})
+        file_index = {name: code for code, name in enumerate(file_names)}
+        section_index = {name: code for code, name in enumerate(section_names)}
+
+        postings_by_term: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for position, doc in enumerate(documents):
+            tokens = tokenize(" ".join([doc.metadata["file"], doc.metadata["section"], doc.page_content]))
+            lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings_by_term.setdefault(term, []).append((position, count))
+
+        terms = sorted(postings_by_term)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings_by_term[term]) for term in terms])
+        flat = [entry for term in terms for entry in postings_by_term[term]]
+        postings = np.array([position for position, _ in flat], dtype=np.int32)
+        frequencies = np.array([count for _, count in flat], dtype=np.float32)
+
+        return cls(
+            ids=np.array(list(ids)),
+            terms=terms,
+            offsets=offsets,
+            postings=postings,
+            frequencies=frequencies,
+            lengths=lengths,
+            file_names=file_names,
+            file_codes=np.array([file_index[doc.metadata["file"]] for doc in documents], dtype=np.int32),
+            section_names=section_names,
+            section_codes=np.array([section_index[doc.metadata["section"]] for doc in documents], dtype=np.int32),
+            corpus_version=corpus_version,
+        )
+
+    # Written to a temporary file and renamed, so readers never see a half-written index
+    def save(self, persist_directory: str):
+        os.makedirs(persist_directory, exist_ok=True)
+        path = os.path.join(persist_directory, BM25_FILE)
+        tmp_path = path + ".tmp.npz"
+        terms = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            tmp_path,
+            ids=self.ids,
+            terms=np.array(_SEPARATOR.join(terms)),
+            offsets=self.offsets,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            lengths=self.lengths,
+            file_names=np.array(_SEPARATOR.join(self.file_names)),
+            file_codes=self.file_codes,
+            section_names=np.array(_SEPARATOR.join(self.section_names)),
+            section_codes=self.section_codes,
+            corpus_version=np.array(self.corpus_version),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "BM25Index":
+        with np.load(os.path.join(persist_directory, BM25_FILE), allow_pickle=False) as data:
+            def names(key):
+                joined = str(data[key])
+                return joined.split(_SEPARATOR) if joined else []
+
+            return cls(
+                ids=data["ids"],
+                terms=names("terms"),
+                offsets=data["offsets"],
+                postings=data["postings"],
+                frequencies=data["frequencies"],
+                lengths=data["lengths"],
+                file_names=names("file_names"),
+                file_codes=data["file_codes"],
+                section_names=names("section_names"),
+                section_codes=data["section_codes"],
+                corpus_version=str(data["corpus_version"]),
+            )
+
+    def _mask(self, codes: np.ndarray, names: List[str], wanted: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        if not wanted:
+            return None
+        lookup = {name: code for code, name in enumerate(names)}
+        return np.isin(codes, [lookup[name] for name in wanted if name in lookup])
+
+    # Top-k (chunk ID, score) pairs, optionally restricted to the given files and sections
+    def search(self, query: str, k: int, files: Sequence[str] = None,
+               sections: Sequence[str] = None) -> List[Tuple[str, float]]:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            position = self.vocab.get(term)
+            if position is None:
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.average_length)
+            scores[docs] += self.idf[position] * tf * (self.k1 + 1) / (tf + norm)
+
+        for mask in (self._mask(self.file_codes, self.file_names, files),
+                     self._mask(self.section_codes, self.section_names, sections)):
+            if mask is not None:
+                scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(str(self.ids[i]), float(scores[i])) for i in candidates]
+
+
+# Loaded indexes are reused until the file on disk changes
+_indexes: Dict[str, Tuple[float, Optional[BM25Index]]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(persist_directory: str) -> Optional[BM25Index]:
+    path = os.path.join(persist_directory, BM25_FILE)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _indexes_lock:
+        cached = _indexes.get(persist_directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, BM25Index.load(persist_directory))
+            _indexes[persist_directory] = cached
+        return cached[1]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], rrf_k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda key: -scores[key])
+
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from web_scrapper import (REQUEST_TIMEOUT, create_dataset_file, dataset_file_path, find_prescribing_info_url,
+                          process_prescribing_html)
+
+STATE_FILE = "crawl_state.json"
+USER_AGENT = "MediChat-label-crawler/1.0 (+https://www.microlabsusa.com)"
+
+# Statuses that are worth retrying after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# On-disk HTTP cache: one body file and one metadata file (URL, ETag, Last-Modified) per URL,
+# keyed by the SHA-256 of the URL. The validators are replayed as conditional request headers.
+class HttpCache:
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json"), os.path.join(self.cache_dir, key + ".html")
+
+    def get(self, url: str) -> Optional[Tuple[Dict, str]]:
+        meta_path, body_path = self._paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(body_path, "r", encoding="utf-8") as f:
+            return meta, f.read()
+
+    def conditional_headers(self, meta: Dict) -> Dict[str, str]:
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    # Body first, metadata last: a crash in between leaves no metadata, so the entry is refetched
+    def put(self, url: str, response: requests.Response):
+        meta_path, body_path = self._paths(url)
+        with open(body_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(response.text)
+        os.replace(body_path + ".tmp", body_path)
+        _write_json_atomic(meta_path, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+
+# Minimum spacing between requests to the same host, shared by all workers
+class HostRateLimiter:
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self.next_slot: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Concurrent, polite, resumable label crawler.
+# Products are crawled on a bounded worker pool; each worker fetches the product page, follows the
+# "Prescribing Information" link, then parses and writes that label before taking the next product,
+# so at most `max_workers` label pages are in memory. Requests go through a per-host rate limiter
+# and the HTTP cache; a 304 on a label whose dataset file exists skips parsing altogether.
+# Progress is checkpointed to `crawl_state.json` in the cache directory so `resume=True` carries on
+# after a crash.
+class Crawler:
+    def __init__(self, cache_dir: str, max_workers: int = 4, min_interval: float = 1.0,
+                 timeout: float = REQUEST_TIMEOUT, max_retries: int = 2, backoff_seconds: float = 1.0):
+        self.cache = HttpCache(cache_dir)
+        self.state_path = os.path.join(cache_dir, STATE_FILE)
+        self.rate_limiter = HostRateLimiter(min_interval)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0}
+
+    # requests.Session is not thread-safe, so each worker keeps its own connection pool
+    def _session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+            self.local.session.headers["User-Agent"] = USER_AGENT
+        return self.local.session
+
+    def _count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    # Page text and whether it came from the cache after a 304
+    def fetch(self, url: str) -> Tuple[str, bool]:
+        cached = self.cache.get(url)
+        headers = self.cache.conditional_headers(cached[0]) if cached else {}
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait(url)
+            self._count("requests")
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, retry_after = e, None
+            else:
+                if response.status_code == 304 and cached:
+                    self._count("not_modified")
+                    return cached[1], True
+                if response.status_code == 200:
+                    self.cache.put(url, response)
+                    return response.text, False
+                if response.status_code not in RETRY_STATUSES:
+                    raise Exception(f"[ERROR] Failed to fetch URL: {url} (Status Code: {response.status_code})")
+                error, retry_after = f"status {response.status_code}", response.headers.get("Retry-After")
+            if attempt == self.max_retries:
+                raise Exception(f"[ERROR] Failed to fetch URL: {url} after {attempt + 1} attempts: {error}")
+            self._count("retries")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else \
+                self.backoff_seconds * (2 ** attempt) + random.uniform(0, self.backoff_seconds)
+            print(f"[WARNING] Fetching {url} failed ({error}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    def crawl_product(self, name: str, product_url: str, output_dir: str) -> Dict:
+        result = {"product_url": product_url}
+        product_html, _ = self.fetch(product_url)
+        href = find_prescribing_info_url(product_html)
+        if not href:
+            print(f"[WARNING] No prescribing information found for {name}")
+            result["status"] = "missing"
+            return result
+
+        result["prescribing_info_url"] = href
+        label_html, not_modified = self.fetch(href)
+        output_path = dataset_file_path(output_dir, name)
+        if not_modified and os.path.exists(output_path):
+            print(f"[INFO] {name}: label not modified, keeping {output_path}")
+            result["status"] = "unchanged"
+            return result
+
+        parsed = process_prescribing_html(name, label_html)
+        if not parsed:
+            result["status"] = "error"
+            return result
+        # A label that could not be saved stays pending, so --resume tries it again
+        if not create_dataset_file(output_dir, parsed):
+            result["status"] = "error"
+            result["error"] = f"could not write {output_path}"
+            return result
+        result["status"] = "written"
+        return result
+
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def crawl(self, urls_map: Dict[str, str], output_dir: str, resume: bool = False) -> Dict:
+        start_time = time.time()
+        os.makedirs(output_dir, exist_ok=True)
+        state = self._load_state() if resume else {}
+        done = {name for name, entry in state.items() if entry.get("status") in ("written", "unchanged")}
+        pending = {name: url for name, url in urls_map.items() if name not in done}
+        if done:
+            print(f"[INFO] Resuming crawl: {len(done)} products already done, {len(pending)} to go.")
+        _write_json_atomic(self.state_path, state)
+
+        # Workers fetch and write labels; the state file is only written here, on the calling thread
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.crawl_product, name, url, output_dir): name
+                       for name, url in pending.items()}
+            for finished, future in enumerate(as_completed(futures), start=1):
+                name = futures[future]
+                try:
+                    state[name] = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Exception occurred while processing {name}: {e}")
+                    state[name] = {"product_url": pending[name], "status": "error", "error": str(e)}
+                state[name]["crawled_at"] = datetime.now(timezone.utc).isoformat()
+                _write_json_atomic(self.state_path, state)
+                print(f"[INFO] Crawled {name} ({finished}/{len(pending)}): {state[name]['status']}")
+
+        counts = {}
+        for name in urls_map:
+            status = state.get(name, {}).get("status", "error")
+            counts[status] = counts.get(status, 0) + 1
+        return {"products": {name: state.get(name) for name in urls_map}, "counts": counts,
+                "skipped": len(done), **self.stats, "seconds": round(time.time() - start_time, 2)}
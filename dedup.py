@@ -0,0 +1,187 @@
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Sections the scraper picks up from the DailyMed page chrome rather than the label itself
+BOILERPLATE_SECTIONS = {
+    "Safety",
+    "Related Resources",
+    "More Info For This Drug",
+    "More Info on this Drug",
+    "Find additional resources",
+    "View Package Photos",
+    "product_name",
+}
+
+# Section contents that are page furniture no matter which heading they sit under
+BOILERPLATE_PATTERNS = [
+    r"^If this SPL contains inactivated NDCs",
+    r"^\*Sections or subsections omitted from the full prescribing information",
+]
+
+# Contained sections shorter than this (whitespace-free chars) are left alone,
+# cutting tiny phrases out of a container only fragments it
+MIN_CONTAINED_CHARS = 80
+
+# A container whose leftover text is shorter than this is dropped entirely
+MIN_RESIDUAL_CHARS = 200
+
+
+# Boilerplate filtering
+def is_boilerplate(section: str, content: str, skip_sections=None, skip_patterns=None) -> bool:
+    skip_sections = BOILERPLATE_SECTIONS if skip_sections is None else skip_sections
+    skip_patterns = BOILERPLATE_PATTERNS if skip_patterns is None else skip_patterns
+    if section.strip() in skip_sections:
+        return True
+    text = content.strip()
+    return any(re.search(pattern, text) for pattern in skip_patterns)
+
+
+def filter_boilerplate(sections: Dict[str, str], skip_sections=None, skip_patterns=None) -> Tuple[Dict[str, str], List[str]]:
+    kept, dropped = {}, []
+    for section, content in sections.items():
+        if is_boilerplate(section, content, skip_sections, skip_patterns):
+            dropped.append(section)
+        else:
+            kept[section] = content
+    return kept, dropped
+
+
+# Whitespace-free view of a string plus the original index of every kept character.
+# The scraper joins sub-elements with "\n" in one place and with nothing in another,
+# so containment has to be tested ignoring whitespace entirely.
+def _squeeze(text: str) -> Tuple[str, List[int]]:
+    chars, positions = [], []
+    for idx, char in enumerate(text):
+        if not char.isspace():
+            chars.append(char)
+            positions.append(idx)
+    return "".join(chars), positions
+
+
+# Drop or collapse sections whose text is repeated inside other sections
+def collapse_contained_sections(sections: Dict[str, str], min_contained_chars=MIN_CONTAINED_CHARS,
+                                min_residual_chars=MIN_RESIDUAL_CHARS) -> Tuple[Dict[str, str], Dict[str, int]]:
+    stats = {"duplicate_sections": 0, "collapsed_sections": 0, "dropped_containers": 0, "chars_removed": 0}
+    squeezed = {section: _squeeze(content) for section, content in sections.items()}
+
+    # Exact duplicates (ignoring whitespace): keep the first heading only
+    unique, seen = [], set()
+    for section in sections:
+        text = squeezed[section][0]
+        if text in seen:
+            stats["duplicate_sections"] += 1
+            stats["chars_removed"] += len(sections[section])
+            continue
+        seen.add(text)
+        unique.append(section)
+
+    # Mark every span of a container that another section already carries
+    covered = {section: bytearray(len(squeezed[section][0])) for section in unique}
+    for inner in unique:
+        needle = squeezed[inner][0]
+        if len(needle) < min_contained_chars:
+            continue
+        for outer in unique:
+            haystack = squeezed[outer][0]
+            if outer == inner or len(haystack) <= len(needle):
+                continue
+            start = haystack.find(needle)
+            while start != -1:
+                covered[outer][start:start + len(needle)] = b"\x01" * len(needle)
+                start = haystack.find(needle, start + len(needle))
+
+    result = {}
+    for section in unique:
+        mask = covered[section]
+        if not any(mask):
+            result[section] = sections[section]
+            continue
+        residual = _residual_text(sections[section], squeezed[section][1], mask)
+        if len(_squeeze(residual)[0]) < min_residual_chars:
+            stats["dropped_containers"] += 1
+            stats["chars_removed"] += len(sections[section])
+            continue
+        stats["collapsed_sections"] += 1
+        stats["chars_removed"] += len(sections[section]) - len(residual)
+        result[section] = residual
+    return result, stats
+
+
+# Rebuild the uncovered parts of a section, one paragraph per surviving run
+def _residual_text(text: str, positions: List[int], mask: bytearray) -> str:
+    pieces, run_start = [], None
+    for idx, flag in enumerate(mask):
+        if not flag and run_start is None:
+            run_start = idx
+        elif flag and run_start is not None:
+            pieces.append(text[positions[run_start]:positions[idx - 1] + 1])
+            run_start = None
+    if run_start is not None:
+        pieces.append(text[positions[run_start]:positions[-1] + 1])
+    return "\n".join(piece.strip() for piece in pieces if piece.strip())
+
+
+# Full section-level pass for one label JSON
+def dedupe_sections(data: Dict[str, str], skip_sections=None, skip_patterns=None) -> Tuple[Dict[str, str], Dict[str, int]]:
+    sections = {k: v for k, v in data.items() if isinstance(v, str) and v.strip()}
+    sections, dropped = filter_boilerplate(sections, skip_sections, skip_patterns)
+    sections, stats = collapse_contained_sections(sections)
+    stats["boilerplate_sections"] = len(dropped)
+    return sections, stats
+
+
+# MinHash near-duplicate detection for chunks (32-bit universal hashing, vectorised with numpy)
+class MinHasher:
+    _PRIME = np.uint64((1 << 61) - 1)
+    _MAX_HASH = np.uint64((1 << 32) - 1)
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str):
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)], dtype=np.uint64)
+        permuted = ((np.outer(hashes, self._a) + self._b) % self._PRIME) & self._MAX_HASH
+        return tuple(permuted.min(axis=0).tolist())
+
+
+def estimated_jaccard(sig_a, sig_b) -> float:
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+# Return the indices of chunks to keep; later near-duplicates of an earlier chunk are dropped.
+# LSH banding keeps this roughly linear; `groups` limits comparisons to chunks in the same group.
+def near_duplicate_filter(texts: List[str], threshold=0.9, groups=None, num_perm=64, bands=16) -> List[int]:
+    hasher = MinHasher(num_perm=num_perm)
+    rows = num_perm // bands
+    buckets = {}
+    signatures = []
+    keep = []
+    for idx, text in enumerate(texts):
+        signature = hasher.signature(text)
+        signatures.append(signature)
+        group = groups[idx] if groups is not None else None
+        band_keys = [(group, band, signature[band * rows:(band + 1) * rows]) for band in range(bands)]
+
+        candidates = set()
+        for key in band_keys:
+            candidates.update(buckets.get(key, ()))
+        if any(estimated_jaccard(signature, signatures[other]) >= threshold for other in candidates):
+            continue
+
+        keep.append(idx)
+        for key in band_keys:
+            buckets.setdefault(key, []).append(idx)
+    return keep
@@ -0,0 +1,413 @@
+import os
+import re
+import json
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from attribute_index import RESIDUAL_SECTION, label_attributes
+from query_analysis import QueryAnalysis, QueryAnalyzer
+
+DRUG_GRAPH_FILE = "drug_graph.npz"
+
+# Drug classes as labels name them ("is a nonsteroidal anti-inflammatory drug indicated for ...")
+# and as interaction sections refer to them ("Concomitant use with NSAIDs ...")
+DRUG_CLASSES = {
+    "NSAID": r"non-?steroidal,? anti-? ?inflammatory|\bnsaids?\b",
+    "angiotensin II receptor blocker": r"angiotensin ii receptor (blocker|antagonist)|\barbs?\b",
+    "ACE inhibitor": r"\bace inhibitors?|angiotensin[- ]converting enzyme",
+    "calcium channel blocker": r"calcium channel blocker",
+    "beta blocker": r"beta[\s\-­]*(adrenergic )?(receptor )?block(er|ing)",
+    "diuretic": r"\bdiuretics?\b",
+    "penicillin": r"penicillin-class|\bpenicillins?\b",
+    "aminoglycoside": r"aminoglycoside",
+    "lincosamide": r"lincosamide|lincomycin",
+    "antiplatelet": r"antiplatelet",
+    "anticoagulant": r"anticoagulants?|warfarin",
+    "statin": r"hmg-coa reductase|\bstatins?\b",
+    "fibrate": r"\bppar\b|fibrates?\b",
+    "biguanide": r"biguanide",
+    "sulfonylurea": r"sulfonylurea",
+    "insulin": r"\binsulin\b",
+    "prostaglandin analog": r"prostaglandin[\s\-\w()]{0,16} analog",
+    "carbonic anhydrase inhibitor": r"carbonic anhydrase inhibit|inhibitor of (the enzyme )?carbonic anhydrase",
+    "H2 receptor antagonist": r"histamine-2|\bh2\)? receptor antagonist",
+    "antihistamine": r"\bh1[- ]receptor antagonist|antihistamine",
+    "benzodiazepine": r"benzodiazepines?",
+    "MAO inhibitor": r"monoamine oxidase|\bmao(-b)? inhibitors?|\bmaois?\b",
+    "tricyclic antidepressant": r"tricyclic",
+    "SSRI": r"selective serotonin reuptake|\bssris?\b",
+    "opioid": r"\bopioids?\b",
+    "corticosteroid": r"corticosteroid",
+    "anticholinergic": r"anticholinergic",
+    "PDE4 inhibitor": r"phosphodiesterase[- ]4|\bpde4\b",
+    "potassium channel blocker": r"potassium channel blocker",
+    "melatonin receptor agonist": r"melatonin receptor agonist",
+    "mast cell stabilizer": r"mast cell stabili",
+    "CYP3A inhibitor": r"(strong|moderate) cyp3a inhibitors?",
+}
+
+# Conditions the labels are indicated for, as they appear in their Indications sections
+CONDITIONS = {
+    "hypertension": r"(?<!ocular )hypertension\b(?! ?\()|lower blood pressure",
+    "glaucoma or ocular hypertension": r"glaucoma|intraocular pressure|ocular hypertension",
+    "type 2 diabetes": r"type 2 diabetes|glycemic control",
+    "osteoarthritis": r"osteoarthritis",
+    "rheumatoid arthritis": r"rheumatoid arthritis",
+    "pain": r"\bpain\b|dysmenorrhea",
+    "bacterial infections": r"\binfections?\b|antibacterial",
+    "urinary tract infections": r"urinary tract|bacteriuria",
+    "seizures": r"seizures?|epilep|lennox",
+    "Parkinson's disease": r"parkinson",
+    "obsessive-compulsive disorder": r"obsessive|compulsions",
+    "anxiety": r"anxiety",
+    "insomnia": r"insomnia|sleep onset",
+    "allergic rhinitis": r"allergic rhinitis",
+    "urticaria": r"urticaria",
+    "allergic conjunctivitis": r"allergic conjunctivitis|ocular itching",
+    "asthma": r"asthma|bronchospasm",
+    "COPD": r"\bcopd\b|chronic obstructive",
+    "angina": r"angina",
+    "stroke prevention": r"\bstrokes?\b",
+    "high cholesterol or triglycerides": r"cholesterol|\bldl-c\b|triglycerid|hyperlipid|dyslipid",
+    "ulcers and reflux": r"\bulcers?\b|\bgerd\b|gastroesophageal|esophagitis|hypersecretory",
+    "irritable bowel syndrome": r"irritable bowel",
+    "multiple sclerosis": r"multiple sclerosis",
+    "ocular inflammation": r"cataract surgery|ocular inflammation",
+    "inflammatory skin conditions": r"dermatos|psoria|scalp",
+    "cystic fibrosis": r"cystic fibrosis",
+    "mastocytosis": r"mastocytosis",
+    "altitude sickness": r"mountain sickness",
+}
+
+# Lay names of conditions in queries ("high blood pressure", "arthritis pain")
+QUERY_CONDITIONS = {
+    "hypertension": r"high blood pressure",
+    "osteoarthritis": r"\barthritis",
+    "rheumatoid arthritis": r"\barthritis",
+    "type 2 diabetes": r"\bdiabetes|blood sugar",
+    "high cholesterol or triglycerides": r"cholesterol",
+    "ulcers and reflux": r"heartburn|acid reflux",
+    "allergic rhinitis": r"hay fever|seasonal allergies",
+    "insomnia": r"trouble sleeping|can'?t sleep",
+}
+# Queries asking for other drugs, as opposed to questions about the named ones
+ALTERNATIVE_REQUEST = r"recommend|suggest|alternatives?|instead|substitut|switch|replace|other (options?|drugs?|" \
+                      r"medications?)|what (else )?(can|could|should) i (take|use)|reliever|best (drug|medication)"
+
+# Alternatives put forward per request, and chunks fetched per drug for the prompt
+MAX_ALTERNATIVES = 3
+CHUNKS_PER_DRUG = 2
+
+# Older labels only carry these headings inside the run-on label text
+_INDICATIONS_HEADING = re.compile(r"(?<!CONTRA)INDICATIONS(?: (?:AND|&) USAGE)?:? ?(?=[A-Z][a-z])")
+_INDICATIONS_END = re.compile(r"CONTRAINDICATIONS|DOSAGE AND ADMINISTRATION")
+_INDICATIONS_MAX_CHARS = 1500
+_INDICATION_STATEMENT = r"indicated|treatment of|management of|relief of|to reduce"
+_DESCRIPTION_TEXT = re.compile(r"DESCRIPTION:?(.{20,800})", re.DOTALL)
+_SEPARATOR = "\x1f"
+
+
+def _matches(patterns: Dict[str, str], text: str) -> List[str]:
+    lowered = text.lower()
+    return [name for name, pattern in patterns.items() if re.search(pattern, lowered)]
+
+
+def _residual(data: Dict) -> str:
+    return re.sub(r"\s+", " ", data.get(RESIDUAL_SECTION) or "")
+
+
+def _entries_text(attributes: Dict, section: str) -> str:
+    return " ".join(entry["text"] for entry in attributes.get(section, []))
+
+
+def indications_text(data: Dict, attributes: Dict) -> str:
+    text = _entries_text(attributes, "indications")
+    if text:
+        return text
+    residual = _residual(data)
+    texts = []
+    for heading in _INDICATIONS_HEADING.finditer(residual):
+        text = residual[heading.end():heading.end() + _INDICATIONS_MAX_CHARS]
+        end = _INDICATIONS_END.search(text)
+        texts.append(text[:end.start()] if end else text)
+    return " ".join(texts)
+
+
+# A label's own classes: named before "indicated" in the Indications ("X is a <class> indicated for"),
+# else in its Description
+def label_classes(data: Dict, indications: str) -> List[str]:
+    classes = _matches(DRUG_CLASSES, indications.split("indicated")[0]) if "indicated" in indications else []
+    if not classes:
+        found = _DESCRIPTION_TEXT.findall(_residual(data))
+        classes = _matches(DRUG_CLASSES, found[-1]) if found else []
+    return classes
+
+
+# Conditions a label treats: those named in its indication statements, not in the side notes around
+# them ("associated with improvement in ... abdominal pain")
+def label_conditions(indications: str) -> List[str]:
+    statements = [sentence for sentence in re.split(r"(?<=[.;])\s+", indications)
+                  if re.search(_INDICATION_STATEMENT, sentence, re.IGNORECASE)]
+    return _matches(CONDITIONS, " ".join(statements) or indications)
+
+
+# One product per drug: "Metformin Hydrochloride Extended-Release Tablets, USP(1)" and "Metformin
+# Hydrochloride Oral Solution" are the same drug
+def drug_name(label: str) -> str:
+    return label.split()[0].lower()
+
+
+def _csr(rows: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    # Deduplicated first, so the row offsets count the same columns that are stored
+    rows = [sorted(set(row)) for row in rows]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.array([column for row in rows for column in row], dtype=np.int32)
+    return indptr, indices
+
+
+def _transpose(indptr: np.ndarray, indices: np.ndarray, columns: int) -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    transposed = np.zeros(columns + 1, dtype=np.int32)
+    transposed[1:] = np.cumsum(np.bincount(indices, minlength=columns))
+    return transposed, rows[order]
+
+
+@dataclass
+class Alternative:
+    label: str
+    shared_conditions: List[str] = field(default_factory=list)
+    classes: List[str] = field(default_factory=list)
+    interacts_with: List[str] = field(default_factory=list)
+
+
+# Labels, drug classes and conditions with three relations stored as CSR adjacency arrays over the
+# labels: label -> its classes, label -> the conditions it treats, and label -> labels it interacts
+# with (either label's interaction or contraindication text names the other drug or its class).
+# The reverse adjacency (class -> labels, condition -> labels) is derived on load.
+class DrugGraph:
+    def __init__(self, labels: List[str], classes: List[str], conditions: List[str], class_indptr, class_indices,
+                 condition_indptr, condition_indices, interaction_indptr, interaction_indices):
+        self.labels = labels
+        self.classes = classes
+        self.conditions = conditions
+        self.label_ids = {label: position for position, label in enumerate(labels)}
+        self.class_indptr, self.class_indices = class_indptr, class_indices
+        self.condition_indptr, self.condition_indices = condition_indptr, condition_indices
+        self.interaction_indptr, self.interaction_indices = interaction_indptr, interaction_indices
+        self.class_labels = _transpose(class_indptr, class_indices, len(classes))
+        self.condition_labels = _transpose(condition_indptr, condition_indices, len(conditions))
+
+    @staticmethod
+    def _row(indptr: np.ndarray, indices: np.ndarray, row: int) -> np.ndarray:
+        return indices[indptr[row]:indptr[row + 1]]
+
+    @classmethod
+    def build(cls, json_dir: str) -> "DrugGraph":
+        labels, texts = [], []
+        for file_name in sorted(os.listdir(json_dir)):
+            if file_name.endswith(".json"):
+                with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                attributes = label_attributes(data)
+                indications = indications_text(data, attributes)
+                labels.append(file_name.split(".json")[0])
+                texts.append((label_classes(data, indications), label_conditions(indications),
+                              _entries_text(attributes, "interactions") + " " +
+                              _entries_text(attributes, "contraindications")))
+
+        classes = sorted(DRUG_CLASSES)
+        conditions = sorted(CONDITIONS)
+        class_rows = [[classes.index(name) for name in own] for own, _, _ in texts]
+        condition_rows = [[conditions.index(name) for name in treats] for _, treats, _ in texts]
+
+        # Drug names are the identifying words of the label file names, as in query analysis
+        files_by_term = QueryAnalyzer(labels, []).files_by_term
+        label_ids = {label: position for position, label in enumerate(labels)}
+        interactions: List[Set[int]] = [set() for _ in labels]
+        for position, (_, _, text) in enumerate(texts):
+            lowered = text.lower()
+            mentioned = {label_ids[file] for term, files in files_by_term.items()
+                         if re.search(rf"\b{re.escape(term)}", lowered) for file in files}
+            mentioned_classes = set(_matches(DRUG_CLASSES, text))
+            mentioned |= {other for other, (own, _, _) in enumerate(texts) if mentioned_classes & set(own)}
+            # A label naming its own drug or class isn't an interaction, nor are its other forms
+            own_name = drug_name(labels[position])
+            for other in {other for other in mentioned if drug_name(labels[other]) != own_name}:
+                interactions[position].add(other)
+                interactions[other].add(position)
+
+        return cls(labels, classes, conditions, *_csr(class_rows), *_csr(condition_rows),
+                   *_csr(interactions))
+
+    def save(self, persist_directory: str):
+        os.makedirs(persist_directory, exist_ok=True)
+        path = os.path.join(persist_directory, DRUG_GRAPH_FILE)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            labels=np.array(_SEPARATOR.join(self.labels)),
+            classes=np.array(_SEPARATOR.join(self.classes)),
+            conditions=np.array(_SEPARATOR.join(self.conditions)),
+            class_indptr=self.class_indptr, class_indices=self.class_indices,
+            condition_indptr=self.condition_indptr, condition_indices=self.condition_indices,
+            interaction_indptr=self.interaction_indptr, interaction_indices=self.interaction_indices,
+        )
+        os.replace(tmp_path, path)
+        print(f"[INFO] Drug graph: {len(self.labels)} labels, {len(self.class_indices)} class, "
+              f"{len(self.condition_indices)} indication and {len(self.interaction_indices) // 2} interaction edges.")
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "DrugGraph":
+        with np.load(os.path.join(persist_directory, DRUG_GRAPH_FILE), allow_pickle=False) as data:
+            def names(key):
+                joined = str(data[key])
+                return joined.split(_SEPARATOR) if joined else []
+
+            return cls(names("labels"), names("classes"), names("conditions"),
+                       data["class_indptr"], data["class_indices"], data["condition_indptr"],
+                       data["condition_indices"], data["interaction_indptr"], data["interaction_indices"])
+
+    def classes_of(self, label: str) -> List[str]:
+        row = self.label_ids.get(label)
+        return [] if row is None else [self.classes[i] for i in self._row(self.class_indptr, self.class_indices, row)]
+
+    def conditions_of(self, label: str) -> List[str]:
+        row = self.label_ids.get(label)
+        return [] if row is None else \
+            [self.conditions[i] for i in self._row(self.condition_indptr, self.condition_indices, row)]
+
+    def interactions_of(self, label: str) -> List[str]:
+        row = self.label_ids.get(label)
+        return [] if row is None else \
+            [self.labels[i] for i in self._row(self.interaction_indptr, self.interaction_indices, row)]
+
+    # Candidate alternatives: labels treating the asked-about conditions (the query's, or else the
+    # target drugs'), ranked by conditions shared and then by sharing no class with the targets.
+    # Labels of a class the query names ("alternatives to NSAIDs") are left out, and interactions
+    # with the target drugs are reported with each candidate.
+    def alternatives(self, targets: Sequence[str], conditions: Sequence[str] = (), avoid_classes: Sequence[str] = (),
+                     limit: int = MAX_ALTERNATIVES) -> List[Alternative]:
+        wanted = [self.conditions.index(name) for name in conditions if name in self.conditions] or \
+                 [self.conditions.index(name) for target in targets for name in self.conditions_of(target)]
+        if not wanted:
+            return []
+        shared = np.zeros(len(self.labels), dtype=np.int32)
+        for condition in set(wanted):
+            shared[self._row(*self.condition_labels, condition)] += 1
+        excluded = {self.label_ids[target] for target in targets if target in self.label_ids}
+        for name in avoid_classes:
+            if name in self.classes:
+                excluded.update(self._row(*self.class_labels, self.classes.index(name)).tolist())
+        # Other strengths and forms of the target drug aren't alternatives to it
+        target_names = {drug_name(label) for label in targets}
+        excluded.update(row for row, label in enumerate(self.labels) if drug_name(label) in target_names)
+
+        target_classes = {name for target in targets for name in self.classes_of(target)}
+        candidates = [row for row in np.flatnonzero(shared) if row not in excluded]
+        candidates.sort(key=lambda row: (-shared[row], bool(target_classes & set(self.classes_of(self.labels[row]))),
+                                         self.labels[row]))
+        alternatives, seen_names = [], set()
+        for row in candidates:
+            label = self.labels[row]
+            name = drug_name(label)
+            if name in seen_names:
+                continue  # One form per drug
+            seen_names.add(name)
+            alternatives.append(Alternative(
+                label=label,
+                shared_conditions=[name for name in self.conditions_of(label)
+                                   if self.conditions.index(name) in set(wanted)],
+                classes=self.classes_of(label),
+                interacts_with=[target for target in targets if target in self.interactions_of(label)],
+            ))
+            if len(alternatives) == limit:
+                break
+        return alternatives
+
+
+# Loaded graphs are reused until the file on disk changes
+_graphs: Dict[str, Tuple[float, Optional[DrugGraph]]] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_drug_graph(persist_directory: str) -> Optional[DrugGraph]:
+    path = os.path.join(persist_directory, DRUG_GRAPH_FILE)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _graphs_lock:
+        cached = _graphs.get(persist_directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, DrugGraph.load(persist_directory))
+            _graphs[persist_directory] = cached
+        return cached[1]
+
+
+# Conditions and classes a recommendation query names ("a pain reliever", "alternatives to NSAIDs")
+def query_conditions(query: str) -> List[str]:
+    lay_names = [name for name, pattern in QUERY_CONDITIONS.items() if re.search(pattern, query.lower())]
+    return sorted(set(_matches(CONDITIONS, query) + lay_names))
+
+
+def query_classes(query: str) -> List[str]:
+    return _matches(DRUG_CLASSES, query)
+
+
+def _one_per_drug(labels: Sequence[str]) -> List[str]:
+    seen, kept = set(), []
+    for label in labels:
+        if drug_name(label) not in seen:
+            seen.add(drug_name(label))
+            kept.append(label)
+    return kept
+
+
+# Graph facts for the recommendation prompt
+def describe(graph: DrugGraph, targets: Sequence[str], alternatives: Sequence[Alternative]) -> str:
+    lines = []
+    for target in _one_per_drug(targets):
+        classes = ", ".join(graph.classes_of(target)) or "unclassified"
+        treats = ", ".join(graph.conditions_of(target)) or "not indexed"
+        lines.append(f"- {target} ({classes}) is indicated for: {treats}.")
+        interacting = _one_per_drug(graph.interactions_of(target))
+        if interacting:
+            lines.append(f"  Its label or theirs warns about combining it with: {', '.join(interacting)}.")
+    for alternative in alternatives:
+        line = f"- Candidate alternative: {alternative.label} ({', '.join(alternative.classes) or 'unclassified'}), " \
+               f"also indicated for {', '.join(alternative.shared_conditions)}."
+        if alternative.interacts_with:
+            line += f" Interacts with {', '.join(_one_per_drug(alternative.interacts_with))}."
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# The labels a recommendation query is about and, when it asks for other drugs, the alternatives
+def plan_recommendation(graph: Optional[DrugGraph], query: str,
+                        analysis: Optional[QueryAnalysis]) -> Tuple[List[str], List[Alternative]]:
+    if graph is None:
+        return [], []
+    targets = [file for file in (analysis.files if analysis else []) if file in graph.label_ids]
+    if not re.search(ALTERNATIVE_REQUEST, query.lower()):
+        return targets, []
+    return targets, graph.alternatives(targets, query_conditions(query), query_classes(query))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the drug class / indication / interaction graph.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--show", action="store_true", help="Print every label's classes, conditions and interactions")
+    args = parser.parse_args()
+
+    graph = DrugGraph.build(args.json_dir)
+    graph.save(args.persist_directory)
+    if args.show:
+        for label in graph.labels:
+            print(f"[INFO] {label}: classes={graph.classes_of(label)} treats={graph.conditions_of(label)} "
+                  f"interacts={len(graph.interactions_of(label))}")
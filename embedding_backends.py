@@ -0,0 +1,153 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ["openai", "hashing", "local"]
+# all-MiniLM-L6-v2 (384 dimensions), 8-bit quantized ONNX export from the model's own repository
+LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LOCAL_MODEL_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+# Deterministic, offline embedder: feature-hashes word unigrams and bigrams into a fixed-size,
+# L2-normalised vector. Useful for tests and benchmarks where OpenAI is unavailable.
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def _features(self, text: str):
+        words = re.findall(r"\w+", text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+# Local CPU sentence embeddings: an ONNX export of a sentence-transformers model run with onnxruntime,
+# so embedding a query needs no network round-trip. Texts are sorted by length and embedded in
+# batches, padded only to the longest text of their batch, then mean-pooled over the attention mask
+# and L2-normalised in NumPy. The model and tokenizer come from model_dir, or the Hugging Face cache
+# (downloaded on first use).
+class LocalEmbeddings(Embeddings):
+    def __init__(self, model_name: str = LOCAL_MODEL, model_file: str = LOCAL_MODEL_FILE, model_dir: str = None,
+                 batch_size: int = 32, max_length: int = 256, threads: int = None):
+        self.model_name = model_name
+        self.model_file = model_file
+        self.model_dir = model_dir
+        self.model = f"{model_name}/{model_file}"
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names = set()
+        self._lock = threading.Lock()
+
+    def _path(self, file_name: str) -> str:
+        if self.model_dir:
+            return os.path.join(self.model_dir, file_name)
+        from huggingface_hub import hf_hub_download
+        return hf_hub_download(self.model_name, file_name)
+
+    # The session is loaded once, on first use, and shared by all threads
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime
+                from tokenizers import Tokenizer
+            except ImportError as e:
+                raise Exception(f"[ERROR] The local embedding backend needs onnxruntime and tokenizers: {e}")
+            tokenizer = Tokenizer.from_file(self._path("tokenizer.json"))
+            tokenizer.enable_truncation(self.max_length)
+            tokenizer.enable_padding(pad_id=tokenizer.token_to_id("[PAD]") or 0)
+            options = onnxruntime.SessionOptions()
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            session = onnxruntime.InferenceSession(self._path(self.model_file), options,
+                                                   providers=["CPUExecutionProvider"])
+            self._input_names = {model_input.name for model_input in session.get_inputs()}
+            self._tokenizer, self._session = tokenizer, session
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self._session.run(None, feeds)[0]  # (batch, tokens, dimensions)
+        weights = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self._load()
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors = None
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embedded = self._embed_batch([texts[i] for i in batch])
+            if vectors is None:
+                vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# Embedding backend registry.
+# cache_path wraps the backend in the shared on-disk embedding cache, so the index builder and
+# the retrievers never embed the same text twice.
+def get_embeddings(backend: str = "openai", cache_path: str = None, **kwargs) -> Embeddings:
+    if backend == "openai":
+        from langchain_openai.embeddings import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(**kwargs)
+    elif backend == "hashing":
+        embeddings = HashingEmbeddings(**kwargs)
+    elif backend == "local":
+        embeddings = LocalEmbeddings(**kwargs)
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if cache_path:
+        from embedding_cache import CachedEmbeddings
+        return CachedEmbeddings(embeddings, cache_path=cache_path)
+    return embeddings
+
+
+# What a store is embedded with, as recorded in its manifest: the backend, the model, and the
+# options that recreate it through get_embeddings
+def describe_embeddings(embeddings: Embeddings) -> Dict:
+    from embedding_cache import CachedEmbeddings
+
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    if isinstance(embeddings, HashingEmbeddings):
+        return {"backend": "hashing", "model": embeddings.model, "options": {"dimensions": embeddings.dimensions}}
+    if isinstance(embeddings, LocalEmbeddings):
+        return {"backend": "local", "model": embeddings.model,
+                "options": {"model_name": embeddings.model_name, "model_file": embeddings.model_file}}
+    model = getattr(embeddings, "model", None) or type(embeddings).__name__
+    if type(embeddings).__name__ == "OpenAIEmbeddings":
+        return {"backend": "openai", "model": model, "options": {"model": model}}
+    return {"backend": type(embeddings).__name__, "model": model, "options": {}}
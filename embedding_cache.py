@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = "./embedding_cache.db"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+LOOKUP_BATCH_SIZE = 500
+
+
+# Disk-backed embedding cache keyed by (model, sha256(text)).
+# Wraps any LangChain Embeddings; vectors are stored as float32 blobs in SQLite and evicted
+# least-recently-used first once the stored vectors exceed `max_bytes`.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache_path: str = DEFAULT_CACHE_PATH,
+                 max_bytes: int = DEFAULT_MAX_BYTES, model: str = None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        return found
+
+    # Store vectors and return them as float32-rounded lists, so a miss returns exactly what a later hit will
+    def _store(self, items: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        now = time.time()
+        rows, rounded = [], {}
+        for text_hash, vector in items.items():
+            packed = array("f", vector)
+            blob = packed.tobytes()
+            rounded[text_hash] = packed.tolist()
+            rows.append((self.model, text_hash, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            # Recounted rather than incremented: INSERT OR REPLACE may overwrite rows another thread or
+            # process (the app and refresh.py share the file) stored for the same text
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+        return rounded
+
+    # Drop least-recently-used vectors until the cache is back under 90% of its budget
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT model, text_hash, size FROM embeddings ORDER BY last_access ASC"
+        ).fetchall()
+        victims = []
+        for model, text_hash, size in rows:
+            if self._total_bytes <= target:
+                break
+            victims.append((model, text_hash))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", victims)
+        self.evictions += len(victims)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(hashes)))
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(self._store(dict(zip(missing.keys(), vectors))))
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        text_hash = self._hash(text)
+        found = self._lookup([text_hash])
+        if text_hash in found:
+            with self._lock:
+                self.hits += 1
+            return found[text_hash]
+        vector = self._store({text_hash: self.embeddings.embed_query(text)})[text_hash]
+        with self._lock:
+            self.misses += 1
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+        }
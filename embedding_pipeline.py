@@ -0,0 +1,75 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, List, Optional
+
+
+# Batched, concurrent embedding with retry/backoff.
+# Batches are embedded on a bounded worker pool; each finished batch is handed to `on_batch`
+# on the calling thread (so vector store writes stay single-threaded), which is also where
+# the caller checkpoints progress. IDs in `skip_ids` were finished by an earlier run.
+class EmbeddingPipeline:
+    def __init__(self, embeddings, batch_size: int = 64, max_workers: int = 4,
+                 max_retries: int = 5, backoff_seconds: float = 1.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+    def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"[ERROR] Embedding batch failed after {attempt + 1} attempts: {e}")
+                with self._retries_lock:  # Batches retry on several worker threads
+                    self.retries += 1
+                delay = self.backoff_seconds * (2 ** attempt) + random.uniform(0, self.backoff_seconds)
+                print(f"[WARNING] Embedding batch failed ({e}). Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def run(self, ids: List[str], texts: List[str],
+            on_batch: Callable[[List[str], List[List[float]]], None],
+            skip_ids: Optional[Iterable[str]] = None) -> dict:
+        start_time = time.time()
+        self.retries = 0
+        skip = set(skip_ids or ())
+        pending = [i for i, chunk_id in enumerate(ids) if chunk_id not in skip]
+        batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        report = {"embedded": 0, "skipped": len(ids) - len(pending), "batches": len(batches), "retries": 0}
+
+        # Keep at most 2x max_workers batches in flight so memory stays bounded on big corpora
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {}
+            next_batch = 0
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and len(in_flight) < 2 * self.max_workers:
+                    batch = batches[next_batch]
+                    future = executor.submit(self._embed_with_retry, [texts[i] for i in batch])
+                    in_flight[future] = batch
+                    next_batch += 1
+
+                # Checkpoint every batch that succeeded before surfacing a failure
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                error = None
+                for future in done:
+                    batch = in_flight.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    on_batch([ids[i] for i in batch], future.result())
+                    report["embedded"] += len(batch)
+                    print(f"[INFO] Embedded {report['embedded']}/{len(pending)} chunks")
+                if error is not None:
+                    for other in in_flight:
+                        other.cancel()
+                    raise error
+
+        report["retries"] = self.retries
+        report["seconds"] = round(time.time() - start_time, 2)
+        return report
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from langchain.llms.base import LLM
+
+from embedding_backends import EMBEDDING_BACKENDS
+from hierarchical_summarizer import (DEFAULT_SUMMARY_CACHE_PATH, SummaryCache, asummarize_label,
+                                     get_summary_cache)
+from query_analysis import QueryAnalysis
+from vectorstore import MANIFEST_FILE, corpus_version_of, load_manifest
+
+# Fact sheets live next to the index manifest; bump the format when the sheet layout changes
+FACT_SHEETS_FILE = "fact_sheets.json"
+FACT_SHEET_FORMAT = 1
+
+# Fact sheet fields and the canonical label sections (label_sections.CANONICAL_SECTIONS) behind each
+FACT_SHEET_FIELDS = {
+    "indications": ["indications"],
+    "dosage": ["dosage", "dosage_forms"],
+    "contraindications": ["contraindications"],
+    "warnings": ["boxed_warning", "warnings"],
+    "adverse_reactions": ["adverse_reactions"],
+    "interactions": ["interactions"],
+}
+FIELD_TITLES = {
+    "indications": "Indications", "dosage": "Dosage", "contraindications": "Contraindications",
+    "warnings": "Warnings", "adverse_reactions": "Adverse reactions", "interactions": "Interactions",
+}
+
+# Labels summarized at once during a build; each label's sections are already mapped in parallel
+LABEL_CONCURRENCY = 2
+
+
+# Version of every label in the index: a hash of its chunk IDs, which change with its content
+def label_versions(persist_directory: str) -> Dict[str, str]:
+    chunk_ids: Dict[str, List[str]] = {}
+    for chunk_id, meta in load_manifest(persist_directory).items():
+        chunk_ids.setdefault(meta["file"], []).append(chunk_id)
+    return {file: corpus_version_of(ids) for file, ids in chunk_ids.items()}
+
+
+def load_fact_sheets(persist_directory: str) -> Dict:
+    path = os.path.join(persist_directory, FACT_SHEETS_FILE)
+    if not os.path.exists(path):
+        return {"format": FACT_SHEET_FORMAT, "sheets": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        store = json.load(f)
+    if store.get("format") != FACT_SHEET_FORMAT:
+        return {"format": FACT_SHEET_FORMAT, "sheets": {}}
+    return store
+
+
+def save_fact_sheets(persist_directory: str, store: Dict):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, FACT_SHEETS_FILE)
+    store["updated_at"] = datetime.now(timezone.utc).isoformat()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(store, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+# Fact sheet of one label from its hierarchical summary: the map summaries of each field's sections
+# and the reduced whole-label summary
+async def abuild_fact_sheet(vector_store, file: str, llm: LLM, cache: Optional[SummaryCache] = None) -> Optional[Dict]:
+    result = await asummarize_label(f"Summarize the details of {file}.", vector_store, [file], llm, cache)
+    if not result.sections:
+        return None
+    facts = {name: "\n".join(summary for section, summary in result.section_summaries if section in sections)
+             for name, sections in FACT_SHEET_FIELDS.items()}
+    return {"summary": result.summary, "facts": facts, "generated_at": datetime.now(timezone.utc).isoformat(),
+            "llm_calls": result.llm_calls, "cached_calls": result.cached_calls}
+
+
+# Offline batch job: a fact sheet for every label in the index whose sheet is missing or was built
+# from an older version of the label. The store is saved after every label, so an interrupted build
+# keeps its finished sheets; sheets of labels no longer indexed are dropped.
+async def abuild_fact_sheets(vector_store, persist_directory: str, llm: LLM, cache: Optional[SummaryCache] = None,
+                             force: bool = False, label_concurrency: int = LABEL_CONCURRENCY) -> Dict:
+    start_time = time.time()
+    versions = label_versions(persist_directory)
+    store = load_fact_sheets(persist_directory)
+    store["model"] = getattr(llm, "model", None) or type(llm).__name__
+    sheets = store["sheets"]
+    for file in set(sheets) - set(versions):
+        del sheets[file]
+    stale = [file for file in sorted(versions)
+             if force or sheets.get(file, {}).get("version") != versions[file]]
+    report = {"labels": len(versions), "built": 0, "up_to_date": len(versions) - len(stale), "failed": 0,
+              "llm_calls": 0}
+    semaphore = asyncio.Semaphore(label_concurrency)
+
+    async def build(file: str):
+        async with semaphore:
+            try:
+                sheet = await abuild_fact_sheet(vector_store, file, llm, cache)
+            except Exception as e:
+                print(f"[ERROR] Fact sheet for {file} failed: {e}")
+                report["failed"] += 1
+                return
+        if sheet is None:
+            print(f"[WARNING] No chunks stored for {file}; no fact sheet written.")
+            report["failed"] += 1
+            return
+        sheets[file] = dict(sheet, version=versions[file])
+        report["built"] += 1
+        report["llm_calls"] += sheet["llm_calls"]
+        save_fact_sheets(persist_directory, store)
+        print(f"[INFO] Fact sheet for {file}: {sheet['llm_calls']} LLM calls, {sheet['cached_calls']} cached "
+              f"({report['built'] + report['failed']}/{len(stale)})")
+
+    await asyncio.gather(*(build(file) for file in stale))
+    save_fact_sheets(persist_directory, store)
+    report["seconds"] = round(time.time() - start_time, 2)
+    return report
+
+
+# Read side, reloaded only when the fact sheet file or the index manifest changes
+class FactSheetStore:
+    def __init__(self, persist_directory: str):
+        self.sheets = load_fact_sheets(persist_directory)["sheets"]
+        self.versions = label_versions(persist_directory)
+
+    # Sheet of the label, unless the label changed since the sheet was built
+    def get(self, file: str) -> Optional[Dict]:
+        sheet = self.sheets.get(file)
+        if sheet is None or sheet.get("version") != self.versions.get(file):
+            return None
+        return sheet
+
+
+_stores: Dict[str, Tuple[Tuple[float, float], FactSheetStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def _mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+def get_fact_sheet_store(persist_directory: str) -> FactSheetStore:
+    mtimes = (_mtime(os.path.join(persist_directory, FACT_SHEETS_FILE)),
+              _mtime(os.path.join(persist_directory, MANIFEST_FILE)))
+    with _stores_lock:
+        cached = _stores.get(persist_directory)
+        if cached is None or cached[0] != mtimes:
+            cached = (mtimes, FactSheetStore(persist_directory))
+            _stores[persist_directory] = cached
+        return cached[1]
+
+
+# A whole-drug summary request for exactly one known label is answered from its fact sheet
+def lookup_fact_sheet(persist_directory: str, analysis: Optional[QueryAnalysis]) -> Optional[Tuple[str, Dict]]:
+    if not analysis or len(analysis.files) != 1 or analysis.intents:
+        return None
+    sheet = get_fact_sheet_store(persist_directory).get(analysis.files[0])
+    return (analysis.files[0], sheet) if sheet else None
+
+
+def render_fact_sheet(file: str, sheet: Dict) -> str:
+    lines = [f"**{file}**", "", sheet["summary"]]
+    for name, text in sheet["facts"].items():
+        if text:
+            lines += ["", f"**{FIELD_TITLES.get(name, name)}:**", text]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute a fact sheet for every indexed drug label.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--endpoint", default="http://127.0.0.1:1234")
+    parser.add_argument("--embedding-backend", default=None, choices=EMBEDDING_BACKENDS,
+                        help="Defaults to the backend the store was built with")
+    parser.add_argument("--summary-cache", default=DEFAULT_SUMMARY_CACHE_PATH)
+    parser.add_argument("--no-summary-cache", action="store_true")
+    parser.add_argument("--labels", type=int, default=LABEL_CONCURRENCY, help="Labels summarized concurrently")
+    parser.add_argument("--force", action="store_true", help="Rebuild every sheet, not only missing or stale ones")
+    args = parser.parse_args()
+
+    from async_pipeline import run_sync
+    from embedding_backends import get_embeddings
+    from llm_client import LMStudioLLM
+    from vectorstore import open_vector_store
+
+    vector_store = open_vector_store(args.persist_directory,
+                                     get_embeddings(args.embedding_backend) if args.embedding_backend else None)
+    cache = None if args.no_summary_cache else get_summary_cache(args.summary_cache)
+    report = run_sync(abuild_fact_sheets(vector_store, args.persist_directory, LMStudioLLM(endpoint=args.endpoint),
+                                         cache, force=args.force, label_concurrency=args.labels))
+    print(f"[INFO] Fact sheets: {report}")
@@ -0,0 +1,289 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from langchain.llms.base import LLM
+from langchain.schema import Document
+
+from embedding_backends import EMBEDDING_BACKENDS
+from label_chunker import count_tokens
+from label_sections import CANONICAL_SECTIONS
+from query_analysis import QueryAnalysis
+from reranker import section_of
+
+DEFAULT_SUMMARY_CACHE_PATH = "./summary_cache.db"
+
+# Label text per map call, the length of each map summary, and the summaries one reduce call may take
+MAP_INPUT_TOKENS = 1200
+MAP_MAX_TOKENS = 150
+REDUCE_INPUT_TOKENS = 2500
+# Map calls in flight at once (LMStudioLLM.max_concurrency gates the endpoint as well)
+MAX_CONCURRENT_CALLS = 4
+# Queries matching more labels than this are left to the retrieval summarizer
+MAX_LABELS = 3
+
+# Sections that add length but nothing to a summary
+SKIPPED_SECTIONS = {"references", "nonclinical_toxicology"}
+_SKIPPED_HEADINGS = re.compile(r"principal display panel|package label|recent major changes", re.IGNORECASE)
+# Sections in PLR order, the boxed warning first and unplaced headings (Highlights) before it
+_SECTION_ORDER = {name: number or 0 for name, number, _ in CANONICAL_SECTIONS}
+
+MAP_PROMPT = """You are an expert medical summarizer. Summarize the "{section}" section of the {label} label below in at most five short bullet points. Keep drug names, doses, populations and risks exactly as written.
+
+Section:
+{content}
+
+Summary:"""
+
+COMBINE_PROMPT = """You are an expert medical summarizer. Merge the following section summaries of the {label} label into one shorter summary, keeping every dose, contraindication and serious risk.
+
+Section summaries:
+{summaries}
+
+Summary:"""
+
+REDUCE_PROMPT = """You are an expert medical summarizer. Using the section summaries below, write a concise and informative summary relevant to the query "{query}".
+
+Section summaries:
+{summaries}
+
+Summary:"""
+
+
+# Disk-backed cache of LLM summaries keyed by (model, sha256(prompt)). The prompt holds the label
+# name, the section and its content, so a label update or a prompt change is a miss by construction.
+class SummaryCache:
+    def __init__(self, cache_path: str = DEFAULT_SUMMARY_CACHE_PATH):
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (model, prompt_hash)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _hash(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE model = ? AND prompt_hash = ?",
+                                     (model, self._hash(prompt))).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, prompt: str, summary: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO summaries (model, prompt_hash, summary, created) "
+                               "VALUES (?, ?, ?, ?)", (model, self._hash(prompt), summary, time.time()))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+_caches: Dict[str, SummaryCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_summary_cache(cache_path: str = DEFAULT_SUMMARY_CACHE_PATH) -> SummaryCache:
+    with _caches_lock:
+        if cache_path not in _caches:
+            _caches[cache_path] = SummaryCache(cache_path)
+        return _caches[cache_path]
+
+
+@dataclass
+class HierarchicalSummary:
+    summary: str = ""
+    labels: int = 0
+    sections: int = 0
+    chunks: int = 0
+    label_tokens: int = 0
+    llm_calls: int = 0
+    cached_calls: int = 0
+    reduce_levels: int = 0
+    seconds: float = 0.0
+    # (canonical section, map summary) per label section, in label order
+    section_summaries: List[Tuple[Optional[str], str]] = field(default_factory=list)
+
+
+# Summarize the whole label when a summary request names a drug and no particular section
+def whole_label_request(analysis: Optional[QueryAnalysis]) -> bool:
+    return bool(analysis and analysis.files and not analysis.intents and len(analysis.files) <= MAX_LABELS)
+
+
+def _heading(doc: Document) -> str:
+    path = doc.metadata.get("section_path") or ""
+    return path.split(" > ")[0] or doc.metadata.get("section", "")
+
+
+# Every stored chunk of the labels, grouped by (label, section) in label order. Chunks are grouped by
+# canonical section, so "Drug Label Information" chunks join the numbered section they belong to.
+def label_sections(vector_store, files: List[str]) -> List[Tuple[str, str, List[Document]]]:
+    stored = vector_store.get(where={"file": {"$in": list(files)}}, include=["documents", "metadatas"])
+    groups: Dict[Tuple[str, str], List[Document]] = {}
+    for text, metadata in zip(stored["documents"], stored["metadatas"]):
+        doc = Document(page_content=text, metadata=metadata)
+        section = section_of(doc)
+        heading = _heading(doc)
+        if section in SKIPPED_SECTIONS or (section is None and _SKIPPED_HEADINGS.search(heading)):
+            continue
+        key = (metadata.get("file", ""), section or heading)
+        groups.setdefault(key, []).append(doc)
+
+    order = sorted(groups, key=lambda key: (files.index(key[0]) if key[0] in files else len(files),
+                                            _SECTION_ORDER.get(key[1], -1)))
+    # Name the section by its numbered heading ("7 DRUG INTERACTIONS") over a Highlights one
+    headings = {key: [_heading(doc) for doc in docs] for key, docs in groups.items()}
+    return [(key[0], next((h for h in headings[key] if h[:1].isdigit()), headings[key][0]), groups[key])
+            for key in order]
+
+
+# Consecutive chunks packed into parts of at most `max_tokens`
+def _parts(texts: List[str], max_tokens: int, separator: str = "\n") -> List[str]:
+    parts, current, tokens = [], [], 0
+    for text in texts:
+        text_tokens = count_tokens(text)
+        if current and tokens + text_tokens > max_tokens:
+            parts.append(separator.join(current))
+            current, tokens = [], 0
+        current.append(text)
+        tokens += text_tokens
+    if current:
+        parts.append(separator.join(current))
+    return parts
+
+
+class _Summarizer:
+    def __init__(self, llm: LLM, cache: Optional[SummaryCache], max_concurrency: int, result: HierarchicalSummary):
+        self.llm = llm
+        self.model = getattr(llm, "model", None) or type(llm).__name__
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.result = result
+        self.pending: Dict[str, asyncio.Task] = {}
+
+    async def _run(self, prompt: str, max_tokens: Optional[int], callbacks) -> str:
+        cached = self.cache.get(self.model, prompt) if self.cache else None
+        if cached is not None:
+            self.result.cached_calls += 1
+            return cached
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        async with self.semaphore:
+            summary = (await self.llm.ainvoke(prompt, config={"callbacks": callbacks}, **kwargs)).strip()
+        self.result.llm_calls += 1
+        if self.cache:
+            self.cache.put(self.model, prompt, summary)
+        return summary
+
+    # Identical prompts within one request (a section repeated across labels) share one call
+    async def __call__(self, prompt: str, max_tokens: Optional[int] = MAP_MAX_TOKENS, callbacks=None) -> str:
+        if prompt not in self.pending:
+            self.pending[prompt] = asyncio.ensure_future(self._run(prompt, max_tokens, callbacks))
+        return await self.pending[prompt]
+
+
+# Map-reduce summary of whole labels. Every section of the drug's label(s) is summarized by its own
+# LLM call, in parallel and cached by content, and the section summaries are reduced into the answer
+# to the query, folding them level by level while they exceed one call's input budget.
+async def asummarize_label(query: str, vector_store, files: List[str], llm: LLM,
+                           cache: Optional[SummaryCache] = None, callbacks=None,
+                           max_concurrency: int = MAX_CONCURRENT_CALLS) -> HierarchicalSummary:
+    start_time = time.time()
+    result = HierarchicalSummary()
+    sections = await asyncio.to_thread(label_sections, vector_store, files)
+    if not sections:
+        return result
+    result.labels = len({file for file, _, _ in sections})
+    result.sections = len(sections)
+    result.chunks = sum(len(docs) for _, _, docs in sections)
+    result.label_tokens = sum(count_tokens(doc.page_content) for _, _, docs in sections for doc in docs)
+    summarize = _Summarizer(llm, cache, max_concurrency, result)
+
+    async def map_section(file: str, heading: str, docs: List[Document]) -> str:
+        parts = _parts([doc.page_content for doc in docs], MAP_INPUT_TOKENS)
+        summaries = await asyncio.gather(*(
+            summarize(MAP_PROMPT.format(section=heading, label=file, content=part)) for part in parts))
+        return "\n".join(summaries)
+
+    mapped = await asyncio.gather(*(map_section(*section) for section in sections))
+    result.section_summaries = [(section_of(docs[0]), summary) for (_, _, docs), summary in zip(sections, mapped)]
+    summaries = [f"{file} - {heading}:\n{summary}" for (file, heading, _), summary in zip(sections, mapped)]
+    label = ", ".join(dict.fromkeys(file for file, _, _ in sections))
+    while len(summaries) > 1 and count_tokens("\n\n".join(summaries)) > REDUCE_INPUT_TOKENS:
+        groups = _parts(summaries, REDUCE_INPUT_TOKENS, "\n\n")
+        if len(groups) == len(summaries):
+            break
+        result.reduce_levels += 1
+        summaries = list(await asyncio.gather(*(
+            summarize(COMBINE_PROMPT.format(label=label, summaries=group)) for group in groups)))
+
+    result.reduce_levels += 1
+    result.summary = await summarize(REDUCE_PROMPT.format(query=query, summaries="\n\n".join(summaries)),
+                                     max_tokens=None, callbacks=callbacks)
+    result.seconds = round(time.time() - start_time, 2)
+    return result
+
+
+def summary_report(result: HierarchicalSummary) -> str:
+    return (f"[INFO] Hierarchical summary: {result.sections} sections of {result.labels} label(s), "
+            f"{result.chunks} chunks / {result.label_tokens} tokens, {result.llm_calls} LLM calls, "
+            f"{result.cached_calls} cached, {result.reduce_levels} reduce level(s), {result.seconds}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize whole drug labels with map-reduce over their sections.")
+    parser.add_argument("query", nargs="?", default="Summarize the details of Amoxicillin.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--endpoint", default="http://127.0.0.1:1234")
+    parser.add_argument("--summary-cache", default=DEFAULT_SUMMARY_CACHE_PATH)
+    parser.add_argument("--no-summary-cache", action="store_true")
+    parser.add_argument("--embedding-backend", default=None, choices=EMBEDDING_BACKENDS,
+                        help="Defaults to the backend the store was built with")
+    args = parser.parse_args()
+
+    from async_pipeline import run_sync
+    from embedding_backends import get_embeddings
+    from embedding_cache import DEFAULT_CACHE_PATH
+    from llm_client import LMStudioLLM
+    from query_analysis import get_query_analyzer
+    from vectorstore import open_vector_store
+
+    embeddings = (get_embeddings(args.embedding_backend, cache_path=DEFAULT_CACHE_PATH) if args.embedding_backend
+                  else None)
+    vector_store = open_vector_store(args.persist_directory, embeddings, cache_path=DEFAULT_CACHE_PATH)
+    analysis = get_query_analyzer(args.persist_directory).analyze(args.query)
+    if not analysis.files:
+        raise SystemExit(f"[ERROR] No drug label found for query: {args.query}")
+    cache = None if args.no_summary_cache else get_summary_cache(args.summary_cache)
+
+    print(f"[QUERY]: {args.query} ({', '.join(analysis.files)})")
+    result = run_sync(asummarize_label(args.query, vector_store, analysis.files[:MAX_LABELS],
+                                       LMStudioLLM(endpoint=args.endpoint), cache))
+    print(summary_report(result))
+    print(f"[SUMMARY]: {result.summary}")
@@ -0,0 +1,93 @@
+from typing import Any, List, Optional
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from bm25_index import BM25Index, get_bm25_index, reciprocal_rank_fusion
+from query_analysis import QueryAnalysis, filtered_search
+from vectorstore import get_corpus_version
+
+# Candidates taken from each ranking before fusion
+DEFAULT_FETCH_K = 20
+
+
+def chunk_key(doc: Document):
+    return doc.metadata.get("file"), doc.metadata.get("section"), doc.page_content
+
+
+def _keyword_search(index: BM25Index, query: str, k: int, analysis: Optional[QueryAnalysis]) -> List[str]:
+    ids = []
+    for files, sections in (analysis.levels() if analysis else [(None, None)]):
+        for chunk_id, _ in index.search(query, k, files=files, sections=sections):
+            if chunk_id not in ids:
+                ids.append(chunk_id)
+        if len(ids) >= k:
+            break
+    return ids[:k]
+
+
+# Vector and BM25 rankings fused with reciprocal rank fusion. Keyword hits are looked up in the
+# vector store by chunk ID, so both rankings resolve to the same stored chunks.
+def hybrid_search(vector_store, index: BM25Index, query: str, embedding: List[float], k: int,
+                  analysis: Optional[QueryAnalysis] = None, fetch_k: int = DEFAULT_FETCH_K,
+                  rrf_k: int = 60) -> List[Document]:
+    fetch_k = max(fetch_k, k)
+    if analysis:
+        vector_docs = filtered_search(vector_store, embedding, fetch_k, analysis)
+    else:
+        vector_docs = vector_store.similarity_search_by_vector(embedding, fetch_k)
+
+    keyword_ids = _keyword_search(index, query, fetch_k, analysis)
+    keyword_docs = []
+    if keyword_ids:
+        stored = vector_store.get(ids=keyword_ids, include=["documents", "metadatas"])
+        by_id = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                 for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+        keyword_docs = [by_id[chunk_id] for chunk_id in keyword_ids if chunk_id in by_id]
+
+    docs_by_key = {chunk_key(doc): doc for doc in vector_docs + keyword_docs}
+    fused = reciprocal_rank_fusion([[chunk_key(doc) for doc in vector_docs],
+                                    [chunk_key(doc) for doc in keyword_docs]], rrf_k=rrf_k)
+    return [docs_by_key[key] for key in fused[:k]]
+
+
+_stale_warnings = set()
+
+
+# The BM25 index for a store, or None when it is missing or was built for another corpus version
+def get_store_bm25_index(vector_store) -> Optional[BM25Index]:
+    persist_directory = getattr(vector_store, "_persist_directory", None)
+    if not persist_directory:
+        return None
+    index = get_bm25_index(persist_directory)
+    if index is not None and index.corpus_version != get_corpus_version(persist_directory):
+        if (persist_directory, index.corpus_version) not in _stale_warnings:
+            _stale_warnings.add((persist_directory, index.corpus_version))
+            print("[WARNING] BM25 index is out of date with the vector store; using vector search only. "
+                  "Rebuild with vectorstore.py to refresh it.")
+        return None
+    return index
+
+
+# Drop-in LangChain retriever: hybrid BM25 + vector search with reciprocal rank fusion
+class HybridRetriever(BaseRetriever):
+    vector_store: Any
+    index: Any
+    k: int = 5
+    fetch_k: int = DEFAULT_FETCH_K
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        embedding = self.vector_store.embeddings.embed_query(query)
+        return hybrid_search(self.vector_store, self.index, query, embedding, self.k,
+                             fetch_k=self.fetch_k, rrf_k=self.rrf_k)
+
+
+# Hybrid retriever when the store has a BM25 index, plain similarity search otherwise
+def get_retriever(vector_store, k: int = 5):
+    index = get_store_bm25_index(vector_store)
+    if index is None:
+        return vector_store.as_retriever(search_type="similarity", search_kwargs={"k": k})
+    return HybridRetriever(vector_store=vector_store, index=index, k=k)
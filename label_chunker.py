@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from dedup import dedupe_sections
+
+# Token budget per chunk. The recursive splitter's 1000 characters come to roughly 220 tokens.
+MAX_CHUNK_TOKENS = 256
+# Trailing pieces smaller than this are merged into the previous chunk of the same section
+MIN_CHUNK_TOKENS = 40
+
+# Standard PLR section titles, used to name the parent of a numbered subsection
+PLR_SECTION_TITLES = {
+    1: "INDICATIONS AND USAGE", 2: "DOSAGE AND ADMINISTRATION", 3: "DOSAGE FORMS AND STRENGTHS",
+    4: "CONTRAINDICATIONS", 5: "WARNINGS AND PRECAUTIONS", 6: "ADVERSE REACTIONS", 7: "DRUG INTERACTIONS",
+    8: "USE IN SPECIFIC POPULATIONS", 9: "DRUG ABUSE AND DEPENDENCE", 10: "OVERDOSAGE", 11: "DESCRIPTION",
+    12: "CLINICAL PHARMACOLOGY", 13: "NONCLINICAL TOXICOLOGY", 14: "CLINICAL STUDIES", 15: "REFERENCES",
+    16: "HOW SUPPLIED/STORAGE AND HANDLING", 17: "PATIENT COUNSELING INFORMATION",
+}
+
+# Unnumbered upper-case headings that start a new part of the label
+UPPERCASE_HEADINGS = [
+    "HIGHLIGHTS OF PRESCRIBING INFORMATION", "FULL PRESCRIBING INFORMATION", "BOXED WARNING", "RECENT MAJOR CHANGES",
+    "MEDICATION GUIDE", "PATIENT INFORMATION", "INSTRUCTIONS FOR USE", "PACKAGE LABEL", "PRINCIPAL DISPLAY PANEL",
+]
+
+# "6. ADVERSE REACTIONS", "16 HOW SUPPLIED/STORAGE AND HANDLING"
+_SECTION_MARKER = r"(?P<major>1[0-7]|[1-9])\.?[ \t\xa0]*(?P<title>" + "|".join(
+    re.escape(title) for title in PLR_SECTION_TITLES.values()) + ")"
+# "5.1 Cardiovascular Thrombotic Events", "2.2\xa0Osteoarthritis". Cross-references such as "(5.1)",
+# "(2.2,14.1)" and decimals such as "2.5 mg" are excluded by the look-behind and the capital that must follow.
+_SUBSECTION_MARKER = r"(?<![\d.(,\-])(?P<sub>(?:1[0-7]|[1-9])\.\d{1,2})(?![\d)])(?=[ \t\xa0]*[A-Z][A-Za-z])"
+_HEADING_MARKER = r"(?P<heading>" + "|".join(re.escape(heading) for heading in UPPERCASE_HEADINGS) + ")"
+MARKER_PATTERN = re.compile("|".join([_SECTION_MARKER, _SUBSECTION_MARKER, _HEADING_MARKER]))
+
+# A subsection title runs until the scraper glued the body on ("OsteoarthritisFor the management")
+# or the line ends
+_SUBSECTION_TITLE = re.compile(r"[ \t\xa0]*([A-Z][^\n]{0,80}?(?:[a-z)\]](?=[A-Z][a-z])|(?=\n|$)))")
+
+# Sentence ends, including the "(5.1)" references that end each Highlights bullet even when the
+# scraper dropped the space before the next sentence
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|(?<=\)\.)(?=[A-Z])|(?<=[a-z]\.)(?=[A-Z])|(?<=\d\))(?=[A-Z])|\n+")
+
+
+# Token counting with the OpenAI embedding tokenizer, otherwise a word/punctuation count, which tracks
+# it closely on label text. tiktoken downloads its encoding the first time it is used; count_tokens runs
+# on the request path (LLM spans, context packing), so it only loads an encoding already in tiktoken's
+# cache and never waits on the network. Builds fetch it once with load_token_encoding(download=True).
+TOKEN_ENCODING = "cl100k_base"
+TOKEN_ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+_encoding = None
+
+
+# Same location tiktoken.load.read_file_cached uses; an empty cache directory disables its cache
+def _token_encoding_cached() -> bool:
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR", os.environ.get(
+        "DATA_GYM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data-gym-cache")))
+    cache_key = hashlib.sha1(TOKEN_ENCODING_URL.encode()).hexdigest()
+    return bool(cache_dir) and os.path.exists(os.path.join(cache_dir, cache_key))
+
+
+def load_token_encoding(download: bool = False):
+    global _encoding
+    if not _encoding and (_encoding is None or download):
+        _encoding = False
+        if download or _token_encoding_cached():
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                print(f"[WARNING] tiktoken encoding unavailable, counting words instead: {e}")
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    encoding = load_token_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _section_number(section: str) -> Optional[Tuple[int, str]]:
+    match = re.match(r"^\s*(1[0-7]|[1-9])(?:\.(\d{1,2}))?(?=\D|$)", section)
+    if not match:
+        return None
+    return int(match.group(1)), match.group(0).strip()
+
+
+# Section path for a heading: "5.1 Cardiovascular Thrombotic Events" lives under
+# "WARNINGS AND PRECAUTIONS"; unnumbered headings are their own path
+def section_path(section: str) -> List[str]:
+    heading = " ".join(section.split())
+    number = _section_number(heading)
+    if number is None:
+        return [heading]
+    major, label = number
+    parent = f"{major} {PLR_SECTION_TITLES[major]}"
+    if "." not in label and heading.upper().endswith(PLR_SECTION_TITLES[major]):
+        return [parent]
+    return [parent, heading]
+
+
+# Split section text at the numbered section/subsection markers and upper-case headings it contains.
+# Returns (path, text) pairs; text before the first marker keeps the section's own path.
+def split_on_markers(text: str, base_path: List[str]) -> List[Tuple[List[str], str]]:
+    segments = []
+    path, start = base_path, 0
+    for match in MARKER_PATTERN.finditer(text):
+        if match.start() > start:
+            segments.append((path, text[start:match.start()]))
+        if match.group("major"):
+            major = int(match.group("major"))
+            path = [f"{major} {PLR_SECTION_TITLES[major]}"]
+        elif match.group("sub"):
+            major = int(match.group("sub").split(".")[0])
+            title = _SUBSECTION_TITLE.match(text, match.end())
+            heading = f"{match.group('sub')} {title.group(1).strip()}" if title else match.group("sub")
+            path = [f"{major} {PLR_SECTION_TITLES[major]}", heading]
+        else:
+            path = [match.group("heading")]
+        start = match.start()
+    segments.append((path, text[start:]))
+    return [(path, segment.strip()) for path, segment in segments if segment.strip()]
+
+
+def _alnum(text: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", text.lower())
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+
+# Greedy packing of sentences into chunks of at most `max_tokens`; no overlap. A single sentence
+# longer than the budget (tables flattened into one run) is cut on word boundaries.
+def pack_sentences(sentences: List[str], max_tokens: int, min_tokens: int,
+                   counter: Callable[[str], int] = count_tokens) -> List[str]:
+    chunks, current, current_tokens = [], [], 0
+    for sentence in sentences:
+        tokens = counter(sentence)
+        if tokens > max_tokens:
+            if current:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            words = sentence.split()
+            piece = []
+            for word in words:
+                piece.append(word)
+                if counter(" ".join(piece)) >= max_tokens:
+                    chunks.append(" ".join(piece))
+                    piece = []
+            if piece:
+                current, current_tokens = [" ".join(piece)], counter(" ".join(piece))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        tail = " ".join(current)
+        if chunks and current_tokens < min_tokens and counter(chunks[-1]) + current_tokens <= max_tokens * 1.25:
+            chunks[-1] = f"{chunks[-1]} {tail}"
+        else:
+            chunks.append(tail)
+    return chunks
+
+
+# Structure-aware chunking of one label section. Segments are packed in order; a new chunk starts at a
+# section boundary unless the current chunk is still below `min_tokens` (e.g. a heading whose body was
+# deduplicated away). A chunk is labelled with the path of the segment contributing most of its text.
+def chunk_section(section: str, content: str, max_tokens: int = MAX_CHUNK_TOKENS,
+                  min_tokens: int = MIN_CHUNK_TOKENS) -> List[Tuple[str, str]]:
+    groups: List[List[Tuple[List[str], str, int]]] = []
+    group_tokens = 0
+    for path, segment in split_on_markers(content, section_path(section)):
+        if _alnum(segment) == _alnum(path[-1]):
+            continue  # A bare heading: table-of-contents entry, or a section whose body was deduplicated away
+        tokens = count_tokens(segment)
+        if groups and (groups[-1][-1][0] == path or group_tokens < min_tokens):
+            groups[-1].append((path, segment, tokens))
+            group_tokens += tokens
+        else:
+            groups.append([(path, segment, tokens)])
+            group_tokens = tokens
+
+    chunks = []
+    for group in groups:
+        path = max(group, key=lambda entry: entry[2])[0]
+        sentences = [sentence for _, segment, _ in group for sentence in split_sentences(segment)]
+        for chunk in pack_sentences(sentences, max_tokens, min_tokens):
+            chunks.append((" > ".join(path), chunk))
+    return chunks
+
+
+# Chunk counts and token totals of the recursive character splitter vs. the label-aware chunker
+# over the same (deduplicated) sections
+def compare_chunkers(json_dir: str, max_tokens: int = MAX_CHUNK_TOKENS, dedupe: bool = True) -> Dict[str, Dict]:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    report = {"recursive": {"chunks": 0, "tokens": 0}, "label": {"chunks": 0, "tokens": 0}, "source_tokens": 0}
+    for file_name in sorted(os.listdir(json_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as file:
+            data = json.load(file)
+        sections = {section: content for section, content in data.items()
+                    if isinstance(content, str) and content.strip()}
+        if dedupe:
+            sections, _ = dedupe_sections(sections)
+        for section, content in sections.items():
+            report["source_tokens"] += count_tokens(content)
+            for chunk in splitter.split_text(content):
+                report["recursive"]["chunks"] += 1
+                report["recursive"]["tokens"] += count_tokens(chunk)
+            for _, chunk in chunk_section(section, content, max_tokens=max_tokens):
+                report["label"]["chunks"] += 1
+                report["label"]["tokens"] += count_tokens(chunk)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the label-aware chunker with the recursive splitter.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--max-tokens", type=int, default=MAX_CHUNK_TOKENS)
+    parser.add_argument("--no-dedupe", action="store_true")
+    args = parser.parse_args()
+
+    load_token_encoding(download=True)
+    report = compare_chunkers(args.json_dir, max_tokens=args.max_tokens, dedupe=not args.no_dedupe)
+    recursive, label = report["recursive"], report["label"]
+    print(f"[INFO] Source text: {report['source_tokens']} tokens")
+    print(f"[INFO] Recursive splitter: {recursive['chunks']} chunks, {recursive['tokens']} tokens")
+    print(f"[INFO] Label chunker:      {label['chunks']} chunks, {label['tokens']} tokens")
+    print(f"[INFO] Reduction: {1 - label['chunks'] / recursive['chunks']:.1%} fewer chunks, "
+          f"{1 - label['tokens'] / recursive['tokens']:.1%} fewer embedded tokens")
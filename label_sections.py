@@ -0,0 +1,42 @@
+import re
+from typing import Optional
+
+# Canonical sections of an FDA prescribing-information label, with the section number used by
+# the PLR format ("5 WARNINGS AND PRECAUTIONS", "5.1 Lactic Acidosis") and keywords for the
+# unnumbered headings older labels use ("Nursing Mothers", "Information for Patients").
+CANONICAL_SECTIONS = [
+    ("boxed_warning", None, r"^warning:|boxed warning"),
+    ("indications", 1, r"(?<!contra)indications|limitations of use"),
+    ("dosage", 2, r"dosage and administration|dosing|dose modification|administration"),
+    ("dosage_forms", 3, r"dosage forms|strengths"),
+    ("contraindications", 4, r"contraindication"),
+    ("interactions", 7, r"interaction"),
+    ("warnings", 5, r"warning|precaution"),
+    ("adverse_reactions", 6, r"adverse reaction|side effect|post-?marketing|clinical (trials?|studies) experience"),
+    ("specific_populations", 8, r"pregnan|lactation|nursing mothers|pediatric|geriatric|renal impairment|"
+                                r"hepatic impairment|reproductive potential|specific populations|labor and delivery"),
+    ("abuse", 9, r"abuse|dependence|controlled substance"),
+    ("overdosage", 10, r"overdos"),
+    ("description", 11, r"^description"),
+    ("clinical_pharmacology", 12, r"pharmacology|mechanism of action|pharmacokinetic|pharmacodynamic|microbiology"),
+    ("nonclinical_toxicology", 13, r"carcinogenesis|toxicology"),
+    ("clinical_studies", 14, r"clinical studies"),
+    ("references", 15, r"^references"),
+    ("how_supplied", 16, r"how supplied|storage and handling"),
+    ("patient_counseling", 17, r"patient counseling|information for patients|medication guide"),
+]
+
+_BY_NUMBER = {number: name for name, number, _ in CANONICAL_SECTIONS if number is not None}
+_SECTION_NUMBER = re.compile(r"^\s*(\d{1,2})(?:\.\d+)?(?=\D|$)")
+
+
+# Map a raw section heading onto its canonical section, or None when it can't be placed
+def canonical_section(section: str) -> Optional[str]:
+    match = _SECTION_NUMBER.match(section)
+    if match and int(match.group(1)) in _BY_NUMBER:
+        return _BY_NUMBER[int(match.group(1))]
+    lowered = section.lower()
+    for name, _, pattern in CANONICAL_SECTIONS:
+        if re.search(pattern, lowered):
+            return name
+    return None
@@ -0,0 +1,282 @@
+import time
+import random
+import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from langchain.llms.base import LLM
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field
+
+from label_chunker import count_tokens
+from llm_streaming import LLMHTTPError, astream_chat_completion, stream_chat_completion
+from tracing import Span, annotate, span
+
+DEFAULT_ENDPOINT = "http://127.0.0.1:1234"
+DEFAULT_MODEL = "llama-3.2-3b-instruct"
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# One keep-alive session and one concurrency gate per endpoint, shared by every LLM instance in the process
+_sessions: Dict[str, requests.Session] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_registry_lock = threading.Lock()
+
+
+def get_session(endpoint: str, pool_size: int = 8) -> requests.Session:
+    with _registry_lock:
+        if endpoint not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[endpoint] = session
+        return _sessions[endpoint]
+
+
+def get_semaphore(endpoint: str, max_concurrency: int) -> threading.BoundedSemaphore:
+    with _registry_lock:
+        if endpoint not in _semaphores:
+            _semaphores[endpoint] = threading.BoundedSemaphore(max_concurrency)
+        return _semaphores[endpoint]
+
+
+# Async callers wait for the same per-endpoint gate on these threads rather than the loop's default
+# executor, so a queue of waiting completions never holds up asyncio.to_thread work such as retrieval
+_gate_waiters = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-gate")
+
+
+# Hold the endpoint's process-wide gate from async code. Every run_sync call gets its own event
+# loop, so an asyncio.Semaphore would only limit one request's fan-out; this shares the threading
+# gate with the sync path instead. A slot acquired after its waiter was cancelled is handed back
+# from the waiter thread, so it is not lost even if the loop has closed by then.
+@asynccontextmanager
+async def agate(endpoint: str, max_concurrency: int):
+    semaphore = get_semaphore(endpoint, max_concurrency)
+    if not semaphore.acquire(blocking=False):
+        waiting = _gate_waiters.submit(semaphore.acquire)
+        try:
+            await asyncio.shield(asyncio.wrap_future(waiting))
+        except asyncio.CancelledError:
+            waiting.add_done_callback(lambda _: semaphore.release())
+            raise
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+# httpx.AsyncClient is bound to the event loop that uses it, so the async pool is kept per
+# running loop (and dropped with it)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_async_client(endpoint: str, max_concurrency: int, connect_timeout: float,
+                     read_timeout: float) -> httpx.AsyncClient:
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if endpoint not in clients:
+        clients[endpoint] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+    return clients[endpoint]
+
+
+# Close the running loop's async clients; call before the loop shuts down
+async def aclose_async_clients():
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+# Custom LLM integration with LMStudio (OpenAI-compatible /v1/chat/completions).
+# Shared by every tool: pooled keep-alive connections, per-endpoint concurrency limit,
+# retries with exponential backoff and jitter, and optional SSE streaming. The async methods
+# (ainvoke/astream) use a pooled httpx.AsyncClient with the same retry policy and share the
+# sync path's concurrency gate, so the limit holds across threads and event loops.
+class LMStudioLLM(LLM):
+    endpoint: str = Field(...)  # Declare endpoint as a required field
+    model: str = DEFAULT_MODEL
+    max_tokens: int = 1000
+    temperature: Optional[float] = None
+    connect_timeout: float = 5
+    read_timeout: float = 100
+    max_retries: int = 2
+    retry_backoff: float = 0.5
+    max_concurrency: int = 4  # Simultaneous requests allowed against this endpoint, process-wide
+    streaming: bool = False  # Consume the server's SSE stream and report tokens to callbacks as they arrive
+
+    def __init__(self, endpoint: str = DEFAULT_ENDPOINT, **kwargs: Any):
+        super().__init__(endpoint=endpoint, **kwargs)
+
+    # max_tokens can be overridden per call, e.g. llm.invoke(prompt, max_tokens=8) for a one-word reply
+    def _payload(self, prompt: str, stop=None, **kwargs: Any) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+        }
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        if stop:
+            payload["stop"] = stop
+        return payload
+
+    # Message content of a completion; the server's token usage, when reported, goes on the LLM span
+    @staticmethod
+    def _content(body: Dict[str, Any], attempt: int) -> str:
+        usage = body.get("usage") or {}
+        annotate(retries=attempt, **{key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage})
+        return body["choices"][0]["message"]["content"]
+
+    # One span per completion; token counts are estimated when the server doesn't report them
+    def _span(self, prompt: str, **kwargs: Any):
+        return span("llm", model=self.model, streaming=self.streaming,
+                    max_tokens=kwargs.get("max_tokens", self.max_tokens), prompt_chars=len(prompt))
+
+    @staticmethod
+    def _finish_span(current: Span, prompt: str, text: str, started: float, first_token: Optional[float] = None):
+        current.attributes.setdefault("prompt_tokens", count_tokens(prompt))
+        current.attributes.setdefault("completion_tokens", count_tokens(text))
+        if first_token is not None:
+            current.set(first_token_ms=round((first_token - started) * 1000, 1))
+
+    def _sleep_before_retry(self, attempt: int):
+        time.sleep(self.retry_backoff * (2 ** attempt) + random.uniform(0, self.retry_backoff))
+
+    def _post(self, payload: Dict[str, Any]) -> str:
+        session = get_session(self.endpoint, pool_size=self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with get_semaphore(self.endpoint, self.max_concurrency):
+                    response = session.post(
+                        f"{self.endpoint}/v1/chat/completions",
+                        json=payload,
+                        timeout=(self.connect_timeout, self.read_timeout),
+                    )
+                if response.status_code == 200:
+                    return self._content(response.json(), attempt)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise LLMHTTPError(response.status_code, response.text)
+            except requests.exceptions.Timeout:
+                if attempt == self.max_retries:
+                    raise Exception("[ERROR] LLM request timed out.")
+            except requests.exceptions.ConnectionError as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"[ERROR] Could not connect to LLM at {self.endpoint}: {e}")
+            self._sleep_before_retry(attempt)
+
+    def _call(self, prompt: str, stop: Optional[list] = None, run_manager: Optional[CallbackManagerForLLMRun] = None,
+              **kwargs: Any) -> str:
+        with self._span(prompt, **kwargs) as current:
+            started, first_token = time.perf_counter(), None
+            if self.streaming:
+                tokens = []
+                for chunk in self._stream(prompt, stop, run_manager, **kwargs):
+                    first_token = first_token or time.perf_counter()
+                    tokens.append(chunk.text)
+                text = "".join(tokens)
+            else:
+                text = self._post(self._payload(prompt, stop, **kwargs))
+            self._finish_span(current, prompt, text, started, first_token)
+            return text
+
+    # Retries only happen before the first token; once output has been streamed it cannot be replayed
+    def _stream(self, prompt: str, stop: Optional[list] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        session = get_session(self.endpoint, pool_size=self.max_concurrency)
+        payload = self._payload(prompt, stop, **kwargs)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                with get_semaphore(self.endpoint, self.max_concurrency):
+                    for token in stream_chat_completion(self.endpoint, payload, session=session,
+                                                        timeout=(self.connect_timeout, self.read_timeout)):
+                        started = True
+                        if run_manager:
+                            run_manager.on_llm_new_token(token)
+                        yield GenerationChunk(text=token)
+                return
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if started or attempt == self.max_retries:
+                    raise Exception(f"[ERROR] LLM stream failed: {e}")
+            except LLMHTTPError as e:
+                if e.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise
+            self._sleep_before_retry(attempt)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        return get_async_client(self.endpoint, self.max_concurrency, self.connect_timeout, self.read_timeout)
+
+    async def _apost(self, payload: Dict[str, Any]) -> str:
+        client = self._async_client()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with agate(self.endpoint, self.max_concurrency):
+                    response = await client.post(f"{self.endpoint}/v1/chat/completions", json=payload)
+                if response.status_code == 200:
+                    return self._content(response.json(), attempt)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise LLMHTTPError(response.status_code, response.text)
+            except httpx.TimeoutException:
+                if attempt == self.max_retries:
+                    raise Exception("[ERROR] LLM request timed out.")
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"[ERROR] Could not connect to LLM at {self.endpoint}: {e}")
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt) + random.uniform(0, self.retry_backoff))
+
+    async def _acall(self, prompt: str, stop: Optional[list] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        with self._span(prompt, **kwargs) as current:
+            started, first_token = time.perf_counter(), None
+            if self.streaming:
+                tokens = []
+                async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+                    first_token = first_token or time.perf_counter()
+                    tokens.append(chunk.text)
+                text = "".join(tokens)
+            else:
+                text = await self._apost(self._payload(prompt, stop, **kwargs))
+            self._finish_span(current, prompt, text, started, first_token)
+            return text
+
+    async def _astream(self, prompt: str, stop: Optional[list] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        client = self._async_client()
+        payload = self._payload(prompt, stop, **kwargs)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with agate(self.endpoint, self.max_concurrency):
+                    async for token in astream_chat_completion(client, self.endpoint, payload):
+                        started = True
+                        if run_manager:
+                            await run_manager.on_llm_new_token(token)
+                        yield GenerationChunk(text=token)
+                return
+            except httpx.TransportError as e:
+                if started or attempt == self.max_retries:
+                    raise Exception(f"[ERROR] LLM stream failed: {e}")
+            except LLMHTTPError as e:
+                if e.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt) + random.uniform(0, self.retry_backoff))
+
+    @property
+    def _llm_type(self) -> str:
+        return "lmstudio"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"endpoint": self.endpoint, "model": self.model, "max_tokens": self.max_tokens}
@@ -0,0 +1,70 @@
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator
+
+import requests
+
+
+class LLMHTTPError(Exception):
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"LLM Error: {status_code} - {text}")
+        self.status_code = status_code
+
+
+DONE = object()
+
+
+# Parse one line of an OpenAI-compatible server-sent event stream.
+# Each event is a "data: {...}" line carrying choices[0].delta.content; "data: [DONE]" ends the stream.
+# Returns the token, DONE, or None for lines that carry no content.
+def parse_sse_line(line: str):
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return DONE
+    try:
+        event = json.loads(data)
+    except json.JSONDecodeError:
+        return None
+    choices = event.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or None
+
+
+def iter_sse_tokens(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        token = parse_sse_line(line)
+        if token is DONE:
+            return
+        if token:
+            yield token
+
+
+# POST a chat completion with "stream": true and yield tokens as the server produces them
+def stream_chat_completion(endpoint: str, payload: Dict[str, Any], timeout: float = 100,
+                           session=None) -> Iterator[str]:
+    http = session or requests
+    with http.post(
+        f"{endpoint}/v1/chat/completions",
+        json={**payload, "stream": True},
+        stream=True,
+        timeout=timeout,
+    ) as response:
+        if response.status_code != 200:
+            raise LLMHTTPError(response.status_code, response.text)
+        # chunk_size=None hands each chunk over as soon as it arrives instead of waiting to fill a buffer
+        response.encoding = response.encoding or "utf-8"
+        yield from iter_sse_tokens(response.iter_lines(chunk_size=None, decode_unicode=True))
+
+
+# Async counterpart of stream_chat_completion on a shared httpx.AsyncClient
+async def astream_chat_completion(client, endpoint: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+    async with client.stream("POST", f"{endpoint}/v1/chat/completions", json={**payload, "stream": True}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise LLMHTTPError(response.status_code, response.text)
+        async for line in response.aiter_lines():
+            token = parse_sse_line(line)
+            if token is DONE:
+                return
+            if token:
+                yield token
@@ -0,0 +1,548 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# The embedding matrix, memory-mapped at load, and everything else about the chunks
+VECTORS_FILE = "vectors.npy"
+VECTOR_INDEX_FILE = "vector_index.npz"
+VECTOR_DTYPES = ["float32", "float16", "int8"]
+# Stores with at least this many chunks are searched through an IVF index instead of a full scan
+IVF_THRESHOLD = 50_000
+# Inverted lists scanned per query, out of about sqrt(chunks)
+IVF_PROBES = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+# float16/int8 rows are widened to float32 this many at a time while scanning
+SCAN_BLOCK_ROWS = 16384
+# Metadata filters whose row masks are kept, least recently used dropped first; each holds a
+# bool and an int64 entry per row, so about 9 MB at a million chunks
+MASK_CACHE_SIZE = 32
+
+# Names are stored joined by a separator that cannot occur in file or section names
+_SEPARATOR = "\x1f"
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        # Symmetric per-row scale: the row's largest magnitude maps to 127
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+# Lloyd's k-means on a sample of the rows, then every row assigned to its nearest centroid
+def _kmeans(vectors: np.ndarray, lists: int, iterations: int = KMEANS_ITERATIONS,
+            seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), lists * KMEANS_SAMPLE_PER_LIST), replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(sample, centroids)
+        counts = np.bincount(assignment, minlength=lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+    return centroids, _nearest(vectors, centroids)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    norms = (centroids * centroids).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+        block = vectors[start:start + SCAN_BLOCK_ROWS]
+        assignment[start:start + len(block)] = np.argmax(2 * block @ centroids.T - norms, axis=1)
+    return assignment
+
+
+# All chunk embeddings in one contiguous matrix (float32, or float16 / per-row-scaled int8), with
+# the chunks' IDs, text and metadata. Search ranks rows by L2 distance, as Chroma does, with one
+# matrix-vector product and argpartition. Metadata filters become boolean row masks, computed once
+# per filter from the file/section codes. Indexes built with IVF keep their rows grouped by
+# inverted list, so each probed list is a contiguous slice of the matrix.
+class VectorIndex:
+    def __init__(self, ids, vectors, scales, norms, texts, text_offsets, metadatas, file_names, file_codes,
+                 section_names, section_codes, centroids=None, list_offsets=None, corpus_version="unversioned",
+                 embedding=None):
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.norms = norms
+        self.texts = texts
+        self.text_offsets = text_offsets
+        self.metadatas = metadatas
+        self.codes = {"file": (file_names, file_codes), "section": (section_names, section_codes)}
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.corpus_version = corpus_version
+        self.embedding = embedding
+        self._rows_by_id = None
+        self._masks: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.vectors.dtype)
+
+    @property
+    def kind(self) -> str:
+        return "flat" if self.centroids is None else "ivf"
+
+    # index: "flat" scans every row, "ivf" clusters them into about sqrt(rows) lists, "auto" picks
+    # IVF from IVF_THRESHOLD chunks up
+    @classmethod
+    def build(cls, ids: Sequence[str], vectors, documents: Sequence[Document], dtype: str = "float32",
+              index: str = "auto", lists: int = None, corpus_version: str = "unversioned",
+              embedding: Dict = None) -> "VectorIndex":
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        centroids, list_offsets = None, None
+        order = np.arange(len(ids))
+        if index == "ivf" or (index == "auto" and len(ids) >= IVF_THRESHOLD):
+            lists = min(lists or max(1, int(np.sqrt(len(ids)))), len(ids))
+            centroids, assignment = _kmeans(vectors, lists)
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.zeros(lists + 1, dtype=np.int64)
+            list_offsets[1:] = np.cumsum(np.bincount(assignment, minlength=lists))
+        vectors = vectors[order]
+        documents = [documents[i] for i in order]
+
+        stored, scales = _quantize(vectors, dtype)
+        restored = stored.astype(np.float32) * (scales[:, None] if scales is not None else 1)
+        encoded = [doc.page_content.encode("utf-8") for doc in documents]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        text_offsets[1:] = np.cumsum([len(text) for text in encoded])
+        file_names = sorted({doc.metadata.get("file", "") for doc in documents})
+        section_names = sorted({doc.metadata.get("section", "") for doc in documents})
+        file_index = {name: code for code, name in enumerate(file_names)}
+        section_index = {name: code for code, name in enumerate(section_names)}
+        return cls(
+            ids=np.array([ids[i] for i in order]),
+            vectors=stored,
+            scales=scales,
+            norms=(restored * restored).sum(axis=1).astype(np.float32),
+            texts=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            text_offsets=text_offsets,
+            metadatas=[doc.metadata for doc in documents],
+            file_names=file_names,
+            file_codes=np.array([file_index[doc.metadata.get("file", "")] for doc in documents], dtype=np.int32),
+            section_names=section_names,
+            section_codes=np.array([section_index[doc.metadata.get("section", "")] for doc in documents],
+                                   dtype=np.int32),
+            centroids=centroids,
+            list_offsets=list_offsets,
+            corpus_version=corpus_version,
+            embedding=embedding,
+        )
+
+    # Both files are written to temporary names and renamed, matrix first: the index file is the one
+    # readers key their cache on, and it records the row count the matrix must have
+    def save(self, persist_directory: str):
+        os.makedirs(persist_directory, exist_ok=True)
+        vectors_path = os.path.join(persist_directory, VECTORS_FILE)
+        index_path = os.path.join(persist_directory, VECTOR_INDEX_FILE)
+        with open(vectors_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors))
+        os.replace(vectors_path + ".tmp", vectors_path)
+        optional = {"scales": self.scales, "centroids": self.centroids, "list_offsets": self.list_offsets}
+        np.savez(
+            index_path + ".tmp.npz",
+            ids=self.ids,
+            norms=self.norms,
+            texts=self.texts,
+            text_offsets=self.text_offsets,
+            metadatas=np.array(json.dumps(self.metadatas)),
+            file_names=np.array(_SEPARATOR.join(self.codes["file"][0])),
+            file_codes=self.codes["file"][1],
+            section_names=np.array(_SEPARATOR.join(self.codes["section"][0])),
+            section_codes=self.codes["section"][1],
+            corpus_version=np.array(self.corpus_version),
+            embedding=np.array(json.dumps(self.embedding)),
+            **{key: value for key, value in optional.items() if value is not None},
+        )
+        os.replace(index_path + ".tmp.npz", index_path)
+
+    # The matrix is memory-mapped: opening costs no reads, and only the pages a search touches are loaded
+    @classmethod
+    def load(cls, persist_directory: str, mmap: bool = True) -> "VectorIndex":
+        vectors = np.load(os.path.join(persist_directory, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with np.load(os.path.join(persist_directory, VECTOR_INDEX_FILE), allow_pickle=False) as data:
+            def names(key):
+                joined = str(data[key])
+                return joined.split(_SEPARATOR) if joined else []
+
+            if len(vectors) != len(data["ids"]):
+                raise Exception(f"[ERROR] {VECTORS_FILE} and {VECTOR_INDEX_FILE} in {persist_directory} "
+                                f"disagree on the number of chunks; rebuild with vectorstore.py.")
+            return cls(
+                ids=data["ids"],
+                vectors=vectors,
+                scales=data["scales"] if "scales" in data else None,
+                norms=data["norms"],
+                texts=data["texts"],
+                text_offsets=data["text_offsets"],
+                metadatas=json.loads(str(data["metadatas"])),
+                file_names=names("file_names"),
+                file_codes=data["file_codes"],
+                section_names=names("section_names"),
+                section_codes=data["section_codes"],
+                centroids=data["centroids"] if "centroids" in data else None,
+                list_offsets=data["list_offsets"] if "list_offsets" in data else None,
+                corpus_version=str(data["corpus_version"]),
+                embedding=json.loads(str(data["embedding"])),
+            )
+
+    def document(self, row: int) -> Document:
+        text = self.texts[self.text_offsets[row]:self.text_offsets[row + 1]].tobytes().decode("utf-8")
+        return Document(page_content=text, metadata=dict(self.metadatas[row]))
+
+    def _matches(self, key: str, values: Sequence[Any]) -> np.ndarray:
+        if key in self.codes:
+            names, codes = self.codes[key]
+            lookup = {name: code for code, name in enumerate(names)}
+            return np.isin(codes, [lookup[value] for value in values if value in lookup])
+        return np.array([metadata.get(key) in values for metadata in self.metadatas], dtype=bool)
+
+    # Chroma `where` filters: {"file": "x"}, {"file": {"$in": [...]}}, $eq/$ne/$in/$nin, $and/$or
+    def _evaluate(self, where: Dict) -> np.ndarray:
+        if "$and" in where:
+            return np.logical_and.reduce([self._evaluate(clause) for clause in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self._evaluate(clause) for clause in where["$or"]])
+        (key, condition), = where.items()
+        (operator, value), = (condition if isinstance(condition, dict) else {"$eq": condition}).items()
+        if operator not in ("$eq", "$ne", "$in", "$nin"):
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        matched = self._matches(key, value if operator in ("$in", "$nin") else [value])
+        return ~matched if operator in ("$ne", "$nin") else matched
+
+    # (mask, matching rows) of a filter, computed on first use and then reused
+    def mask(self, where: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        key = json.dumps(where, sort_keys=True)
+        with self._lock:
+            cached = self._masks.get(key)
+            if cached is not None:
+                self._masks.move_to_end(key)
+        if cached is None:
+            mask = self._evaluate(where)
+            cached = (mask, np.flatnonzero(mask))
+            with self._lock:
+                self._masks[key] = cached
+                while len(self._masks) > MASK_CACHE_SIZE:
+                    self._masks.popitem(last=False)
+        return cached
+
+    def _dot(self, query: np.ndarray, rows) -> np.ndarray:
+        vectors = self.vectors[rows]
+        if vectors.dtype == np.float32:
+            dots = vectors @ query
+        else:
+            dots = np.empty(len(vectors), dtype=np.float32)
+            for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+                dots[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            dots *= self.scales[rows]
+        return dots
+
+    # -|row - query|^2 up to the query's own norm: larger is nearer
+    def _rank(self, query: np.ndarray, rows, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = 2 * self._dot(query, rows) - self.norms[rows]
+        top = _top_k(scores, k)
+        positions = np.arange(len(self))[rows][top] if isinstance(rows, slice) else rows[top]
+        return positions, scores[top]
+
+    def _probe(self, query: np.ndarray, probes: int) -> np.ndarray:
+        centroid_scores = 2 * self.centroids @ query - (self.centroids * self.centroids).sum(axis=1)
+        lists = _top_k(centroid_scores, min(probes, len(self.centroids)))
+        return np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+
+    # Top-k (row, L2 distance) pairs. An IVF index scans only the probed lists; a filter selective
+    # enough that its rows are fewer than the probed ones is answered exactly instead, and so is a
+    # probe that leaves fewer than k matching rows.
+    def search(self, query, k: int, where: Dict = None, probes: int = IVF_PROBES) -> List[Tuple[int, float]]:
+        query = np.asarray(query, dtype=np.float32)
+        mask, rows = self.mask(where) if where else (None, slice(None))
+        if self.centroids is not None:
+            expected = len(self) * probes / len(self.centroids)
+            if mask is None or len(rows) > expected:
+                candidates = self._probe(query, probes)
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                if len(candidates) >= k:
+                    rows = candidates
+        positions, scores = self._rank(query, rows, k)
+        distances = np.maximum(float(query @ query) - scores, 0.0)
+        return [(int(row), float(distance)) for row, distance in zip(positions, distances)]
+
+    def get(self, ids: Sequence[str] = None, where: Dict = None) -> Dict[str, List]:
+        if ids is not None:
+            if self._rows_by_id is None:
+                self._rows_by_id = {str(chunk_id): row for row, chunk_id in enumerate(self.ids)}
+            rows = [self._rows_by_id[chunk_id] for chunk_id in ids if chunk_id in self._rows_by_id]
+        else:
+            rows = range(len(self))
+        if where:
+            mask = self.mask(where)[0]
+            rows = [row for row in rows if mask[row]]
+        docs = [self.document(row) for row in rows]
+        return {"ids": [str(self.ids[row]) for row in rows], "documents": [doc.page_content for doc in docs],
+                "metadatas": [doc.metadata for doc in docs]}
+
+
+# Loaded indexes are reused until the index file on disk changes, so reopening the store per
+# request costs a stat call
+_indexes: Dict[str, Tuple[float, VectorIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(persist_directory: str) -> Optional[VectorIndex]:
+    path = os.path.join(persist_directory, VECTOR_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _indexes_lock:
+        cached = _indexes.get(persist_directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, VectorIndex.load(persist_directory))
+            _indexes[persist_directory] = cached
+        return cached[1]
+
+
+# In-process vector store over a VectorIndex, answering the calls the pipeline makes of Chroma:
+# similarity_search(_by_vector) with `filter`, get(ids=/where=), embeddings and as_retriever.
+# It is read-only; vectorstore.py rewrites the index after every build or update.
+class NumpyVectorStore(VectorStore):
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, index: VectorIndex = None):
+        self._persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.index = index or get_vector_index(persist_directory)
+        if self.index is None:
+            raise Exception(f"[ERROR] No {VECTOR_INDEX_FILE} in {persist_directory}; build it with vectorstore.py.")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: Dict = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self.index.document(row), distance) for row, distance in self.index.search(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Dict = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Dict = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Dict = None, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k, filter)
+
+    def get(self, ids: Sequence[str] = None, where: Dict = None, include: Sequence[str] = None,
+            **kwargs: Any) -> Dict[str, List]:
+        return self.index.get(ids=ids, where=where)
+
+    def add_texts(self, texts: Iterable[str], metadatas: List[Dict] = None, **kwargs: Any) -> List[str]:
+        raise Exception("[ERROR] The NumPy vector store is read-only; add chunks with vectorstore.py.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: List[Dict] = None,
+                   persist_directory: str = None, ids: List[str] = None, **kwargs: Any) -> "NumpyVectorStore":
+        if not persist_directory:
+            raise Exception("[ERROR] NumpyVectorStore.from_texts needs a persist_directory.")
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(position) for position in range(len(texts))]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        VectorIndex.build(ids, embedding.embed_documents(list(texts)), documents, **kwargs).save(persist_directory)
+        return cls(persist_directory, embedding)
+
+
+# Benchmark: Chroma against the NumPy index variants on load time, memory and query latency. Each
+# backend is opened in a fresh interpreter so load time and memory are its own; recall@k is the
+# overlap with an exact float32 scan.
+BENCHMARK_K = 5
+
+
+# Resident memory now; peak resident memory where /proc is unavailable
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def probe_backend(backend: str, persist_directory: str, queries_path: str, k: int = BENCHMARK_K) -> Dict:
+    data = np.load(queries_path, allow_pickle=False)
+    queries, filters = data["vectors"], [json.loads(where) for where in data["filters"]]
+    from langchain_community.vectorstores import Chroma  # Imported before the baseline by both backends
+
+    from embedding_backends import HashingEmbeddings
+
+    embeddings = HashingEmbeddings(dimensions=queries.shape[1])
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    if backend == "chroma":
+        store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    else:
+        store = NumpyVectorStore(persist_directory, embeddings)
+    store.similarity_search_by_vector(queries[0].tolist(), k)
+    load_ms = (time.perf_counter() - start) * 1000
+    memory_mb = _rss_mb() - baseline
+
+    results = {"load_ms": load_ms, "memory_mb": memory_mb}
+    for name, use_filter in (("unfiltered", False), ("filtered", True)):
+        latencies, ids = [], []
+        for query, where in zip(queries, filters):
+            started = time.perf_counter()
+            docs = store.similarity_search_by_vector(query.tolist(), k, filter=where if use_filter else None)
+            latencies.append((time.perf_counter() - started) * 1000)
+            ids.append([doc.metadata.get("chunk") for doc in docs])
+        results[name] = {"p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95)),
+                         "ids": ids}
+    return results
+
+
+def _recall(found: List[List], exact: List[List]) -> float:
+    return float(np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(found, exact)]))
+
+
+def compare_backends(json_dir: str, dtypes: Sequence[str] = VECTOR_DTYPES, queries: int = 200,
+                     dimensions: int = 256) -> List[Dict]:
+    from embedding_backends import HashingEmbeddings
+    from retrieval_eval import generate_questions
+    from vectorstore import create_vector_store, preprocess_json_files
+
+    embeddings = HashingEmbeddings(dimensions=dimensions)
+    questions = generate_questions(json_dir)[:queries]
+    with tempfile.TemporaryDirectory() as workdir:
+        chroma_directory = os.path.join(workdir, "chroma")
+        documents = preprocess_json_files(json_dir)
+        for position, doc in enumerate(documents):
+            doc.metadata["chunk"] = position  # Lets the backends' results be compared
+        create_vector_store(documents, chroma_directory, embeddings)
+        vectors = embeddings.embed_documents([doc.page_content for doc in documents])
+        ids = [str(position) for position in range(len(documents))]
+
+        variants = {"chroma": chroma_directory}
+        for dtype in dtypes:
+            variants[f"numpy-{dtype}"] = os.path.join(workdir, dtype)
+            VectorIndex.build(ids, vectors, documents, dtype=dtype, index="flat").save(variants[f"numpy-{dtype}"])
+        variants["numpy-float32-ivf"] = os.path.join(workdir, "ivf")
+        VectorIndex.build(ids, vectors, documents, index="ivf").save(variants["numpy-float32-ivf"])
+
+        queries_path = os.path.join(workdir, "queries.npz")
+        np.savez(queries_path, vectors=np.array(embeddings.embed_documents([q.query for q in questions]),
+                                                dtype=np.float32),
+                 filters=np.array([json.dumps({"file": {"$in": sorted(q.files)}}) for q in questions]))
+        exact = VectorIndex.load(variants["numpy-float32"])
+        query_data = np.load(queries_path)
+        truth = {name: [[exact.metadatas[row]["chunk"] for row, _ in exact.search(query, BENCHMARK_K, where)]
+                        for query, where in zip(query_data["vectors"], filters)]
+                 for name, filters in (("unfiltered", [None] * len(questions)),
+                                       ("filtered", [json.loads(where) for where in query_data["filters"]]))}
+
+        rows = []
+        for name, directory in variants.items():
+            backend = "chroma" if name == "chroma" else "numpy"
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", backend, directory,
+                                     queries_path], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            disk = sum(os.path.getsize(os.path.join(root, file))
+                       for root, _, files in os.walk(directory) for file in files)
+            row = {"backend": name, "chunks": len(documents), "disk_mb": disk / 2 ** 20,
+                   "load_ms": result["load_ms"], "memory_mb": result["memory_mb"]}
+            for search in ("unfiltered", "filtered"):
+                row[f"{search}_p50_ms"] = result[search]["p50_ms"]
+                row[f"{search}_p95_ms"] = result[search]["p95_ms"]
+                row[f"{search}_recall"] = _recall(result[search]["ids"], truth[search])
+            rows.append(row)
+    return rows
+
+
+# Flat scan against IVF on random clustered vectors, to check where the IVF_THRESHOLD switch pays off
+def compare_scale(chunks: int, dimensions: int = 256, queries: int = 100, k: int = 10) -> Dict:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(16, chunks // 500), dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=chunks)] + rng.normal(scale=0.5, size=(chunks, dimensions))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    documents = [Document(page_content="", metadata={"file": f"label {i % 50}", "section": "s"}) for i in range(chunks)]
+    ids = [str(i) for i in range(chunks)]
+    query_vectors = vectors[rng.choice(chunks, queries, replace=False)] + rng.normal(scale=0.1, size=(queries, dimensions))
+
+    report = {"chunks": chunks}
+    results = {}
+    for kind in ("flat", "ivf"):
+        start = time.perf_counter()
+        index = VectorIndex.build(ids, vectors, documents, index=kind)
+        report[f"{kind}_build_s"] = time.perf_counter() - start
+        latencies, found = [], []
+        for query in query_vectors:
+            started = time.perf_counter()
+            found.append([str(index.ids[row]) for row, _ in index.search(query, k)])
+            latencies.append((time.perf_counter() - started) * 1000)
+        report[f"{kind}_p50_ms"] = float(np.percentile(latencies, 50))
+        results[kind] = found
+    report["ivf_recall"] = _recall(results["ivf"], results["flat"])
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--probe":
+        print(json.dumps(probe_backend(sys.argv[2], sys.argv[3], sys.argv[4])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy vector index against Chroma.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--dtypes", nargs="+", default=VECTOR_DTYPES, choices=VECTOR_DTYPES)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scale", type=int, nargs="*", default=[20_000, 100_000],
+                        help="Also compare flat and IVF search on this many synthetic vectors")
+    args = parser.parse_args()
+
+    import contextlib
+    print("[INFO] Indexing the labels with the hashing embedder...")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        rows = compare_backends(args.json_dir, args.dtypes, args.queries)
+    print(f"[INFO] {rows[0]['chunks']} chunks, {args.queries} queries, k={BENCHMARK_K}; recall is against an "
+          f"exact float32 scan")
+    print(f"{'backend':<20}{'disk MB':>9}{'load ms':>9}{'mem MB':>8}{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}"
+          f"{'filt p50':>10}{'filt p95':>10}{'recall':>8}")
+    for row in rows:
+        print(f"{row['backend']:<20}{row['disk_mb']:>9.1f}{row['load_ms']:>9.1f}{row['memory_mb']:>8.1f}"
+              f"{row['unfiltered_p50_ms']:>9.2f}{row['unfiltered_p95_ms']:>9.2f}{row['unfiltered_recall']:>8.3f}"
+              f"{row['filtered_p50_ms']:>10.2f}{row['filtered_p95_ms']:>10.2f}{row['filtered_recall']:>8.3f}")
+    for chunks in args.scale:
+        report = compare_scale(chunks)
+        print(f"[INFO] {chunks} synthetic chunks: flat {report['flat_p50_ms']:.2f} ms, IVF {report['ivf_p50_ms']:.2f} ms "
+              f"(recall@10 {report['ivf_recall']:.3f}, built in {report['ivf_build_s']:.1f}s)")
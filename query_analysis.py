@@ -0,0 +1,155 @@
+import os
+import re
+import difflib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from label_sections import canonical_section
+from vectorstore import MANIFEST_FILE, load_manifest
+
+# Words in label file names that don't identify a drug: dosage forms, salts, release types
+NON_DRUG_WORDS = {
+    "and", "for", "usp", "tablets", "tablet", "capsules", "capsule", "oral", "solution", "suspension",
+    "ophthalmic", "inhalation", "topical", "extended", "delayed", "release", "preservative", "free",
+    "hydrochloride", "dihydrochloride", "hcl", "sodium", "potassium", "calcium", "besylate", "medoxomil",
+    "maleate", "tromethamine", "propionate", "bromide", "hippurate", "acid",
+}
+
+# Query phrasings that ask about one canonical label section (see label_sections.CANONICAL_SECTIONS)
+SECTION_INTENTS = {
+    "adverse_reactions": r"side[- ]?effects?|adverse|reactions?",
+    "dosage": r"\bdos(e|es|age|ing)\b|how (much|many|often)|administer|when should i take|missed? (a )?dose",
+    "contraindications": r"contraindicat|who should not|shouldn'?t take|should not (take|use)",
+    "warnings": r"\bwarnings?\b|precautions?|\brisks?\b|dangerous|safe(ty)?\b",
+    "boxed_warning": r"boxed warning|black box",
+    "interactions": r"interact|together with|combined? with|alcohol|with other (drugs|medications)",
+    "specific_populations": r"pregnan|breast ?feed|lactat|nursing|child|pediatric|\bkids?\b|elderly|geriatric|"
+                            r"older adults|kidney|renal|liver|hepatic",
+    "overdosage": r"overdos|too much",
+    "description": r"ingredients?|composition|what is .* made of",
+    "clinical_pharmacology": r"mechanism|how does .* work|half[- ]life|pharmacokinetic|metabolized",
+    "how_supplied": r"stor(e|ed|age)|refrigerat|shelf life|supplied|packag",
+    "dosage_forms": r"strengths?|forms? (does|is) .* (come|available)",
+    "indications": r"used for|\bindicat|what does .* treat|approved for",
+}
+
+# Minimum similarity for a misspelt drug name to count as a match (difflib ratio)
+FUZZY_CUTOFF = 0.85
+
+
+@dataclass
+class QueryAnalysis:
+    files: List[str] = field(default_factory=list)
+    sections: List[str] = field(default_factory=list)
+    intents: List[str] = field(default_factory=list)
+    drug_terms: List[str] = field(default_factory=list)
+
+    # (files, sections) restrictions from most to least specific; the final (None, None) is unrestricted
+    def levels(self) -> List[Tuple[Optional[List[str]], Optional[List[str]]]]:
+        files, sections = self.files or None, self.sections or None
+        levels = []
+        if files and sections:
+            levels.append((files, sections))
+        if files or sections:
+            levels.append((files, None if files else sections))
+        return levels + [(None, None)]
+
+    # The same levels as Chroma `where` filters
+    def filters(self) -> List[Optional[Dict]]:
+        filters = []
+        for files, sections in self.levels():
+            clauses = ([{"file": {"$in": files}}] if files else []) + \
+                      ([{"section": {"$in": sections}}] if sections else [])
+            filters.append({"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else None))
+        return filters
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+# Detects which labels (drug files) and which label sections a query is about, from the
+# file and section names present in the index
+class QueryAnalyzer:
+    def __init__(self, files: Iterable[str], sections: Iterable[str]):
+        self.files_by_term: Dict[str, Set[str]] = {}
+        for file in set(files):
+            for word in _words(file):
+                if len(word) >= 4 and not word.isdigit() and word not in NON_DRUG_WORDS:
+                    self.files_by_term.setdefault(word, set()).add(file)
+        self.terms = sorted(self.files_by_term)
+
+        self.sections_by_intent: Dict[str, List[str]] = {}
+        for section in sorted(set(sections)):
+            canonical = canonical_section(section)
+            if canonical:
+                self.sections_by_intent.setdefault(canonical, []).append(section)
+
+    @classmethod
+    def from_manifest(cls, persist_directory: str) -> "QueryAnalyzer":
+        chunks = load_manifest(persist_directory).values()
+        return cls([chunk["file"] for chunk in chunks], [chunk["section"] for chunk in chunks])
+
+    # Drug names mentioned in the query, tolerating misspellings ("metfromin")
+    def match_drug_terms(self, query: str) -> List[str]:
+        matched = []
+        for word in _words(query):
+            if len(word) < 4 or word in NON_DRUG_WORDS:
+                continue
+            if word in self.files_by_term:
+                term = word
+            else:
+                close = difflib.get_close_matches(word, self.terms, n=1, cutoff=FUZZY_CUTOFF) if len(word) >= 5 else []
+                term = close[0] if close else None
+            if term and term not in matched:
+                matched.append(term)
+        return matched
+
+    def analyze(self, query: str) -> QueryAnalysis:
+        terms = self.match_drug_terms(query)
+
+        # Prefer the labels naming the most matched drugs, so "amlodipine and olmesartan" picks the
+        # combination product while "aspirin vs metformin" keeps both
+        scores: Dict[str, int] = {}
+        for term in terms:
+            for file in self.files_by_term[term]:
+                scores[file] = scores.get(file, 0) + 1
+        best = max(scores.values(), default=0)
+        files = sorted(file for file, score in scores.items() if score == best)
+
+        lowered = query.lower()
+        intents = [intent for intent, pattern in SECTION_INTENTS.items()
+                   if intent in self.sections_by_intent and re.search(pattern, lowered)]
+        sections = [section for intent in intents for section in self.sections_by_intent[intent]]
+        return QueryAnalysis(files=files, sections=sections, intents=intents, drug_terms=terms)
+
+
+# Analyzers are rebuilt only when the index manifest changes
+_analyzers: Dict[str, Tuple[float, QueryAnalyzer]] = {}
+_analyzers_lock = threading.Lock()
+
+
+def get_query_analyzer(persist_directory: str) -> QueryAnalyzer:
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else 0.0
+    with _analyzers_lock:
+        cached = _analyzers.get(persist_directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, QueryAnalyzer.from_manifest(persist_directory))
+            _analyzers[persist_directory] = cached
+        return cached[1]
+
+
+# Vector search restricted by the query analysis. Filters are relaxed step by step
+# (drug + section, then drug only, then none) until k chunks are found.
+def filtered_search(vector_store, embedding: List[float], k: int, analysis: QueryAnalysis):
+    docs, seen = [], set()
+    for where in analysis.filters():
+        for doc in vector_store.similarity_search_by_vector(embedding, k, filter=where):
+            key = (doc.metadata.get("file"), doc.metadata.get("section"), doc.page_content)
+            if key not in seen:
+                seen.add(key)
+                docs.append(doc)
+        if len(docs) >= k:
+            break
+    return docs[:k]
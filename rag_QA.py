@@ -1,47 +1,25 @@
 import os
-from langchain_community.vectorstores import Chroma
 from langchain.chains import RetrievalQA
-from langchain.llms.base import LLM
-from langchain_openai.embeddings import OpenAIEmbeddings
-from pydantic import Field
-import requests
-from typing import Dict, Any
+from embedding_cache import DEFAULT_CACHE_PATH
+from llm_client import LMStudioLLM
+from hybrid_retriever import get_retriever
+from vectorstore import open_vector_store
 
 
-# Custom LLM integration with LMStudio
-class LMStudioLLM(LLM):
-    endpoint: str = Field(...)  # Declare endpoint as a required field
-
-    def __init__(self, endpoint: str):
-        super().__init__(endpoint=endpoint)
-
-    def _call(self, prompt: str, stop: None = None, **kwargs: Any) -> str:
-        response = requests.post(
-            f"{self.endpoint}/v1/chat/completions",
-            json={
-                "model": "llama-3.2-3b-instruct",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 300,
-            },
-        )
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        else:
-            raise Exception(f"LLM Error: {response.status_code} - {response.text}")
-
-    @property
-    def _llm_type(self) -> str:
-        return "lmstudio"
-
-    @property
-    def _identifying_params(self) -> Dict[str, Any]:
-        return {"endpoint": self.endpoint}
+# Sample questions, also replayed by benchmark.py
+SAMPLE_QUERIES = [
+    "What is the composition and primary use of Acetominophen?",
+    "Can you list the side effects of Ibuprofen?",
+    "What are the contraindications for Aspirin?",
+    "How should Metformin be administered?",
+    "What are the inactive ingredients in Travoprost Ophthalmic Solution?",
+]
 
 
 # Test RAG Pipeline
-def test_rag_pipeline(qa_chain, query):
+def test_rag_pipeline(qa_chain, query, callbacks=None):
     print(f"\n[QUERY] {query}")
-    response = qa_chain.invoke({"query": query})
+    response = qa_chain.invoke({"query": query}, config={"callbacks": callbacks})
     result = response["result"]
     source_docs = response["source_documents"]
 
@@ -49,6 +27,7 @@ def test_rag_pipeline(qa_chain, query):
     print("[SOURCES]")
     for doc in source_docs:
         print(f"  - Section: {doc.metadata['section']}, File: {doc.metadata['file']}")
+    return result
 
 
 if __name__ == "__main__":
@@ -58,27 +37,18 @@ if __name__ == "__main__":
 
     # Load Vector Store
     print("[INFO] Loading vector store...")
-    embeddings = OpenAIEmbeddings()  # Use the same embedding function as during vector store creation
-    vector_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    vector_store = open_vector_store(persist_directory, cache_path=DEFAULT_CACHE_PATH)  # Embedded with the store's own backend (and the shared cache)
     print("[INFO] Vector store loaded successfully.")
 
     # Initialize LLM and RetrievalQA
     print("[INFO] Initializing LLM and RAG pipeline...")
-    llm = LMStudioLLM(endpoint=lmstudio_endpoint)
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+    llm = LMStudioLLM(endpoint=lmstudio_endpoint, max_tokens=300)
+    retriever = get_retriever(vector_store, k=5)  # Hybrid BM25 + vector search when the keyword index exists
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm, retriever=retriever, return_source_documents=True
     )
     print("[INFO] RAG pipeline initialized successfully.")
 
     # Test Queries
-    sample_queries = [
-        "What is the composition and primary use of Acetominophen?",
-        "Can you list the side effects of Ibuprofen?",
-        "What are the contraindications for Aspirin?",
-        "How should Metformin be administered?",
-        "What are the inactive ingredients in Travoprost Ophthalmic Solution?",
-    ]
-
-    for query in sample_queries:
+    for query in SAMPLE_QUERIES:
         test_rag_pipeline(qa_chain, query)
@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from attribute_index import build_attribute_index, save_attribute_index
+from drug_graph import DrugGraph
+from embedding_backends import EMBEDDING_BACKENDS, get_embeddings
+from embedding_cache import DEFAULT_CACHE_PATH
+from label_chunker import load_token_encoding
+from vectorstore import load_manifest, preprocess_json_files, store_embeddings, update_vector_store
+
+# Per-label section hashes of the last indexed version, kept next to the index manifest
+LABEL_VERSIONS_FILE = "label_versions.json"
+
+# "Updated April 24, 2023" / "Revised: 3/2022" stamps printed in the label text
+_UPDATED_STAMP = re.compile(r"\b(?:Updated|Revised):?\s+((?:[A-Z][a-z]+\.? \d{1,2}, \d{4})|(?:\d{1,2}/\d{4}))")
+
+
+def label_name(file_name: str) -> str:
+    return file_name.split(".json")[0]
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+# Version record of one scraped label: a hash per section plus the label's own "Updated" stamp
+def label_version(data: Dict) -> Dict:
+    sections = {section: _hash(content) for section, content in data.items()
+                if isinstance(content, str) and content.strip() and section != "product_name"}
+    stamp = None
+    for content in data.values():
+        match = _UPDATED_STAMP.search(content) if isinstance(content, str) else None
+        if match:
+            stamp = match.group(1)
+            break
+    return {"updated": stamp, "sections": sections}
+
+
+def diff_label(old: Optional[Dict], new: Optional[Dict]) -> Dict:
+    old_sections = (old or {}).get("sections", {})
+    new_sections = (new or {}).get("sections", {})
+    diff = {
+        "added": sorted(set(new_sections) - set(old_sections)),
+        "removed": sorted(set(old_sections) - set(new_sections)),
+        "changed": sorted(section for section in set(old_sections) & set(new_sections)
+                          if old_sections[section] != new_sections[section]),
+    }
+    if old is None:
+        diff["status"] = "new"
+    elif new is None:
+        diff["status"] = "removed"
+    else:
+        diff["status"] = "changed" if any(diff.values()) else "unchanged"
+    if old and new and old.get("updated") != new.get("updated"):
+        diff["updated"] = [old.get("updated"), new.get("updated")]
+    return diff
+
+
+def load_label_versions(persist_directory: str) -> Dict[str, Dict]:
+    path = os.path.join(persist_directory, LABEL_VERSIONS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_label_versions(persist_directory: str, versions: Dict[str, Dict]):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, LABEL_VERSIONS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(versions, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def scan_label_versions(json_dir: str) -> Dict[str, Dict]:
+    versions = {}
+    for file_name in sorted(os.listdir(json_dir)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+                versions[label_name(file_name)] = label_version(json.load(f))
+    return versions
+
+
+# Scrape -> diff -> index. Each label JSON is compared section by section with the version indexed
+# last time; only labels with a new, changed or removed section are chunked and handed to the
+# incremental indexer, which re-embeds just the chunks whose content changed.
+def refresh(json_dir: str, persist_directory: str, embeddings, urls_map: Optional[Dict[str, str]] = None,
+            crawler=None, dry_run: bool = False, batch_size: int = 64, max_workers: int = 4) -> Dict:
+    start_time = time.time()
+    report = {"started_at": datetime.now(timezone.utc).isoformat()}
+    if crawler is not None and urls_map:
+        print("[INFO] Scraping labels...")
+        report["scrape"] = crawler.crawl(urls_map, json_dir)["counts"]
+
+    # Versions only describe an index that exists; a missing or flushed store is rebuilt from every label
+    previous = load_label_versions(persist_directory) if load_manifest(persist_directory) else {}
+    current = scan_label_versions(json_dir)
+    labels = {}
+    for name in sorted(set(previous) | set(current)):
+        diff = diff_label(previous.get(name), current.get(name))
+        if diff["status"] != "unchanged":
+            labels[name] = diff
+    report["labels"] = labels
+    report["counts"] = {status: sum(1 for diff in labels.values() if diff["status"] == status)
+                        for status in ("new", "changed", "removed")}
+    report["counts"]["unchanged"] = len(current) - report["counts"]["new"] - report["counts"]["changed"]
+    report["sections_changed"] = sum(len(diff["added"]) + len(diff["removed"]) + len(diff["changed"])
+                                     for diff in labels.values())
+
+    for name, diff in labels.items():
+        detail = f"{len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['removed'])} removed sections"
+        stamp = f" (updated {diff['updated'][0]} -> {diff['updated'][1]})" if "updated" in diff else ""
+        print(f"[INFO] {diff['status'].upper():<8} {name}: {detail}{stamp}")
+    print(f"[INFO] Labels: {report['counts']}")
+
+    if labels and not dry_run:
+        files = set(labels)
+        documents = preprocess_json_files(json_dir, files=files)
+        _, report["index"] = update_vector_store(documents, persist_directory, embeddings, batch_size=batch_size,
+                                                 max_workers=max_workers, files=files)
+        save_label_versions(persist_directory, current)
+        save_attribute_index(persist_directory, build_attribute_index(json_dir))
+        DrugGraph.build(json_dir).save(persist_directory)
+    elif not labels:
+        print("[INFO] No label changes; index left as is.")
+    report["seconds"] = round(time.time() - start_time, 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the labels, diff them against the indexed versions "
+                                                 "and re-index only what changed.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--no-scrape", action="store_true", help="Diff and index the JSON files already on disk")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent product crawls")
+    parser.add_argument("--min-interval", type=float, default=1.0, help="Seconds between requests to one host")
+    parser.add_argument("--cache-dir", default="./http_cache", help="On-disk HTTP cache for conditional requests")
+    parser.add_argument("--embedding-backend", default=None, choices=EMBEDDING_BACKENDS,
+                        help="Defaults to the backend the store was built with")
+    parser.add_argument("--embedding-cache", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--no-embedding-cache", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="Report the changes without touching the index")
+    parser.add_argument("--report", default=None, help="Write the change report to this JSON file")
+    args = parser.parse_args()
+
+    load_token_encoding(download=True)
+    crawler, urls_map = None, None
+    if not args.no_scrape:
+        from crawler import Crawler
+        from web_scrapper import URLS
+        crawler, urls_map = Crawler(args.cache_dir, max_workers=args.workers, min_interval=args.min_interval), URLS
+    cache_path = None if args.no_embedding_cache else args.embedding_cache
+    embeddings = (get_embeddings(args.embedding_backend, cache_path=cache_path) if args.embedding_backend
+                  else store_embeddings(args.persist_directory, cache_path=cache_path))
+
+    report = refresh(args.json_dir, args.persist_directory, embeddings, urls_map=urls_map, crawler=crawler,
+                     dry_run=args.dry_run)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Change report written to {args.report}")
+    print(f"[INFO] Refresh complete in {report['seconds']}s.")
@@ -0,0 +1,155 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+from langchain.schema import Document
+
+from bm25_index import tokenize
+from label_chunker import count_tokens, split_sentences
+from label_sections import canonical_section
+from query_analysis import QueryAnalysis
+
+# Candidates fetched per tool before reranking, and the context token budget the packed chunks must fit
+RERANK_FETCH_K = {"Summarizer": 12, "Recommender": 15, "QA": 12}
+CONTEXT_TOKEN_BUDGET = {"Summarizer": 500, "Recommender": 700, "QA": 400}
+
+# Trade-off between relevance and novelty in maximal marginal relevance
+MMR_LAMBDA = 0.7
+# Weights of the relevance signals: retrieval rank, query-term coverage, section prior, drug-name match
+RANK_WEIGHT, COVERAGE_WEIGHT, SECTION_WEIGHT, DRUG_WEIGHT = 0.3, 0.3, 0.4, 0.3
+# A sentence whose words are this much contained in a sentence already packed is dropped
+REDUNDANT_SENTENCE_OVERLAP = 0.8
+# Don't bother packing a partial chunk into less room than this
+MIN_PARTIAL_TOKENS = 40
+
+# How useful each canonical label section usually is to a tool; sections not listed get 0.3
+SECTION_PRIORS = {
+    "Summarizer": {"indications": 1.0, "dosage": 0.9, "boxed_warning": 0.9, "contraindications": 0.8,
+                   "warnings": 0.8, "adverse_reactions": 0.7, "description": 0.5, "how_supplied": 0.1,
+                   "references": 0.0},
+    "Recommender": {"indications": 1.0, "contraindications": 0.9, "interactions": 0.9, "warnings": 0.7,
+                    "specific_populations": 0.7, "clinical_studies": 0.5, "how_supplied": 0.1, "references": 0.0},
+    "QA": {"references": 0.0, "how_supplied": 0.3},
+}
+DEFAULT_SECTION_PRIOR = 0.3
+
+
+@dataclass
+class PackedContext:
+    documents: List[Document] = field(default_factory=list)
+    tokens: int = 0
+    baseline_tokens: int = 0
+    baseline_k: int = 0
+    candidates: int = 0
+    dropped_sentences: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+
+def _terms(text: str) -> Set[str]:
+    return {token for token in tokenize(text) if len(token) > 2 and not token.isdigit()}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def section_of(doc: Document) -> Optional[str]:
+    # Chunks of the run-on "Drug Label Information" residual carry the real heading in section_path
+    path = doc.metadata.get("section_path") or ""
+    return canonical_section(path.split(" > ")[0]) or canonical_section(doc.metadata.get("section", ""))
+
+
+# Section prior for the tool; a section the query asks about ("side effects" -> adverse_reactions) scores 1
+def section_prior(doc: Document, tool_name: str, analysis: Optional[QueryAnalysis] = None) -> float:
+    section = section_of(doc)
+    if analysis and section in analysis.intents:
+        return 1.0
+    return SECTION_PRIORS.get(tool_name, {}).get(section, DEFAULT_SECTION_PRIOR)
+
+
+def drug_match(doc: Document, analysis: Optional[QueryAnalysis]) -> float:
+    if not analysis or not (analysis.files or analysis.drug_terms):
+        return 0.0
+    if doc.metadata.get("file") in analysis.files:
+        return 1.0
+    text = doc.page_content.lower()
+    return 0.5 if any(re.search(rf"\b{re.escape(term)}", text) for term in analysis.drug_terms) else 0.0
+
+
+# Rerank retrieved candidates (in retrieval order) with maximal marginal relevance over cheap local
+# signals: retrieval rank, query-term coverage, section priors and exact drug-name matches for relevance,
+# word-set Jaccard between chunks for redundancy.
+def rerank(query: str, docs: List[Document], tool_name: str, analysis: Optional[QueryAnalysis] = None,
+           mmr_lambda: float = MMR_LAMBDA) -> List[Document]:
+    if len(docs) <= 1:
+        return list(docs)
+    query_terms = _terms(query)
+    doc_terms = [_terms(doc.page_content) for doc in docs]
+    relevance = []
+    for rank, (doc, terms) in enumerate(zip(docs, doc_terms)):
+        coverage = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+        relevance.append(RANK_WEIGHT * (1 - rank / len(docs)) + COVERAGE_WEIGHT * coverage
+                         + SECTION_WEIGHT * section_prior(doc, tool_name, analysis)
+                         + DRUG_WEIGHT * drug_match(doc, analysis))
+
+    selected: List[int] = []
+    remaining = list(range(len(docs)))
+    while remaining:
+        def mmr(i):
+            redundancy = max((_jaccard(doc_terms[i], doc_terms[j]) for j in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr)
+        selected.append(best)
+        remaining.remove(best)
+    return [docs[i] for i in selected]
+
+
+# Greedy packing into a token budget. Sentences that repeat one already packed (the same warning in the
+# Highlights and in the full section, say) are trimmed; a chunk that doesn't fit whole contributes the
+# sentences that do, and packing stops once the budget is used up.
+def pack_context(docs: List[Document], budget: int) -> PackedContext:
+    packed = PackedContext(candidates=len(docs))
+    seen_sentences: List[Set[str]] = []
+    for doc in docs:
+        kept, kept_tokens, truncated = [], 0, False
+        for sentence in split_sentences(doc.page_content):
+            terms = _terms(sentence)
+            if terms and any(len(terms & other) >= REDUNDANT_SENTENCE_OVERLAP * len(terms) for other in seen_sentences):
+                packed.dropped_sentences += 1
+                continue
+            tokens = count_tokens(sentence)
+            if packed.tokens + kept_tokens + tokens > budget:
+                truncated = True
+                break
+            kept.append(sentence)
+            kept_tokens += tokens
+            seen_sentences.append(terms)
+
+        if kept and (not truncated or kept_tokens >= MIN_PARTIAL_TOKENS or not packed.documents):
+            packed.documents.append(Document(page_content=" ".join(kept), metadata=dict(doc.metadata)))
+            packed.tokens += kept_tokens
+        if budget - packed.tokens < MIN_PARTIAL_TOKENS:
+            break
+    return packed
+
+
+# Rerank over-fetched candidates and pack them into the tool's budget, measuring the saving against what
+# the tool used to send: the top `baseline_k` retrieved chunks, untrimmed. The packed context is never
+# larger than that baseline.
+def rerank_and_pack(query: str, docs: List[Document], tool_name: str, baseline_k: int,
+                    analysis: Optional[QueryAnalysis] = None, budget: Optional[int] = None) -> PackedContext:
+    baseline_tokens = sum(count_tokens(doc.page_content) for doc in docs[:baseline_k])
+    budget = min(budget or CONTEXT_TOKEN_BUDGET[tool_name], baseline_tokens or CONTEXT_TOKEN_BUDGET[tool_name])
+    packed = pack_context(rerank(query, docs, tool_name, analysis), budget)
+    packed.baseline_k = min(baseline_k, len(docs))
+    packed.baseline_tokens = baseline_tokens
+    return packed
+
+
+def context_report(tool_name: str, packed: PackedContext) -> str:
+    return (f"[INFO] {tool_name} context: {len(packed.documents)}/{packed.candidates} chunks, {packed.tokens} tokens "
+            f"({packed.tokens_saved} saved vs. the top {packed.baseline_k} chunks, "
+            f"{packed.dropped_sentences} redundant sentences trimmed)")
@@ -0,0 +1,122 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+# Normalise a query for exact matching: case, punctuation and whitespace are ignored
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+# Semantic response cache placed in front of query classification and tool dispatch.
+# Entries are keyed by (corpus version, tool, normalised query). A lookup first tries an exact
+# match on the normalised query and then the closest cached query by cosine similarity.
+# Entries expire after `ttl_seconds`, and the least recently used entry is evicted past `max_entries`.
+class ResponseCache:
+    def __init__(self, embeddings=None, similarity_threshold: float = 0.95,
+                 ttl_seconds: float = 3600, max_entries: int = 500):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    # Embeds the raw query, so with a CachedEmbeddings backend the retriever's own embedding of
+    # the same query is a cache hit rather than a second API call
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    # Numbers (doses, strengths, ages) must match exactly for a semantic hit:
+    # "250 mg" and "500 mg" questions embed almost identically but need different answers
+    @staticmethod
+    def _numbers(normalized: str):
+        return set(re.findall(r"\d+(?:\.\d+)?", normalized))
+
+    def get(self, query: str, corpus_version: str, tool: str = None) -> Optional[Dict[str, Any]]:
+        normalized = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if key[0] == corpus_version and (tool is None or key[1] == tool)]
+            for key, entry in candidates:
+                if key[2] == normalized:
+                    return self._hit(key, entry, "exact")
+
+        if not candidates or self.embeddings is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        vector = self._embed(query)
+        numbers = self._numbers(normalized)
+        best_key, best_entry, best_score = None, None, -1.0
+        for key, entry in candidates:
+            if entry["embedding"] is None or self._numbers(key[2]) != numbers:
+                continue
+            score = float(np.dot(vector, entry["embedding"]))
+            if score > best_score:
+                best_key, best_entry, best_score = key, entry, score
+
+        with self._lock:
+            if best_entry is not None and best_score >= self.similarity_threshold and best_key in self._entries:
+                return self._hit(best_key, best_entry, "semantic", best_score)
+            self.misses += 1
+        return None
+
+    def _hit(self, key, entry, match: str, score: float = 1.0) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        if match == "exact":
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+        self.latency_saved += entry["latency"]
+        return {"response": entry["response"], "tool": key[1], "match": match,
+                "score": round(score, 4), "latency_saved": entry["latency"]}
+
+    def put(self, query: str, corpus_version: str, tool: str, response: str, latency: float = 0.0):
+        normalized = normalize_query(query)
+        embedding = self._embed(query)
+        with self._lock:
+            key = (corpus_version, tool, normalized)
+            self._entries[key] = {"response": response, "embedding": embedding,
+                                  "created": time.time(), "latency": latency}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tool: str = None, corpus_version: str = None):
+        with self._lock:
+            for key in list(self._entries):
+                if (tool is None or key[1] == tool) and (corpus_version is None or key[0] == corpus_version):
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "latency_saved": round(self.latency_saved, 2),
+        }
@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from attribute_index import label_attributes
+from embedding_backends import EMBEDDING_BACKENDS
+from hybrid_retriever import get_store_bm25_index, hybrid_search
+from label_chunker import MAX_CHUNK_TOKENS, count_tokens
+from query_analysis import NON_DRUG_WORDS, filtered_search, get_query_analyzer
+from reranker import RERANK_FETCH_K, rerank_and_pack, section_of
+
+# One question per canonical section (label_sections.CANONICAL_SECTIONS) a label has
+QUESTION_TEMPLATES = {
+    "boxed_warning": "What is the boxed warning for {drug}?",
+    "indications": "What is {drug} used for?",
+    "dosage": "What is the recommended dose of {drug}?",
+    "dosage_forms": "What strengths does {drug} come in?",
+    "contraindications": "Who should not take {drug}?",
+    "warnings": "What are the warnings and precautions for {drug}?",
+    "adverse_reactions": "What are the side effects of {drug}?",
+    "interactions": "What drugs interact with {drug}?",
+    "specific_populations": "Can {drug} be used during pregnancy or breastfeeding?",
+    "abuse": "Can {drug} cause dependence?",
+    "overdosage": "What happens in an overdose of {drug}?",
+    "description": "What are the ingredients of {drug}?",
+    "clinical_pharmacology": "How does {drug} work in the body?",
+    "clinical_studies": "What clinical studies were done on {drug}?",
+    "how_supplied": "How should {drug} be stored?",
+    "patient_counseling": "What should patients be told before taking {drug}?",
+}
+
+# Retriever configurations, each called as (store, query, embedding, k) -> documents
+RETRIEVERS = ["vector", "filtered", "hybrid", "hybrid_filtered", "reranked"]
+DEFAULT_K = [3, 5, 8]
+# "Keeps recall": within this much of the best recall seen
+RECALL_TOLERANCE = 0.02
+
+
+@dataclass
+class EvalQuestion:
+    query: str
+    drug: str
+    files: Set[str]
+    section: str
+
+
+# The drug a label is about, as a user would name it ("Amlodipine Besylate and Olmesartan Medoxomil
+# Tablets" -> "amlodipine and olmesartan"); the same words the query analyzer matches labels by
+def drug_phrase(file: str) -> str:
+    words = [word for word in re.findall(r"[a-z]+", file.lower()) if len(word) >= 4 and word not in NON_DRUG_WORDS]
+    return " and ".join(dict.fromkeys(words))
+
+
+# drug x section questions from the label JSONs; labels of the same drug (several forms or
+# strengths) share their questions, and any of them answers
+def generate_questions(json_dir: str, sections: Optional[Sequence[str]] = None) -> List[EvalQuestion]:
+    by_key: Dict[tuple, EvalQuestion] = {}
+    for file_name in sorted(os.listdir(json_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+            attributes = label_attributes(json.load(f))
+        file = file_name.split(".json")[0]
+        drug = drug_phrase(file)
+        for section in attributes:
+            if section not in QUESTION_TEMPLATES or (sections and section not in sections) or not drug:
+                continue
+            question = by_key.setdefault((drug, section), EvalQuestion(
+                query=QUESTION_TEMPLATES[section].format(drug=drug), drug=drug, files=set(), section=section))
+            question.files.add(file)
+    return list(by_key.values())
+
+
+class StoreRetrievers:
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.index = get_store_bm25_index(vector_store)
+        self.analyzer = get_query_analyzer(vector_store._persist_directory)
+
+    def get(self, name: str) -> Callable:
+        if name in ("hybrid", "hybrid_filtered", "reranked") and self.index is None:
+            raise Exception(f"[ERROR] Retriever {name} needs the store's BM25 index.")
+        return getattr(self, name)
+
+    def vector(self, query, embedding, k):
+        return self.vector_store.similarity_search_by_vector(embedding, k)
+
+    def filtered(self, query, embedding, k):
+        return filtered_search(self.vector_store, embedding, k, self.analyzer.analyze(query))
+
+    def hybrid(self, query, embedding, k):
+        return hybrid_search(self.vector_store, self.index, query, embedding, k)
+
+    def hybrid_filtered(self, query, embedding, k):
+        return hybrid_search(self.vector_store, self.index, query, embedding, k, self.analyzer.analyze(query))
+
+    # The QA tool's path: over-fetch, rerank and pack into no more than the top-k's tokens
+    def reranked(self, query, embedding, k):
+        analysis = self.analyzer.analyze(query)
+        docs = hybrid_search(self.vector_store, self.index, query, embedding, max(k, RERANK_FETCH_K["QA"]), analysis)
+        return rerank_and_pack(query, docs, "QA", k, analysis).documents
+
+
+@dataclass
+class EvalResult:
+    store: str
+    retriever: str
+    k: int
+    questions: int = 0
+    recall: float = 0.0
+    drug_recall: float = 0.0
+    mrr: float = 0.0
+    context_tokens: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    misses: List[str] = field(default_factory=list)
+
+
+def evaluate(retrieve: Callable, questions: List[EvalQuestion], embeddings: List[List[float]], k: int,
+             store: str, retriever: str) -> EvalResult:
+    hits, drug_hits, reciprocal_ranks, tokens, latencies, misses = 0, 0, [], [], [], []
+    for question, embedding in zip(questions, embeddings):
+        start = time.perf_counter()
+        docs = retrieve(question.query, embedding, k)[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranks = [rank for rank, doc in enumerate(docs, 1)
+                 if doc.metadata.get("file") in question.files and section_of(doc) == question.section]
+        hits += bool(ranks)
+        drug_hits += any(doc.metadata.get("file") in question.files for doc in docs)
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        tokens.append(sum(count_tokens(doc.page_content) for doc in docs))
+        if not ranks:
+            misses.append(question.query)
+    count = max(len(questions), 1)
+    return EvalResult(store=store, retriever=retriever, k=k, questions=len(questions), recall=hits / count,
+                      drug_recall=drug_hits / count, mrr=float(np.mean(reciprocal_ranks or [0.0])),
+                      context_tokens=float(np.mean(tokens or [0.0])),
+                      p50_ms=float(np.percentile(latencies, 50)) if latencies else 0.0,
+                      p95_ms=float(np.percentile(latencies, 95)) if latencies else 0.0, misses=misses)
+
+
+def run_evaluation(vector_store, questions: List[EvalQuestion], retrievers: Sequence[str], ks: Sequence[int],
+                   store: str) -> List[EvalResult]:
+    store_retrievers = StoreRetrievers(vector_store)
+    # Questions are embedded once per store; retrieval latency excludes the embedding call
+    embeddings = vector_store.embeddings.embed_documents([question.query for question in questions])
+    results = []
+    for name in retrievers:
+        retrieve = store_retrievers.get(name)
+        for k in ks:
+            results.append(evaluate(retrieve, questions, embeddings, k, store, name))
+    return results
+
+
+# The cheapest configuration that keeps recall: fewest context tokens, then lowest latency, among
+# those within RECALL_TOLERANCE of the best recall
+def pick_configuration(results: List[EvalResult], tolerance: float = RECALL_TOLERANCE) -> Optional[EvalResult]:
+    if not results:
+        return None
+    best = max(result.recall for result in results)
+    keeping = [result for result in results if result.recall >= best - tolerance]
+    return min(keeping, key=lambda result: (result.context_tokens, result.p50_ms))
+
+
+def results_table(results: List[EvalResult]) -> str:
+    lines = [f"{'store':<22}{'retriever':<17}{'k':>3}{'recall':>9}{'drug':>8}{'MRR':>8}{'tokens':>9}"
+             f"{'p50 ms':>9}{'p95 ms':>9}"]
+    for result in results:
+        lines.append(f"{result.store[:21]:<22}{result.retriever:<17}{result.k:>3}{result.recall:>9.3f}"
+                     f"{result.drug_recall:>8.3f}{result.mrr:>8.3f}{result.context_tokens:>9.0f}"
+                     f"{result.p50_ms:>9.1f}{result.p95_ms:>9.1f}")
+    return "\n".join(lines)
+
+
+# A throwaway store built with the given chunk budget, to compare chunk sizes on the same questions
+def build_store(json_dir: str, persist_directory: str, embeddings, max_chunk_tokens: int):
+    from vectorstore import create_vector_store, preprocess_json_files
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        documents = preprocess_json_files(json_dir, max_chunk_tokens=max_chunk_tokens)
+        return create_vector_store(documents, persist_directory, embeddings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k, MRR, context tokens and latency of retriever "
+                                                 "configurations on generated drug x section questions.")
+    parser.add_argument("--json-dir", default="datasets/microlabs_usa")
+    parser.add_argument("--persist-directory", nargs="+", default=["./chroma_db"],
+                        help="Stores to evaluate, each queried with the embeddings it was built with")
+    parser.add_argument("--build-chunk-tokens", type=int, nargs="*", default=None,
+                        help=f"Instead, build throwaway stores with these chunk budgets (default {MAX_CHUNK_TOKENS})")
+    parser.add_argument("--embedding-backend", default=None, choices=EMBEDDING_BACKENDS,
+                        help="Embeddings for --build-chunk-tokens stores (default openai)")
+    parser.add_argument("--vector-backend", default="chroma", choices=["chroma", "numpy"],
+                        help="Search --persist-directory stores with Chroma or their NumPy index")
+    parser.add_argument("--retrievers", nargs="+", default=RETRIEVERS, choices=RETRIEVERS)
+    parser.add_argument("--k", type=int, nargs="+", default=DEFAULT_K)
+    parser.add_argument("--sections", nargs="*", default=None, help="Only questions about these canonical sections")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate a random sample of this many questions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    parser.add_argument("--show-misses", type=int, default=0, help="Print this many missed questions per row")
+    args = parser.parse_args()
+
+    from embedding_backends import get_embeddings
+    from embedding_cache import DEFAULT_CACHE_PATH
+    from vectorstore import open_vector_store
+
+    questions = generate_questions(args.json_dir, args.sections)
+    if args.limit and args.limit < len(questions):
+        questions = random.Random(args.seed).sample(questions, args.limit)
+    print(f"[INFO] {len(questions)} questions over {len({question.drug for question in questions})} drugs.")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.build_chunk_tokens is not None:
+            backend = args.embedding_backend or "openai"
+            embeddings = get_embeddings(backend, cache_path=DEFAULT_CACHE_PATH if backend != "hashing" else None)
+            stores = []
+            for max_chunk_tokens in args.build_chunk_tokens or [MAX_CHUNK_TOKENS]:
+                print(f"[INFO] Building a store with {max_chunk_tokens}-token chunks...")
+                persist_directory = os.path.join(workdir, f"chunks_{max_chunk_tokens}")
+                stores.append((f"chunks={max_chunk_tokens}",
+                               build_store(args.json_dir, persist_directory, embeddings, max_chunk_tokens)))
+        else:
+            stores = [(persist_directory, open_vector_store(persist_directory, cache_path=DEFAULT_CACHE_PATH,
+                                                            backend=args.vector_backend))
+                      for persist_directory in args.persist_directory]
+        for name, vector_store in stores:
+            print(f"[INFO] Evaluating {name}...")
+            results += run_evaluation(vector_store, questions, args.retrievers, args.k, name)
+
+    print(results_table(results))
+    for result in results:
+        for query in result.misses[:args.show_misses]:
+            print(f"[INFO]   miss ({result.store} {result.retriever}@{result.k}): {query}")
+    choice = pick_configuration(results)
+    if choice:
+        print(f"[INFO] Smallest configuration within {RECALL_TOLERANCE:.0%} of the best recall: {choice.store} "
+              f"{choice.retriever}@{choice.k} (recall {choice.recall:.3f}, {choice.context_tokens:.0f} tokens, "
+              f"p50 {choice.p50_ms:.1f} ms)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([vars(result) for result in results], f, indent=1)
+        print(f"[INFO] Results written to {args.output}")
@@ -0,0 +1,253 @@
+import re
+import json
+import time
+import zlib
+import argparse
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.llms.base import LLM
+
+from tracing import annotate
+
+VALID_TOOLS = {"Summarizer", "Recommender", "QA", "Alternative Search"}
+QUESTION_WORDS = ["what", "how", "when", "where", "why", "who", "can", "is", "are", "do", "does", "did", "list", "which", "whom", "whose"]
+
+INTENT_TRAIN_FILE = "datasets/intent/train.json"
+INTENT_EVAL_FILE = "datasets/intent/eval.json"
+
+# Below this confidence the local classifier defers to the LLM
+CONFIDENCE_THRESHOLD = 0.4
+# A tool name is at most a few tokens; the escalation call doesn't need the default 1000
+ROUTER_MAX_TOKENS = 8
+
+CLASSIFIER_PROMPT = """
+You are an intelligent query classifier for an agent application. The application has four tools:
+1. Summarizer: For queries seeking a concise summary of information, even indirectly.
+2. Recommender: For queries requesting recommendations or alternatives.
+3. QA: For factual questions requiring precise answers.
+4. Alternative Search: For all other types of queries.
+
+Based on the above tools, classify the following query:
+Query: "{query}"
+
+Respond only with one of these tool names: Summarizer, Recommender, QA, or Alternative Search.
+    """
+
+
+# Keyword heuristics that route without calling the LLM; None means "ask the LLM".
+# Kept as the baseline the evaluation harness compares against.
+def heuristic_route(query: str) -> Optional[str]:
+    if "recommend" in query.lower() or "recommendation" in query.lower():
+        return "Recommender"
+    if any(query.lower().startswith(word) for word in QUESTION_WORDS):
+        return "QA"
+    return None
+
+
+# Map an LLM reply onto a tool name. Replies like "QA." or "The tool is Recommender" are accepted;
+# anything that names no tool returns `default`.
+def parse_route(response: str, default: str = "QA") -> str:
+    response = response.strip()
+    if response in VALID_TOOLS:
+        return response
+    lowered = response.lower()
+    found = [(lowered.find(name), tool) for tool, name in
+             (("Summarizer", "summar"), ("Recommender", "recommend"), ("QA", "qa"), ("Alternative Search", "alternative"))]
+    found = [(position, tool) for position, tool in found if position >= 0]
+    return min(found)[1] if found else default
+
+
+# Word unigrams, bigrams and the leading word, hashed into a fixed-size feature space
+def intent_features(query: str, dimensions: int) -> np.ndarray:
+    words = re.findall(r"[a-z0-9]+", query.lower())
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    if words:
+        features.append(f"^:{words[0]}")
+    return np.unique([zlib.crc32(feature.encode("utf-8")) % dimensions for feature in features])
+
+
+# Small multinomial logistic regression over hashed n-gram features, trained on a labeled query set.
+# Prediction is a sparse row sum and a softmax, so routing costs microseconds instead of an LLM call.
+class IntentClassifier:
+    def __init__(self, dimensions: int = 4096, epochs: int = 300, learning_rate: float = 2.0,
+                 l2: float = 1e-4):
+        self.dimensions = dimensions
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.labels: List[str] = []
+        self.weights = None
+        self.bias = None
+
+    def _matrix(self, queries: List[str]) -> np.ndarray:
+        X = np.zeros((len(queries), self.dimensions), dtype=np.float32)
+        for row, query in enumerate(queries):
+            indices = intent_features(query, self.dimensions)
+            if len(indices):
+                X[row, indices] = 1.0 / np.sqrt(len(indices))
+        return X
+
+    def fit(self, queries: List[str], labels: List[str]) -> "IntentClassifier":
+        self.labels = sorted(set(labels))
+        X = self._matrix(queries)
+        Y = np.zeros((len(labels), len(self.labels)), dtype=np.float32)
+        Y[np.arange(len(labels)), [self.labels.index(label) for label in labels]] = 1.0
+
+        # Only the hashed features that occur in the training set can get non-zero weights
+        columns = np.flatnonzero(X.any(axis=0))
+        X = X[:, columns]
+        weights = np.zeros((len(columns), len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(self.epochs):
+            probabilities = self._softmax(X @ weights + self.bias)
+            error = (probabilities - Y) / len(queries)
+            weights -= self.learning_rate * (X.T @ error + self.l2 * weights)
+            self.bias -= self.learning_rate * error.sum(axis=0)
+
+        self.weights = np.zeros((self.dimensions, len(self.labels)), dtype=np.float32)
+        self.weights[columns] = weights
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    # Returns (tool, confidence), confidence being the softmax probability of the chosen tool
+    def predict(self, query: str) -> Tuple[str, float]:
+        indices = intent_features(query, self.dimensions)
+        logits = self.bias.copy()
+        if len(indices):
+            logits += self.weights[indices].sum(axis=0) / np.sqrt(len(indices))
+        probabilities = self._softmax(logits)
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+
+def load_intent_examples(path: str) -> Tuple[List[str], List[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    return [example["query"] for example in examples], [example["tool"] for example in examples]
+
+
+# The default classifier is trained once per process from the bundled labeled query set
+_default_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier(path: str = INTENT_TRAIN_FILE) -> IntentClassifier:
+    global _default_classifier
+    with _classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = IntentClassifier().fit(*load_intent_examples(path))
+        return _default_classifier
+
+
+# Route a query: the local classifier decides when it is confident, otherwise the LLM is asked.
+# Returns (tool, confidence, source) where source is "local" or "llm".
+def route_query(query: str, llm: LLM, classifier: IntentClassifier = None,
+                threshold: float = CONFIDENCE_THRESHOLD) -> Tuple[str, float, str]:
+    tool, confidence = (classifier or get_intent_classifier()).predict(query)
+    annotate(confidence=round(confidence, 3), source="local" if confidence >= threshold else "llm")
+    if confidence >= threshold:
+        return tool, confidence, "local"
+    response = llm.invoke(CLASSIFIER_PROMPT.format(query=query), max_tokens=ROUTER_MAX_TOKENS)
+    return parse_route(response, default=tool), confidence, "llm"
+
+
+async def aroute_query(query: str, llm: LLM, classifier: IntentClassifier = None,
+                       threshold: float = CONFIDENCE_THRESHOLD) -> Tuple[str, float, str]:
+    tool, confidence = (classifier or get_intent_classifier()).predict(query)
+    annotate(confidence=round(confidence, 3), source="local" if confidence >= threshold else "llm")
+    if confidence >= threshold:
+        return tool, confidence, "local"
+    response = await llm.ainvoke(CLASSIFIER_PROMPT.format(query=query), max_tokens=ROUTER_MAX_TOKENS)
+    return parse_route(response, default=tool), confidence, "llm"
+
+
+def classify_query(query: str, llm: LLM) -> str:
+    return route_query(query, llm)[0]
+
+
+async def aclassify_query(query: str, llm: LLM) -> str:
+    return (await aroute_query(query, llm))[0]
+
+
+# Routing accuracy and latency of the previous behaviour (keyword heuristics, then the LLM)
+# against the local classifier, with and without LLM escalation. Without an LLM, queries the
+# baseline or the escalation would send to the LLM are counted but not scored.
+def evaluate_routing(queries: List[str], labels: List[str], classifier: IntentClassifier,
+                     llm: LLM = None, threshold: float = CONFIDENCE_THRESHOLD) -> Dict[str, Dict]:
+    results = {}
+
+    def record(name, predict):
+        correct, scored, llm_calls, latencies = 0, 0, 0, []
+        for query, label in zip(queries, labels):
+            start = time.perf_counter()
+            tool, used_llm = predict(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            llm_calls += used_llm
+            if tool is not None:
+                scored += 1
+                correct += tool == label
+        results[name] = {
+            "accuracy": round(correct / scored, 4) if scored else None,
+            "scored": scored,
+            "llm_calls": llm_calls,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        }
+
+    def baseline(query):
+        tool = heuristic_route(query)
+        if tool is not None:
+            return tool, False
+        if llm is None:
+            return None, True
+        return parse_route(llm.invoke(CLASSIFIER_PROMPT.format(query=query))), True
+
+    def local(query):
+        return classifier.predict(query)[0], False
+
+    def escalating(query):
+        tool, confidence = classifier.predict(query)
+        if confidence >= threshold:
+            return tool, False
+        if llm is None:
+            return None, True
+        return route_query(query, llm, classifier, threshold)[0], True
+
+    record("heuristic+llm (baseline)", baseline)
+    record("local", local)
+    record("local+llm escalation", escalating)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate query routing accuracy and latency.")
+    parser.add_argument("--train", default=INTENT_TRAIN_FILE, help="Labeled queries used to train the classifier.")
+    parser.add_argument("--eval", default=INTENT_EVAL_FILE, help="Held-out labeled queries to evaluate on.")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="Confidence below which the LLM is consulted.")
+    parser.add_argument("--endpoint", default=None,
+                        help="LM Studio endpoint; when given, LLM calls are made and scored.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    classifier = IntentClassifier().fit(*load_intent_examples(args.train))
+    print(f"[INFO] Trained intent classifier in {(time.perf_counter() - start) * 1000:.0f} ms.")
+
+    llm = None
+    if args.endpoint:
+        from llm_client import LMStudioLLM
+        llm = LMStudioLLM(endpoint=args.endpoint)
+
+    queries, labels = load_intent_examples(args.eval)
+    for name, report in evaluate_routing(queries, labels, classifier, llm, args.threshold).items():
+        accuracy = f"{report['accuracy']:.1%}" if report["accuracy"] is not None else "n/a"
+        print(f"[INFO] {name}: accuracy {accuracy} on {report['scored']}/{len(queries)} queries, "
+              f"{report['llm_calls']} LLM calls, p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms")
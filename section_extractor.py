@@ -0,0 +1,262 @@
+import os
+import time
+import argparse
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, Tag
+from bs4.dammit import EntitySubstitution
+
+HEADER_TAGS = ("h1", "h2", "h3")
+
+# Tags html.parser/BeautifulSoup treat as empty elements, and tags whose strings BeautifulSoup keeps
+# out of the text of their ancestors (`get_text` only returns strings of the tag's own string type)
+EMPTY_ELEMENT_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta", "param",
+    "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid", "spacer",
+}
+STRING_CONTAINER_TAGS = {"rt", "rp", "style", "script", "template"}
+
+# Kinds of flushed strings: CDATA counts towards the text of ordinary tags like plain text does,
+# comments, declarations and processing instructions count towards none
+_TEXT, _CDATA, _SKIP = "text", "cdata", "skip"
+
+
+# Original extractor: for every header, the text of each following sibling tag until the next header.
+# `find_next_siblings()` materialises every remaining sibling for every header, which is quadratic in
+# the number of headers; kept as the reference for the equivalence tests and the benchmark.
+def sibling_walk_sections(soup) -> Dict[str, str]:
+    headers = soup.find_all(list(HEADER_TAGS))
+    info = {}
+    for header in headers:
+        section_title = header.get_text(strip=True)
+        content = []
+        for sibling in header.find_next_siblings():
+            if sibling.name in HEADER_TAGS:
+                break
+            content.append(sibling.get_text(strip=True))
+        info[section_title] = "\n".join(content)
+    return info
+
+
+# Same result from an existing tree, visiting the children of each header's parent once
+def tree_sections(soup) -> Dict[str, str]:
+    headers = soup.find_all(list(HEADER_TAGS))
+    content_by_header: Dict[int, List[str]] = {}
+    visited = set()
+    for header in headers:
+        parent = header.parent
+        if id(parent) in visited:
+            continue
+        visited.add(id(parent))
+        current = None
+        for child in parent.children:
+            if not isinstance(child, Tag):
+                continue
+            if child.name in HEADER_TAGS:
+                current = content_by_header[id(child)] = []
+            elif current is not None:
+                current.append(child.get_text(strip=True))
+
+    info = {}
+    for header in headers:
+        info[header.get_text(strip=True)] = "\n".join(content_by_header[id(header)])
+    return info
+
+
+class _Element:
+    __slots__ = ("name", "string_type", "title", "piece", "active")
+
+    def __init__(self, name: str, string_type: Optional[str]):
+        self.name = name
+        self.string_type = string_type
+        self.title: Optional[List[str]] = None   # text parts, when this element is a header
+        self.piece: Optional[List[str]] = None   # text parts, when this element is content of a section
+        self.active: Optional[List[List[str]]] = None  # pieces of the section its children currently feed
+
+
+# Streaming section extractor: one pass over the html.parser token stream, without building a tree.
+# Tag nesting, empty elements, character references and string types follow BeautifulSoup's
+# html.parser tree builder, so the result equals `sibling_walk_sections(BeautifulSoup(html, "html.parser"))`.
+# Every open element that is a header or a section's content tag collects the stripped strings of its
+# own string type; a header opening inside a parent redirects that parent's next child tags to its section.
+class SectionExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = [_Element("[document]", None)]
+        self.open_counts: Dict[str, int] = {}
+        self.containers: List[_Element] = []
+        self.already_closed_empty_element: List[str] = []
+        self.data: List[str] = []
+        self.sections: List[tuple] = []
+
+    # Text since the last tag event becomes one string, typed by the innermost string container
+    def _flush(self, kind=_TEXT):
+        if not self.data:
+            return
+        text = "".join(self.data).strip()
+        self.data = []
+        if not text or kind == _SKIP:
+            return
+        string_type = self.containers[-1].name if self.containers and kind == _TEXT else None
+        for element in self.stack:
+            if element.string_type == string_type:
+                if element.title is not None:
+                    element.title.append(text)
+                if element.piece is not None:
+                    element.piece.append(text)
+
+    def _push(self, name: str):
+        parent = self.stack[-1]
+        element = _Element(name, name if name in STRING_CONTAINER_TAGS else None)
+        if name in HEADER_TAGS:
+            element.title = []
+            parent.active = []
+            self.sections.append((element.title, parent.active))
+        elif parent.active is not None:
+            element.piece = []
+            parent.active.append(element.piece)
+        self.stack.append(element)
+        self.open_counts[name] = self.open_counts.get(name, 0) + 1
+        if name in STRING_CONTAINER_TAGS:
+            self.containers.append(element)
+
+    def _pop(self):
+        element = self.stack.pop()
+        self.open_counts[element.name] -= 1
+        if self.containers and self.containers[-1] is element:
+            self.containers.pop()
+
+    def _pop_to(self, name: str):
+        if not self.open_counts.get(name):
+            return
+        while len(self.stack) > 1:
+            element = self.stack[-1]
+            self._pop()
+            if element.name == name:
+                break
+
+    def handle_starttag(self, name, attrs, handle_empty_element=True):
+        self._flush()
+        self._push(name)
+        if name in EMPTY_ELEMENT_TAGS and handle_empty_element:
+            self.handle_endtag(name, check_already_closed=False)
+            self.already_closed_empty_element.append(name)
+
+    def handle_startendtag(self, name, attrs):
+        self.handle_starttag(name, attrs, handle_empty_element=False)
+        self.handle_endtag(name)
+
+    def handle_endtag(self, name, check_already_closed=True):
+        if check_already_closed and name in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(name)
+        else:
+            self._flush()
+            self._pop_to(name)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        number = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        data = None
+        if number < 256:
+            try:
+                data = bytearray([number]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(number)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._flush()
+        self.data.append(data)
+        self._flush(_SKIP)
+
+    def handle_decl(self, data):
+        self.handle_comment(data)
+
+    def handle_pi(self, data):
+        self.handle_comment(data)
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            self.data.append(data[len("CDATA["):])
+            self._flush(_CDATA)
+        else:
+            self.data.append(data)
+            self._flush(_SKIP)
+
+    def result(self) -> Dict[str, str]:
+        info = {}
+        for title, pieces in self.sections:
+            info["".join(title)] = "\n".join("".join(piece) for piece in pieces)
+        return info
+
+
+def extract_sections(html: str) -> Dict[str, str]:
+    extractor = SectionExtractor()
+    extractor.feed(html)
+    extractor.close()
+    extractor._flush()
+    return extractor.result()
+
+
+# lxml builds trees several times faster than html.parser when it is installed
+def fast_parser() -> str:
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+def _best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(html: str, repeat: int = 5) -> Dict[str, float]:
+    timings = {
+        "html.parser + sibling walk": _best_time(
+            lambda: sibling_walk_sections(BeautifulSoup(html, "html.parser")), repeat),
+        "html.parser + single pass": _best_time(lambda: tree_sections(BeautifulSoup(html, "html.parser")), repeat),
+        "streaming": _best_time(lambda: extract_sections(html), repeat),
+    }
+    if fast_parser() != "html.parser":
+        timings[f"{fast_parser()} + single pass"] = _best_time(
+            lambda: tree_sections(BeautifulSoup(html, fast_parser())), repeat)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark label section extraction on saved HTML pages.")
+    parser.add_argument("pages", nargs="*", help="HTML files (default: datasets/html_fixtures)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fixture_dir = "datasets/html_fixtures"
+    pages = args.pages or [os.path.join(fixture_dir, name) for name in sorted(os.listdir(fixture_dir))
+                           if name.endswith(".html")]
+    for page in pages:
+        with open(page, "r", encoding="utf-8") as f:
+            html = f.read()
+        same = extract_sections(html) == sibling_walk_sections(BeautifulSoup(html, "html.parser"))
+        print(f"[INFO] {page}: {len(html) / 1024:.0f} KB, streaming output identical: {same}")
+        timings = benchmark(html, repeat=args.repeat)
+        baseline = timings["html.parser + sibling walk"]
+        for name, seconds in timings.items():
+            print(f"[INFO]   {name:<28} {seconds * 1000:8.1f} ms  ({baseline / seconds:.1f}x)")
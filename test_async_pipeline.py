@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake import FakeListLLM
+
+import async_pipeline
+
+
+class SlowEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(0.2)
+        return [1.0, 0.0]
+
+
+class SlowLLM(FakeListLLM):
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(0.2)
+        return self._call(prompt, stop, run_manager, **kwargs)
+
+
+class FakeStore:
+    embeddings = SlowEmbeddings()
+
+    def similarity_search_by_vector(self, embedding, k):
+        return [Document(page_content="Take with food.", metadata={"file": "Aspirin", "section": "DOSAGE"})]
+
+
+def test_classification_overlaps_with_query_embedding(monkeypatch):
+    async def slow_classify(query, llm):
+        await asyncio.sleep(0.2)  # An LLM-escalated classification
+        return "Summarizer"
+
+    monkeypatch.setattr(async_pipeline, "aclassify_query", slow_classify)
+    llm = SlowLLM(responses=["Aspirin is taken with food."])
+    start = time.time()
+    tool_name, response = asyncio.run(
+        async_pipeline.ahandle_query("Give me an overview of aspirin", FakeStore(), llm, log=lambda _: None)
+    )
+    elapsed = time.time() - start
+    assert tool_name == "Summarizer"
+    assert response == "[Tool: Summarizer] Aspirin is taken with food."
+    # Classification (0.2s) and embedding (0.2s) run together, then generation (0.2s)
+    assert elapsed < 0.55
+
+
+def test_unanswered_qa_falls_back_to_alternative_search(monkeypatch):
+    async def fake_alternative(query, llm, callbacks=None):
+        return "[Tool: Alternative Search] searched"
+
+    monkeypatch.setattr(async_pipeline, "aalternative", fake_alternative)
+    llm = SlowLLM(responses=["I don't know."])
+    tool_name, response = asyncio.run(
+        async_pipeline.ahandle_query("What is the dose of aspirin?", FakeStore(), llm, log=lambda _: None)
+    )
+    assert (tool_name, response) == ("Alternative Search", "[Tool: Alternative Search] searched")
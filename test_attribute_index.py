@@ -0,0 +1,73 @@
+import json
+import asyncio
+
+from langchain_core.language_models.fake import FakeListLLM
+
+import async_pipeline
+from attribute_index import build_attribute_index, label_attributes, save_attribute_index, select_entry
+from query_analysis import QueryAnalysis
+
+LABEL = {
+    "product_name": "Rasagiline Tablets",
+    "Safety": "Report Adverse Events",
+    "INDICATIONS AND USAGE": "Rasagiline is indicated for the treatment of Parkinson's disease (1)",
+    "CONTRAINDICATIONS": "Concomitant use of meperidine, tramadol or methadone (4)",
+    "DRUG INTERACTIONS": "Meperidine: risk of serotonin syndrome (7.1)Dextromethorphan: psychosis (7.2)",
+    "4. CONTRAINDICATIONS": "",
+    "7 DRUG INTERACTIONS": "",
+    "7.1 Meperidine": "Serious, sometimes fatal reactions have been reported.",
+    "10. OVERDOSAGE": "",
+    "Drug Label Information": "FULL PRESCRIBING INFORMATION: CONTENTS* 4 CONTRAINDICATIONS 10 OVERDOSAGE "
+                              "4 CONTRAINDICATIONS Rasagiline is contraindicated with meperidine. "
+                              "10 OVERDOSAGE Signs of overdose include drowsiness and dizziness.",
+}
+
+
+def test_sections_are_normalized_and_empty_ones_recovered():
+    attributes = label_attributes(LABEL)
+    assert [entry["heading"] for entry in attributes["contraindications"]] == ["CONTRAINDICATIONS", "4 CONTRAINDICATIONS"]
+    assert attributes["contraindications"][1]["text"] == "Rasagiline is contraindicated with meperidine."
+    assert attributes["overdosage"] == [{"heading": "10 OVERDOSAGE",
+                                         "text": "Signs of overdose include drowsiness and dizziness."}]
+    assert attributes["interactions"][0]["text"] == \
+        "Meperidine: risk of serotonin syndrome (7.1) Dextromethorphan: psychosis (7.2)"
+    assert [entry["heading"] for entry in attributes["indications"]] == ["INDICATIONS AND USAGE"]
+    assert "Safety" not in str(attributes)
+
+
+def test_only_unambiguous_section_questions_are_answered():
+    index = {"labels": {"Rasagiline Tablets": label_attributes(LABEL)}}
+    one = dict(files=["Rasagiline Tablets"], drug_terms=["rasagiline"])
+
+    file, heading, text = select_entry(index, QueryAnalysis(intents=["contraindications"], **one),
+                                       "Who should not take rasagiline?")
+    assert (heading, text) == ("CONTRAINDICATIONS (Highlights)", LABEL["CONTRAINDICATIONS"])
+    assert select_entry(index, QueryAnalysis(intents=["overdosage"], **one),
+                        "What are the overdose symptoms of rasagiline")[1] == "10 OVERDOSAGE"
+
+    # A narrower question, a second drug, a second section or a missing section go to RetrievalQA
+    assert select_entry(index, QueryAnalysis(intents=["interactions"], **one),
+                        "Can I take rasagiline with alcohol?") is None
+    assert select_entry(index, QueryAnalysis(files=["Rasagiline Tablets", "Selegiline Tablets"],
+                                             intents=["contraindications"]),
+                        "What are the contraindications for rasagiline and selegiline?") is None
+    assert select_entry(index, QueryAnalysis(intents=["dosage", "specific_populations"], **one),
+                        "What is the pediatric dose of rasagiline?") is None
+    assert select_entry(index, QueryAnalysis(intents=["how_supplied"], **one), "How should rasagiline be stored?") is None
+
+
+def test_qa_answers_from_the_index_without_the_llm(tmp_path, monkeypatch):
+    json_dir = tmp_path / "labels"
+    json_dir.mkdir()
+    (json_dir / "Rasagiline Tablets.json").write_text(json.dumps(LABEL), encoding="utf-8")
+    save_attribute_index(str(tmp_path), build_attribute_index(str(json_dir)))
+
+    class Store:
+        _persist_directory = str(tmp_path)
+
+    monkeypatch.setattr(async_pipeline, "analyze_query", lambda vector_store, query: QueryAnalysis(
+        files=["Rasagiline Tablets"], intents=["contraindications"], drug_terms=["rasagiline"]))
+    response = asyncio.run(async_pipeline.aqa("What are the contraindications for rasagiline?", Store(),
+                                              FakeListLLM(responses=[]), log=lambda _: None))
+    assert response == (f"[Tool: QA] {LABEL['CONTRAINDICATIONS']}\n\n"
+                        "Source: Rasagiline Tablets, section \"CONTRAINDICATIONS (Highlights)\".")
@@ -0,0 +1,52 @@
+import shutil
+import time
+
+from benchmark import FakeLLMServer, compare, find_baseline, run_benchmark
+from llm_client import LMStudioLLM
+
+
+def test_fake_server_paces_completions():
+    with FakeLLMServer(latency=0.1, tokens_per_second=100, completion_tokens=10) as server:
+        start = time.time()
+        text = LMStudioLLM(endpoint=server.endpoint).invoke("What is the dose of aspirin?")
+        elapsed = time.time() - start
+        assert len(text.split()) == 10
+        assert 0.2 <= elapsed < 0.6  # 0.1s to first token, then 10 tokens at 100/s
+        streamed = LMStudioLLM(endpoint=server.endpoint, streaming=True).invoke("What is the dose of aspirin?")
+        assert streamed.strip() == text
+        # Router escalations get a tool name
+        assert LMStudioLLM(endpoint=server.endpoint).invoke("Classify", max_tokens=8) == "QA"
+        assert server.requests == 3
+
+
+def _run(commit, p95, qps):
+    return {"commit": commit, "config": {"rounds": 3},
+            "build": {"preprocess_s": 4.0, "index_s": 7.0}, "routing": {"p95_ms": 0.1},
+            "load": {"4": {"throughput_qps": qps, "p50_ms": 300.0, "p95_ms": p95}}}
+
+
+def test_compare_flags_regressions_against_the_baseline_commit():
+    runs = [_run("aaa111", 2000.0, 2.5), _run("bbb222", 2100.0, 2.5)]
+    assert find_baseline(runs, None, "ccc333")["commit"] == "bbb222"
+    assert find_baseline(runs, "aaa", "ccc333")["commit"] == "aaa111"
+    assert find_baseline(runs[:1], None, "aaa111") is None
+
+    report, regressions = compare(_run("ccc333", 2500.0, 2.0), runs[0])
+    assert regressions == ["load@4.throughput_qps", "load@4.p95_ms"]
+    assert "+25.0%" in report
+    assert compare(_run("ccc333", 2100.0, 2.6), runs[0])[1] == []  # Within 10%
+
+
+def test_full_pipeline_runs_offline(tmp_path):
+    json_dir = tmp_path / "labels"
+    json_dir.mkdir()
+    for name in ("Amoxicillin Capsules, USP.json", "Ramelteon Tablets.json"):
+        shutil.copy(f"datasets/microlabs_usa/{name}", json_dir / name)
+
+    result = run_benchmark(str(json_dir), [2], rounds=1, latency=0.0, tokens_per_second=10000,
+                           completion_tokens=20, llm_concurrency=4)
+    assert result["build"]["chunks"] > 0
+    load = result["load"]["2"]
+    assert load["requests"] == 10 and load["errors"] == 0
+    assert {"handle_query", "classify_query", "retrieve", "llm"} <= set(load["stages"])
+    assert result["llm_requests"] >= 10
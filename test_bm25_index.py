@@ -0,0 +1,51 @@
+from langchain.schema import Document
+
+import vectorstore
+from bm25_index import BM25Index, get_bm25_index, reciprocal_rank_fusion, tokenize
+from embedding_backends import HashingEmbeddings
+from hybrid_retriever import get_retriever
+
+
+DOCS = [
+    Document(page_content="Do not use in patients with severe renal impairment.",
+             metadata={"file": "Metformin Hydrochloride Oral Solution", "section": "4 CONTRAINDICATIONS"}),
+    Document(page_content="Bottles of 100 tablets, NDC 59746-0175-01. Store at 25°C.",
+             metadata={"file": "Celecoxib capsules", "section": "16 HOW SUPPLIED/STORAGE AND HANDLING"}),
+    Document(page_content="The recommended dose is 200 mg once daily.",
+             metadata={"file": "Celecoxib capsules", "section": "2 DOSAGE AND ADMINISTRATION"}),
+    Document(page_content="Take 500mg with the evening meal.",
+             metadata={"file": "Metformin Hydrochloride Oral Solution", "section": "2 DOSAGE AND ADMINISTRATION"}),
+]
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("NDC 59746-0175-01, 500mg") == ["ndc", "59746-0175-01", "59746", "0175", "01", "500mg", "500", "mg"]
+
+
+def test_exact_tokens_rank_first_and_survive_a_round_trip(tmp_path):
+    ids = [f"chunk-{i}" for i in range(len(DOCS))]
+    index = BM25Index.build(ids, DOCS, corpus_version="v1")
+    assert index.search("NDC 59746-0175-01", 2)[0][0] == "chunk-1"
+    assert index.search("contraindications", 1)[0][0] == "chunk-0"  # Matched through the section name
+    assert [i for i, _ in index.search("dosage", 5, files=["Metformin Hydrochloride Oral Solution"])] == ["chunk-3"]
+
+    index.save(str(tmp_path))
+    loaded = get_bm25_index(str(tmp_path))
+    assert loaded.corpus_version == "v1"
+    assert loaded.search("500 mg metformin", 4) == index.search("500 mg metformin", 4)
+
+
+def test_rebuild_keeps_the_index_in_sync_and_retriever_fuses_results(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    store, _ = vectorstore.update_vector_store(DOCS[:2], persist_directory, HashingEmbeddings())
+    assert len(get_bm25_index(persist_directory)) == 2
+
+    store, _ = vectorstore.update_vector_store(DOCS, persist_directory, HashingEmbeddings())
+    assert len(get_bm25_index(persist_directory)) == 4
+
+    docs = get_retriever(store, k=2).invoke("NDC 59746-0175-01")
+    assert docs[0].page_content == DOCS[1].page_content
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]) == ["b", "a", "d", "c"]
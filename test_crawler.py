@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler import Crawler, HostRateLimiter
+
+LABEL = ("<html><body><h1>Roflumilast Tablets</h1><h2>1 INDICATIONS AND USAGE</h2>"
+         "<p>Roflumilast is indicated to reduce the risk of COPD exacerbations.</p>"
+         "<h2>4 CONTRAINDICATIONS</h2><p>Moderate to severe liver impairment.</p></body></html>")
+
+
+# Local stand-in for the product and label sites: product pages link to a label page,
+# labels carry an ETag and answer conditional requests with 304
+@pytest.fixture
+def fixture_site():
+    requests_seen = []
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get("If-None-Match")))
+            if self.path not in pages:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body, etag = pages[self.path]
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    for name in ("roflumilast", "celecoxib"):
+        pages[f"/products/{name}/"] = (f'<h2><a href="{base}/label/{name}">Prescribing Information</a></h2>', None)
+        pages[f"/label/{name}"] = (LABEL.replace("Roflumilast", name.title()), f'"{name}-v1"')
+    pages["/products/unlisted/"] = ("<h2>Other</h2>", None)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base, pages, requests_seen
+    server.shutdown()
+
+
+def test_crawl_writes_labels_and_revalidates_with_etags(fixture_site, tmp_path):
+    base, pages, requests_seen = fixture_site
+    urls = {"Roflumilast Tablets": f"{base}/products/roflumilast/", "Celecoxib capsules": f"{base}/products/celecoxib/",
+            "Unlisted": f"{base}/products/unlisted/"}
+    output_dir = tmp_path / "labels"
+
+    report = Crawler(str(tmp_path / "cache"), max_workers=3, min_interval=0).crawl(urls, str(output_dir))
+    assert report["counts"] == {"written": 2, "missing": 1}
+    with open(output_dir / "Roflumilast Tablets.json", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["product_name"] == "Roflumilast Tablets"
+    assert "COPD" in data["1 INDICATIONS AND USAGE"]
+
+    # Second crawl sends the cached ETags; unchanged labels are neither re-downloaded nor re-parsed
+    pages["/label/celecoxib"] = (LABEL.replace("COPD", "arthritis"), '"celecoxib-v2"')
+    requests_seen.clear()
+    report = Crawler(str(tmp_path / "cache"), min_interval=0).crawl(urls, str(output_dir))
+    assert report["products"]["Roflumilast Tablets"]["status"] == "unchanged"
+    assert report["products"]["Celecoxib capsules"]["status"] == "written"
+    assert report["not_modified"] == 1
+    assert ("/label/roflumilast", '"roflumilast-v1"') in requests_seen
+    with open(output_dir / "Celecoxib capsules.json", encoding="utf-8") as f:
+        assert "arthritis" in json.load(f)["1 INDICATIONS AND USAGE"]
+
+
+def test_resume_skips_finished_products(fixture_site, tmp_path):
+    base, pages, requests_seen = fixture_site
+    urls = {"Roflumilast Tablets": f"{base}/products/roflumilast/", "Broken": f"{base}/products/missing-page/"}
+    crawler = Crawler(str(tmp_path / "cache"), min_interval=0, max_retries=0)
+    report = crawler.crawl(urls, str(tmp_path))
+    assert report["counts"] == {"written": 1, "error": 1}
+
+    pages["/products/missing-page/"] = pages["/products/roflumilast/"]
+    requests_seen.clear()
+    report = Crawler(str(tmp_path / "cache"), min_interval=0).crawl(urls, str(tmp_path), resume=True)
+    assert report["skipped"] == 1
+    assert report["counts"] == {"written": 2}
+    assert all(not path.endswith("roflumilast/") for path, _ in requests_seen)
+    assert os.path.exists(tmp_path / "Broken.json")
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = HostRateLimiter(min_interval=0.05)
+    start = time.monotonic()
+    threads = [threading.Thread(target=limiter.wait, args=("http://a.example/page",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 0.15
+    start = time.monotonic()
+    limiter.wait("http://b.example/page")
+    assert time.monotonic() - start < 0.05
+
+
+def test_failed_write_is_recorded_as_an_error_and_retried(fixture_site, tmp_path):
+    base, _, _ = fixture_site
+    urls = {"Roflumilast Tablets": f"{base}/products/roflumilast/"}
+    output_dir = tmp_path / "labels"
+    # A directory in the way makes the label file impossible to open for writing
+    (output_dir / "Roflumilast Tablets.json").mkdir(parents=True)
+    report = Crawler(str(tmp_path / "cache"), min_interval=0).crawl(urls, str(output_dir))
+    assert report["counts"] == {"error": 1}
+
+    (output_dir / "Roflumilast Tablets.json").rmdir()
+    report = Crawler(str(tmp_path / "cache"), min_interval=0).crawl(urls, str(output_dir), resume=True)
+    assert report["skipped"] == 0
+    assert report["counts"] == {"written": 1}
@@ -0,0 +1,39 @@
+from dedup import collapse_contained_sections, dedupe_sections, near_duplicate_filter
+
+INDICATIONS = "Roflumilast is indicated as a treatment to reduce the risk of COPD exacerbations in patients with severe COPD."
+WARNINGS = "Psychiatric Events Including Suicidality: advise patients, their caregivers, and families to be alert for mood changes."
+
+
+def test_container_is_collapsed_to_its_residual():
+    preamble = "Updated April 24, 2023 HIGHLIGHTS OF PRESCRIBING INFORMATION " * 5
+    sections = {
+        "Drug Label Information": preamble + INDICATIONS.replace(" ", "\n", 3) + "WARNINGS AND PRECAUTIONS" + WARNINGS,
+        "INDICATIONS AND USAGE": INDICATIONS,
+        "WARNINGS AND PRECAUTIONS": WARNINGS,
+    }
+    result, stats = collapse_contained_sections(sections)
+    assert result["INDICATIONS AND USAGE"] == INDICATIONS
+    assert result["WARNINGS AND PRECAUTIONS"] == WARNINGS
+    assert "COPD" not in result["Drug Label Information"]
+    assert "Updated April 24, 2023" in result["Drug Label Information"]
+    assert stats["collapsed_sections"] == 1
+
+
+def test_small_container_and_boilerplate_are_dropped():
+    data = {
+        "Safety": "Report Adverse Events,FDA Safety Recalls",
+        "TIMOLOL tablet": "If this SPL contains inactivated NDCs listed by the FDA, they will be specified as such.",
+        "CONTRAINDICATIONS": "Contraindications: " + INDICATIONS,
+        "4 CONTRAINDICATIONS": INDICATIONS,
+        "product_name": "Roflumilast Tablets",
+    }
+    result, stats = dedupe_sections(data)
+    assert list(result) == ["4 CONTRAINDICATIONS"]
+    assert stats["boilerplate_sections"] == 3
+    assert stats["dropped_containers"] == 1
+
+
+def test_near_duplicate_filter_respects_groups():
+    texts = [INDICATIONS, INDICATIONS + " Take once daily.", WARNINGS, INDICATIONS]
+    assert near_duplicate_filter(texts, threshold=0.7) == [0, 2]
+    assert near_duplicate_filter(texts, threshold=0.7, groups=["a", "a", "a", "b"]) == [0, 2, 3]
@@ -0,0 +1,118 @@
+import json
+import asyncio
+from typing import List
+
+from langchain.llms.base import LLM
+from langchain.schema import Document
+
+import async_pipeline
+from drug_graph import DrugGraph, _csr, get_drug_graph, plan_recommendation
+from embedding_backends import HashingEmbeddings
+from query_analysis import QueryAnalysis
+from vectorstore import update_vector_store
+
+LABELS = {
+    "Olmesartan Medoxomil Tablets": {
+        "INDICATIONS AND USAGE": "Olmesartan is an angiotensin II receptor blocker (ARB) indicated for the treatment "
+                                 "of hypertension, to lower blood pressure. (1)",
+        "CONTRAINDICATIONS": "Do not co-administer aliskiren with olmesartan in patients with diabetes. (4)",
+        "DRUG INTERACTIONS": "Non-steroidal anti-inflammatory drugs (NSAIDs): increased risk of renal impairment. (7)",
+    },
+    "Telmisartan Tablets": {
+        "INDICATIONS AND USAGE": "Telmisartan is an angiotensin II receptor blocker (ARB) indicated for the treatment "
+                                 "of hypertension. (1)",
+        "DRUG INTERACTIONS": "Ramipril: dual blockade of the renin-angiotensin system is not recommended. (7)",
+    },
+    "Celecoxib Capsules": {
+        "INDICATIONS AND USAGE": "Celecoxib is a nonsteroidal anti-inflammatory drug (NSAID) indicated for "
+                                 "osteoarthritis and acute pain. (1)",
+    },
+    "Cromolyn Sodium Oral Solution": {
+        "Drug Label Information": "DESCRIPTION: Cromolyn sodium is a mast cell stabilizer. INDICATIONS AND USAGE "
+                                  "Cromolyn is indicated in the management of patients with mastocytosis. Use has "
+                                  "been associated with improvement in abdominal pain. CONTRAINDICATIONS None.",
+    },
+}
+
+
+def _write_labels(json_dir):
+    json_dir.mkdir()
+    for name, data in LABELS.items():
+        (json_dir / f"{name}.json").write_text(json.dumps(dict(data, product_name=name)), encoding="utf-8")
+
+
+def test_build_extracts_classes_indications_and_interactions(tmp_path):
+    _write_labels(tmp_path / "labels")
+    DrugGraph.build(str(tmp_path / "labels")).save(str(tmp_path))
+    graph = get_drug_graph(str(tmp_path))
+
+    assert graph.classes_of("Olmesartan Medoxomil Tablets") == ["angiotensin II receptor blocker"]
+    assert graph.conditions_of("Celecoxib Capsules") == ["osteoarthritis", "pain"]
+    # Indicated for mastocytosis; the pain is a side note, and the class comes from the description
+    assert graph.conditions_of("Cromolyn Sodium Oral Solution") == ["mastocytosis"]
+    assert graph.classes_of("Cromolyn Sodium Oral Solution") == ["mast cell stabilizer"]
+    # Olmesartan's label names the NSAID class; the edge is kept both ways
+    assert graph.interactions_of("Olmesartan Medoxomil Tablets") == ["Celecoxib Capsules"]
+    assert graph.interactions_of("Celecoxib Capsules") == ["Olmesartan Medoxomil Tablets"]
+    assert graph.interactions_of("Telmisartan Tablets") == []
+
+
+def test_repeated_matches_do_not_shift_the_row_offsets():
+    # A class named twice in a label must not push the next label's columns out of its row
+    indptr, indices = _csr([[2, 0, 2], [], [1, 1]])
+    assert indptr.tolist() == [0, 2, 2, 3]
+    assert indices.tolist() == [0, 2, 1]
+
+
+def test_alternatives_share_a_condition_and_skip_avoided_classes(tmp_path):
+    _write_labels(tmp_path / "labels")
+    graph = DrugGraph.build(str(tmp_path / "labels"))
+    olmesartan = QueryAnalysis(files=["Olmesartan Medoxomil Tablets"], drug_terms=["olmesartan"])
+
+    targets, alternatives = plan_recommendation(graph, "Alternatives to olmesartan for high blood pressure?",
+                                                olmesartan)
+    assert targets == ["Olmesartan Medoxomil Tablets"]
+    assert [(a.label, a.shared_conditions) for a in alternatives] == [("Telmisartan Tablets", ["hypertension"])]
+
+    # Celecoxib treats pain but is an NSAID, the class the query rules out
+    _, alternatives = plan_recommendation(graph, "Recommend a pain reliever other than NSAIDs", QueryAnalysis())
+    assert alternatives == []
+    _, alternatives = plan_recommendation(graph, "Recommend a pain reliever", QueryAnalysis())
+    assert [a.label for a in alternatives] == ["Celecoxib Capsules"]
+
+    # A question about the named drug itself gets its chunks but no alternatives
+    assert plan_recommendation(graph, "Can I take olmesartan while pregnant?", olmesartan) == \
+        (["Olmesartan Medoxomil Tablets"], [])
+
+
+class RecordingLLM(LLM):
+    prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return "Consider telmisartan."
+
+
+def test_recommender_fetches_the_graph_candidates_chunks(tmp_path, monkeypatch):
+    _write_labels(tmp_path / "labels")
+    persist_directory = str(tmp_path / "chroma_db")
+    documents = [Document(page_content=text, metadata={"file": name, "section": section})
+                 for name, data in LABELS.items() for section, text in data.items()]
+    store, _ = update_vector_store(documents, persist_directory, HashingEmbeddings())
+    DrugGraph.build(str(tmp_path / "labels")).save(persist_directory)
+
+    monkeypatch.setattr(async_pipeline, "analyze_query", lambda vector_store, query: QueryAnalysis(
+        files=["Olmesartan Medoxomil Tablets"], drug_terms=["olmesartan"]))
+    llm = RecordingLLM(prompts=[])
+    response = asyncio.run(async_pipeline.arecommend("What can I take instead of olmesartan for hypertension?",
+                                                     store, llm, log=lambda _: None))
+    assert response == "[Tool: Recommender] Consider telmisartan."
+    prompt = llm.prompts[0]
+    assert "Candidate alternative: Telmisartan Tablets (angiotensin II receptor blocker)" in prompt
+    assert LABELS["Telmisartan Tablets"]["INDICATIONS AND USAGE"] in prompt
+    assert LABELS["Olmesartan Medoxomil Tablets"]["CONTRAINDICATIONS"] in prompt
+    assert "Celecoxib is a nonsteroidal" not in prompt
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from embedding_backends import LocalEmbeddings, describe_embeddings, get_embeddings
+from embedding_cache import CachedEmbeddings
+
+VOCAB = {"[PAD]": 0, "[UNK]": 1, "take": 2, "aspirin": 3, "with": 4, "food": 5, "daily": 6}
+
+
+# Stands in for the ONNX model: token i's hidden state is the one-hot vector e_i
+class OneHotSession:
+    def __init__(self):
+        self.batches = []
+
+    def get_inputs(self):
+        return [type("Input", (), {"name": name}) for name in ("input_ids", "attention_mask", "token_type_ids")]
+
+    def run(self, outputs, feeds):
+        self.batches.append(feeds["input_ids"].shape)
+        assert (feeds["token_type_ids"] == 0).all()
+        return [np.eye(len(VOCAB), dtype=np.float32)[feeds["input_ids"]]]
+
+
+@pytest.fixture
+def local_embeddings(tmp_path, monkeypatch):
+    # Optional dependencies of the local backend, not in requirements.txt
+    onnxruntime = pytest.importorskip("onnxruntime")
+    tokenizers = pytest.importorskip("tokenizers")
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(VOCAB, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    session = OneHotSession()
+    monkeypatch.setattr(onnxruntime, "InferenceSession", lambda path, options, providers: session)
+    embeddings = LocalEmbeddings(model_dir=str(tmp_path), batch_size=2)
+    return embeddings, session
+
+
+def test_local_embeddings_mean_pool_over_real_tokens(local_embeddings):
+    embeddings, session = local_embeddings
+    texts = ["take aspirin with food daily", "aspirin", "take aspirin", "food"]
+    vectors = np.array(embeddings.embed_documents(texts))
+    # Length-sorted batches: the two one-word texts together, then the longer two
+    assert session.batches == [(2, 1), (2, 5)]
+    # Padding is masked out, so a text's vector doesn't depend on its batch
+    assert vectors[1] == pytest.approx(np.eye(len(VOCAB))[3])
+    assert vectors[2] == pytest.approx((np.eye(len(VOCAB))[2] + np.eye(len(VOCAB))[3]) / np.sqrt(2))
+    assert np.linalg.norm(vectors, axis=1) == pytest.approx(np.ones(4))
+    assert embeddings.embed_query("aspirin") == pytest.approx(vectors[1].tolist())
+
+
+def test_describe_embeddings_recreates_the_backend(tmp_path):
+    local = describe_embeddings(CachedEmbeddings(LocalEmbeddings(), cache_path=str(tmp_path / "cache.db")))
+    assert local["backend"] == "local"
+    assert local["model"] == "sentence-transformers/all-MiniLM-L6-v2/onnx/model_quint8_avx2.onnx"
+    hashing = describe_embeddings(get_embeddings("hashing", dimensions=64))
+    assert hashing == {"backend": "hashing", "model": "hashing-64", "options": {"dimensions": 64}}
+    assert describe_embeddings(get_embeddings(hashing["backend"], **hashing["options"])) == hashing
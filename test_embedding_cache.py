@@ -0,0 +1,74 @@
+from embedding_backends import HashingEmbeddings
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(dimensions=8)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [HashingEmbeddings.embed_query(self, text) for text in texts]
+
+    def embed_query(self, text):
+        self.embedded.append(text)
+        return super().embed_query(text)
+
+
+def test_repeated_text_is_embedded_once(tmp_path):
+    backend = CountingEmbeddings()
+    cache = CachedEmbeddings(backend, cache_path=str(tmp_path / "cache.db"))
+
+    first = cache.embed_documents(["aspirin", "ibuprofen", "aspirin"])
+    second = cache.embed_documents(["ibuprofen"])
+    query = cache.embed_query("aspirin")
+
+    assert backend.embedded == ["aspirin", "ibuprofen"]
+    assert first[0] == first[2] == query
+    assert second[0] == first[1]
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_persists_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "cache.db")
+    CachedEmbeddings(CountingEmbeddings(), cache_path=path).embed_query("metformin")
+
+    backend = CountingEmbeddings()
+    CachedEmbeddings(backend, cache_path=path).embed_query("metformin")
+    assert backend.embedded == []
+
+    other_model = CountingEmbeddings()
+    CachedEmbeddings(other_model, cache_path=path, model="other-model").embed_query("metformin")
+    assert other_model.embedded == ["metformin"]
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    backend = CountingEmbeddings()
+    # Each 8-dim float32 vector is 32 bytes; room for three
+    cache = CachedEmbeddings(backend, cache_path=str(tmp_path / "cache.db"), max_bytes=100)
+    for text in ["a", "b", "c"]:
+        cache.embed_query(text)
+    cache.embed_query("a")
+    cache.embed_query("d")
+
+    assert cache.stats()["evictions"] >= 1
+    backend.embedded.clear()
+    cache.embed_query("a")
+    cache.embed_query("d")
+    assert backend.embedded == []
+
+
+def test_overwritten_rows_are_not_counted_twice(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # Room for three vectors. Two threads missing on the same texts, then refresh.py storing them
+    # through the same file, must not push the count over the budget.
+    app = CachedEmbeddings(CountingEmbeddings(), cache_path=path, max_bytes=100)
+    refresh = CachedEmbeddings(CountingEmbeddings(), cache_path=path, max_bytes=100)
+    app._store({"a": [0.0] * 8, "b": [0.0] * 8})
+    app._store({"a": [0.0] * 8, "b": [0.0] * 8})
+    refresh._store({"a": [0.0] * 8, "b": [0.0] * 8})
+    app._store({"c": [1.0] * 8})
+    assert app._total_bytes == 96
+    assert app.evictions == refresh.evictions == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from embedding_backends import HashingEmbeddings
+from embedding_pipeline import EmbeddingPipeline
+
+
+class FlakyEmbeddings(HashingEmbeddings):
+    def __init__(self, fail_on_calls=()):
+        super().__init__(dimensions=16)
+        self.calls = 0
+        self.fail_on_calls = set(fail_on_calls)
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls in self.fail_on_calls:
+            raise RuntimeError("rate limited")
+        return super().embed_documents(texts)
+
+
+def test_hashing_embeddings_are_deterministic_and_normalised():
+    embeddings = HashingEmbeddings(dimensions=32)
+    vector = embeddings.embed_query("Metformin hydrochloride tablets")
+    assert vector == HashingEmbeddings(dimensions=32).embed_query("Metformin hydrochloride tablets")
+    assert abs(sum(v * v for v in vector) - 1.0) < 1e-9
+
+
+def test_pipeline_batches_and_retries():
+    ids = [f"id-{i}" for i in range(10)]
+    texts = [f"chunk number {i}" for i in range(10)]
+    written = {}
+    pipeline = EmbeddingPipeline(FlakyEmbeddings(fail_on_calls={2}), batch_size=3, max_workers=2,
+                                 backoff_seconds=0.01)
+    report = pipeline.run(ids, texts, lambda batch_ids, vectors: written.update(zip(batch_ids, vectors)))
+
+    assert report["batches"] == 4
+    assert report["retries"] == 1
+    assert sorted(written) == sorted(ids)
+    assert written["id-4"] == HashingEmbeddings(dimensions=16).embed_query("chunk number 4")
+
+
+def test_pipeline_resumes_from_checkpoint():
+    ids = [f"id-{i}" for i in range(6)]
+    texts = [f"chunk number {i}" for i in range(6)]
+    checkpoint = set()
+
+    crashing = EmbeddingPipeline(FlakyEmbeddings(fail_on_calls={2}), batch_size=2, max_workers=1, max_retries=0)
+    with pytest.raises(Exception):
+        crashing.run(ids, texts, lambda batch_ids, vectors: checkpoint.update(batch_ids))
+    assert {"id-0", "id-1"} <= checkpoint
+    assert not {"id-2", "id-3"} & checkpoint
+
+    resumed = EmbeddingPipeline(FlakyEmbeddings(), batch_size=2, max_workers=1)
+    report = resumed.run(ids, texts, lambda batch_ids, vectors: checkpoint.update(batch_ids), skip_ids=checkpoint)
+    assert report["embedded"] + report["skipped"] == 6
+    assert report["embedded"] >= 2
+    assert checkpoint == set(ids)
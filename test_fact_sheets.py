@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import List
+
+from langchain.llms.base import LLM
+from langchain.schema import Document
+
+import async_pipeline
+from embedding_backends import HashingEmbeddings
+from fact_sheets import abuild_fact_sheets, get_fact_sheet_store, load_fact_sheets, lookup_fact_sheet
+from query_analysis import QueryAnalysis
+from vectorstore import update_vector_store
+
+
+def _label(name: str, dose: str) -> List[Document]:
+    sections = {
+        "1 INDICATIONS AND USAGE": f"{name} is indicated for hypertension.",
+        "2 DOSAGE AND ADMINISTRATION": f"The recommended dose is {dose} once daily.",
+        "4 CONTRAINDICATIONS": "Known hypersensitivity.",
+        "6 ADVERSE REACTIONS": "Dizziness and headache.",
+        "16 HOW SUPPLIED/STORAGE AND HANDLING": "Store at room temperature.",
+    }
+    return [Document(page_content=text, metadata={"file": f"{name} Tablets", "section": section})
+            for section, text in sections.items()]
+
+
+class EchoLLM(LLM):
+    prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        # The map prompts end with the section text; echo it back as its "summary"
+        return prompt.split("Section:\n")[-1].split("\n\nSummary:")[0] if "Section:\n" in prompt else "Overview."
+
+
+def _build(persist_directory, documents, llm, **kwargs):
+    store, _ = update_vector_store(documents, persist_directory, HashingEmbeddings())
+    return store, asyncio.run(abuild_fact_sheets(store, persist_directory, llm, **kwargs))
+
+
+def test_build_writes_a_sheet_per_label_and_skips_current_ones(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    documents = _label("Lisinopril", "10 mg") + _label("Losartan", "50 mg")
+    _, report = _build(persist_directory, documents, EchoLLM(prompts=[]))
+    assert (report["labels"], report["built"], report["failed"]) == (2, 2, 0)
+
+    sheet = load_fact_sheets(persist_directory)["sheets"]["Lisinopril Tablets"]
+    assert sheet["summary"] == "Overview."
+    assert sheet["facts"]["dosage"] == "The recommended dose is 10 mg once daily."
+    assert sheet["facts"]["contraindications"] == "Known hypersensitivity."
+    assert sheet["facts"]["interactions"] == ""  # Not in this label
+    assert set(sheet["facts"]) == {"indications", "dosage", "contraindications", "warnings",
+                                   "adverse_reactions", "interactions"}
+
+    llm = EchoLLM(prompts=[])
+    _, report = _build(persist_directory, documents, llm)
+    assert (report["built"], report["up_to_date"]) == (0, 2)
+    assert llm.prompts == []
+
+
+def test_sheets_of_changed_labels_are_not_served(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    _build(persist_directory, _label("Lisinopril", "10 mg") + _label("Losartan", "50 mg"), EchoLLM(prompts=[]))
+    one_drug = QueryAnalysis(files=["Lisinopril Tablets"], drug_terms=["lisinopril"])
+    assert lookup_fact_sheet(persist_directory, one_drug)[0] == "Lisinopril Tablets"
+    assert lookup_fact_sheet(persist_directory, QueryAnalysis(files=["Lisinopril Tablets", "Losartan Tablets"])) is None
+    assert lookup_fact_sheet(persist_directory, QueryAnalysis(files=["Lisinopril Tablets"],
+                                                              intents=["dosage"])) is None
+
+    # Lisinopril's label changes in the index: its old sheet is stale until the next build
+    update_vector_store(_label("Lisinopril", "20 mg"), persist_directory, HashingEmbeddings(),
+                        files={"Lisinopril Tablets"})
+    assert lookup_fact_sheet(persist_directory, one_drug) is None
+    assert get_fact_sheet_store(persist_directory).get("Losartan Tablets") is not None
+
+
+def test_summarizer_answers_a_known_drug_from_its_sheet(tmp_path, monkeypatch):
+    persist_directory = str(tmp_path / "chroma_db")
+    store, _ = _build(persist_directory, _label("Lisinopril", "10 mg") + _label("Losartan", "50 mg"),
+                      EchoLLM(prompts=[]))
+    monkeypatch.setattr(async_pipeline, "analyze_query",
+                        lambda vector_store, query: QueryAnalysis(files=["Lisinopril Tablets"]))
+    llm = EchoLLM(prompts=[])
+    start = time.time()
+    response = asyncio.run(async_pipeline.asummarize("Summarize lisinopril", store, llm, log=lambda _: None))
+    assert time.time() - start < 0.1
+    assert response.startswith("[Tool: Summarizer] **Lisinopril Tablets**\n\nOverview.")
+    assert "**Dosage:**\nThe recommended dose is 10 mg once daily." in response
+    assert llm.prompts == []
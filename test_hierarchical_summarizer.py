@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import List
+
+from langchain.llms.base import LLM
+
+from hierarchical_summarizer import SummaryCache, asummarize_label
+
+SECTIONS = {
+    "1 INDICATIONS AND USAGE": "Metformin is indicated to improve glycemic control in adults with type 2 diabetes.",
+    "2 DOSAGE AND ADMINISTRATION": "Start with 500 mg orally twice a day with meals.",
+    "4 CONTRAINDICATIONS": "Severe renal impairment (eGFR below 30 mL/min/1.73 m2).",
+    "5 WARNINGS AND PRECAUTIONS": "Lactic acidosis has been reported. Assess renal function before starting.",
+    "6 ADVERSE REACTIONS": "The most common adverse reactions are diarrhea, nausea and vomiting.",
+    "8 USE IN SPECIFIC POPULATIONS": "Limited data in pregnant women are not sufficient to determine a risk.",
+    "15 REFERENCES": "1. Smith et al., Diabetes Care 2001.",
+}
+
+
+class SlowSummaryLLM(LLM):
+    prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-summary"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return f"summary {len(self.prompts)}"
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        await asyncio.sleep(0.1)
+        return self._call(prompt)
+
+
+class FakeStore:
+    def __init__(self, sections):
+        self.sections = sections
+        self.wheres = []
+
+    def get(self, where=None, include=None):
+        self.wheres.append(where)
+        files = where["file"]["$in"]
+        chunks = [(section, content) for section, content in self.sections.items()]
+        chunks.append(("Drug Label Information", "Pharmacokinetics: absorption is about 50% to 60%."))
+        return {
+            "documents": [content for _, content in chunks],
+            "metadatas": [{"file": files[0], "section": section,
+                           "section_path": "12 CLINICAL PHARMACOLOGY > 12.3 Pharmacokinetics"
+                           if section == "Drug Label Information" else section} for section, _ in chunks],
+        }
+
+
+def _summarize(store, llm, cache, query="Summarize metformin"):
+    return asyncio.run(asummarize_label(query, store, ["Metformin Tablets"], llm, cache))
+
+
+def test_every_section_is_mapped_in_parallel_then_reduced(tmp_path):
+    store, llm = FakeStore(SECTIONS), SlowSummaryLLM(prompts=[])
+    start = time.time()
+    result = _summarize(store, llm, SummaryCache(str(tmp_path / "summaries.db")))
+    elapsed = time.time() - start
+
+    assert store.wheres == [{"file": {"$in": ["Metformin Tablets"]}}]
+    assert result.sections == 7  # References dropped, the run-on chunk joins clinical pharmacology
+    assert result.llm_calls == 8 and result.reduce_levels == 1
+    map_prompts, reduce_prompt = llm.prompts[:-1], llm.prompts[-1]
+    assert not any("REFERENCES" in prompt for prompt in map_prompts)
+    assert any('"12 CLINICAL PHARMACOLOGY"' in prompt for prompt in map_prompts)
+    assert 'query "Summarize metformin"' in reduce_prompt
+    assert reduce_prompt.index("1 INDICATIONS") < reduce_prompt.index("12 CLINICAL PHARMACOLOGY")
+    # 7 map calls of 0.1s at 4 at a time, then the reduce: about 0.3s instead of 0.8s sequentially
+    assert elapsed < 0.6
+
+
+def test_repeat_summaries_are_served_from_the_cache(tmp_path):
+    cache = SummaryCache(str(tmp_path / "summaries.db"))
+    first = _summarize(FakeStore(SECTIONS), SlowSummaryLLM(prompts=[]), cache)
+    llm = SlowSummaryLLM(prompts=[])
+    second = _summarize(FakeStore(SECTIONS), llm, SummaryCache(str(tmp_path / "summaries.db")))
+    assert second.summary == first.summary
+    assert second.llm_calls == 0 and second.cached_calls == 8
+    assert llm.prompts == []
+
+    # A different question over the same label only pays for the reduce
+    third = _summarize(FakeStore(SECTIONS), llm, cache, query="Give me an overview of metformin")
+    assert (third.llm_calls, third.cached_calls) == (1, 7)
+
+
+def test_changed_section_is_the_only_one_re_summarized(tmp_path):
+    cache = SummaryCache(str(tmp_path / "summaries.db"))
+    _summarize(FakeStore(SECTIONS), SlowSummaryLLM(prompts=[]), cache)
+    updated = dict(SECTIONS, **{"6 ADVERSE REACTIONS": "The most common adverse reactions are diarrhea and nausea."})
+    llm = SlowSummaryLLM(prompts=[])
+    result = _summarize(FakeStore(updated), llm, cache)
+    assert result.llm_calls == 2  # The changed section and the reduce
+    assert "diarrhea and nausea" in llm.prompts[0]
@@ -0,0 +1,60 @@
+import hashlib
+
+import pytest
+
+import label_chunker
+from label_chunker import chunk_section, count_tokens, pack_sentences, section_path, split_on_markers
+
+WARNINGS = (
+    "5 WARNINGS AND PRECAUTIONS5.1 Lactic AcidosisPostmarketing cases of metformin-associated lactic acidosis "
+    "have resulted in death [see Dosage and Administration (2.2)]. Risk factors include renal impairment (5.1, 8.6). "
+    "5.2 Vitamin B12 DeficiencyIn clinical trials, metformin was associated with a decrease in vitamin B12 levels. "
+    "Measure hematologic parameters annually and take 2.5 mg doses into account."
+)
+
+
+def test_markers_split_subsections_but_not_cross_references():
+    segments = split_on_markers(WARNINGS, section_path("Drug Label Information"))
+    assert [path for path, _ in segments] == [
+        ["5 WARNINGS AND PRECAUTIONS"],
+        ["5 WARNINGS AND PRECAUTIONS", "5.1 Lactic Acidosis"],
+        ["5 WARNINGS AND PRECAUTIONS", "5.2 Vitamin B12 Deficiency"],
+    ]
+    assert "(5.1, 8.6)" in segments[1][1] and "(2.2)" in segments[1][1]
+    assert section_path("6. ADVERSE REACTIONS") == ["6 ADVERSE REACTIONS"]
+    assert section_path("8.1 Pregnancy") == ["8 USE IN SPECIFIC POPULATIONS", "8.1 Pregnancy"]
+
+
+def test_chunks_stay_within_budget_without_overlap():
+    sentences = [f"Sentence number {i} describes one finding of the label." for i in range(60)]
+    chunks = pack_sentences(sentences, max_tokens=50, min_tokens=10)
+    assert all(count_tokens(chunk) <= 50 * 1.25 for chunk in chunks)
+    assert " ".join(chunks) == " ".join(sentences)
+
+    chunks = chunk_section("5 WARNINGS AND PRECAUTIONS", WARNINGS * 6, max_tokens=60, min_tokens=10)
+    assert all(count_tokens(text) <= 60 * 1.25 for _, text in chunks)
+    assert {path for path, _ in chunks} == {"5 WARNINGS AND PRECAUTIONS > 5.1 Lactic Acidosis",
+                                            "5 WARNINGS AND PRECAUTIONS > 5.2 Vitamin B12 Deficiency"}
+
+
+def test_bare_headings_are_merged_not_chunked():
+    content = "1 INDICATIONS AND USAGE 1.1 Type 2 Diabetes Mellitus\n2 DOSAGE AND ADMINISTRATION\n" + WARNINGS
+    chunks = chunk_section("Drug Label Information", content, max_tokens=256, min_tokens=20)
+    assert len(chunks) == 2
+    assert all("INDICATIONS AND USAGE" not in text for _, text in chunks)
+
+
+def test_token_counts_never_download_the_encoding(tmp_path, monkeypatch):
+    tiktoken = pytest.importorskip("tiktoken")
+    loaded = []
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: loaded.append(name) or None)
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(label_chunker, "_encoding", None)
+    assert count_tokens("Take 2.5 mg daily.") == 7  # Words and punctuation, with nothing cached
+    assert loaded == []
+
+    # Only a build may fetch it; afterwards it is in the cache and used
+    monkeypatch.setattr(label_chunker, "_encoding", None)
+    (tmp_path / hashlib.sha1(label_chunker.TOKEN_ENCODING_URL.encode()).hexdigest()).write_bytes(b"")
+    label_chunker.load_token_encoding()
+    assert loaded == ["cl100k_base"]
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+
+import llm_client
+from async_pipeline import run_sync
+from llm_client import LMStudioLLM
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fail_next = 0
+        self.active = 0
+        self.max_active = 0
+        self.client_ports = set()
+        self.payloads = []
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_POST(self):
+        state = self.state
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with state.lock:
+            state.payloads.append(payload)
+            state.client_ports.add(self.client_address[1])
+            state.active += 1
+            state.max_active = max(state.max_active, state.active)
+            fail = state.fail_next > 0
+            state.fail_next -= fail
+        time.sleep(0.05)
+        with state.lock:
+            state.active -= 1
+
+        if fail:
+            body = b"busy"
+            self.send_response(503)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif payload.get("stream"):
+            body = b"".join(f"data: {json.dumps({'choices': [{'delta': {'content': t}}]})}\n\n".encode()
+                            for t in ["Take ", "with ", "food."]) + b"data: [DONE]\n\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            body = json.dumps({"choices": [{"message": {"content": "QA"}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    state = StubState()
+    handler = type("Handler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state.endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    llm_client._sessions.pop(state.endpoint, None)
+    llm_client._semaphores.pop(state.endpoint, None)
+
+
+def test_config_reaches_the_server_and_connections_are_reused(stub):
+    llm = LMStudioLLM(stub.endpoint, model="test-model", max_tokens=42)
+    assert [llm.invoke("classify") for _ in range(3)] == ["QA"] * 3
+    assert stub.payloads[0]["model"] == "test-model"
+    assert stub.payloads[0]["max_tokens"] == 42
+    assert len(stub.client_ports) == 1
+
+
+def test_retries_transient_errors(stub):
+    stub.fail_next = 2
+    llm = LMStudioLLM(stub.endpoint, max_retries=2, retry_backoff=0.01)
+    assert llm.invoke("classify") == "QA"
+    assert len(stub.payloads) == 3
+
+    stub.fail_next = 5
+    with pytest.raises(Exception, match="503"):
+        llm.invoke("classify")
+
+
+def test_concurrency_limit_is_enforced(stub):
+    llm = LMStudioLLM(stub.endpoint, max_concurrency=2)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(llm.invoke, ["q"] * 6))
+    assert stub.max_active <= 2
+
+
+def test_streaming_reports_tokens_to_callbacks(stub):
+    class Collector(BaseCallbackHandler):
+        tokens = []
+
+        def on_llm_new_token(self, token, **kwargs):
+            self.tokens.append(token)
+
+    llm = LMStudioLLM(stub.endpoint, streaming=True)
+    collector = Collector()
+    assert llm.invoke("How to take it?", config={"callbacks": [collector]}) == "Take with food."
+    assert collector.tokens == ["Take ", "with ", "food."]
+
+
+def test_async_requests_share_the_limit_and_stream(stub):
+    async def run():
+        llm = LMStudioLLM(stub.endpoint, max_concurrency=2)
+        answers = await asyncio.gather(*(llm.ainvoke("q") for _ in range(6)))
+        streamed = [chunk async for chunk in LMStudioLLM(stub.endpoint, streaming=True).astream("q")]
+        await llm_client.aclose_async_clients()
+        return answers, streamed
+
+    answers, streamed = asyncio.run(run())
+    assert answers == ["QA"] * 6
+    assert stub.max_active <= 2
+    assert streamed == ["Take ", "with ", "food."]
+
+
+def test_limit_holds_across_event_loops(stub):
+    async def fan_out():
+        llm = LMStudioLLM(stub.endpoint, max_concurrency=2)
+        return await asyncio.gather(*(llm.ainvoke("q") for _ in range(4)))
+
+    # Each run_sync call runs its own event loop, as concurrent Streamlit sessions do
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(lambda _: run_sync(fan_out()), range(2)))
+    assert results == [["QA"] * 4] * 2
+    assert stub.max_active <= 2
@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_streaming import iter_sse_tokens, stream_chat_completion
+
+TOKENS = ["Metformin", " is", " taken", " with", " meals."]
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    token_delay = 0.05
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert body["stream"] is True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in TOKENS:
+            event = {"choices": [{"delta": {"content": token}}]}
+            self.send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            time.sleep(self.token_delay)
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sse_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_iter_sse_tokens_skips_noise_and_stops_at_done():
+    lines = [": keep-alive", "", 'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+             'data: {"choices": [{"delta": {"content": "Hi"}}]}', "data: [DONE]",
+             'data: {"choices": [{"delta": {"content": "ignored"}}]}']
+    assert list(iter_sse_tokens(lines)) == ["Hi"]
+
+
+def test_first_token_arrives_before_generation_finishes(sse_server):
+    start = time.time()
+    arrivals = []
+    tokens = []
+    for token in stream_chat_completion(sse_server, {"messages": []}):
+        arrivals.append(time.time() - start)
+        tokens.append(token)
+
+    assert tokens == TOKENS
+    assert arrivals[0] < arrivals[-1] - 3 * SSEHandler.token_delay
@@ -0,0 +1,111 @@
+import numpy as np
+from langchain.schema import Document
+
+import numpy_store
+import vectorstore
+from embedding_backends import HashingEmbeddings
+from numpy_store import NumpyVectorStore, VectorIndex
+
+
+def _corpus(rows=300, dimensions=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows, dimensions)).astype(np.float32)
+    documents = [Document(page_content=f"chunk {i}", metadata={"file": f"Drug {i % 5}", "section": f"S{i % 3}"})
+                 for i in range(rows)]
+    return [f"id{i}" for i in range(rows)], vectors, documents, rng
+
+
+def test_flat_search_is_exact_and_filtered_by_masks(tmp_path):
+    ids, vectors, documents, rng = _corpus()
+    VectorIndex.build(ids, vectors, documents).save(str(tmp_path))
+    index = VectorIndex.load(str(tmp_path))
+    assert isinstance(index.vectors, np.memmap) and index.kind == "flat"
+
+    query = rng.normal(size=16).astype(np.float32)
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    results = index.search(query, 5)
+    assert [row for row, _ in results] == list(np.argsort(distances)[:5])
+    assert np.allclose([distance for _, distance in results], np.sort(distances)[:5], rtol=1e-4)
+
+    where = {"$and": [{"file": {"$in": ["Drug 1", "Drug 2"]}}, {"section": {"$ne": "S0"}}]}
+    allowed = [i for i, doc in enumerate(documents)
+               if doc.metadata["file"] in ("Drug 1", "Drug 2") and doc.metadata["section"] != "S0"]
+    expected = [allowed[i] for i in np.argsort(distances[allowed])[:5]]
+    assert [row for row, _ in index.search(query, 5, where)] == expected
+    assert index.get(ids=["id7", "missing"])["documents"] == ["chunk 7"]
+    assert len(index.get(where={"file": "Drug 3"})["ids"]) == 60
+
+    for dtype in ("float16", "int8"):
+        quantized = VectorIndex.build(ids, vectors, documents, dtype=dtype)
+        assert quantized.search(query, 1)[0][0] == results[0][0]
+
+
+def test_ivf_index_probes_lists_and_answers_selective_filters_exactly():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, 16)) * 5
+    vectors = (centers[rng.integers(20, size=2000)] + rng.normal(size=(2000, 16))).astype(np.float32)
+    ids = [f"id{i}" for i in range(2000)]
+    documents = [Document(page_content=str(i), metadata={"file": f"Drug {i % 100}", "section": "S"})
+                 for i in range(2000)]
+    flat = VectorIndex.build(ids, vectors, documents, index="flat")
+    ivf = VectorIndex.build(ids, vectors, documents)
+    assert ivf.kind == "flat"  # Below IVF_THRESHOLD
+    ivf = VectorIndex.build(ids, vectors, documents, index="ivf")
+    assert ivf.kind == "ivf" and len(ivf.centroids) == 44
+
+    overlap = []
+    for query in vectors[:50] + rng.normal(scale=0.1, size=(50, 16)).astype(np.float32):
+        exact = {flat.ids[row] for row, _ in flat.search(query, 10)}
+        found = {ivf.ids[row] for row, _ in ivf.search(query, 10)}
+        overlap.append(len(exact & found) / 10)
+    assert np.mean(overlap) > 0.9
+    # 20 rows match: fewer than the probed lists hold, so they are all scored
+    where = {"file": "Drug 7"}
+    assert [flat.ids[row] for row, _ in flat.search(vectors[0], 5, where)] == \
+        [ivf.ids[row] for row, _ in ivf.search(vectors[0], 5, where)]
+
+
+def test_store_builds_keep_the_numpy_backend_in_step_with_chroma(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    embeddings = HashingEmbeddings(dimensions=64)
+    docs = [Document(page_content=text, metadata={"file": file, "section": "WARNINGS"})
+            for file, text in [("Aspirin", "may cause stomach bleeding"), ("Aspirin", "take with food"),
+                               ("Ibuprofen", "may cause stomach bleeding and ulcers"), ("Ibuprofen", "take daily")]]
+    chroma, _ = vectorstore.update_vector_store(docs, persist_directory, embeddings)
+    store = vectorstore.open_vector_store(persist_directory, backend="numpy")
+    assert isinstance(store, NumpyVectorStore)
+    for where in (None, {"file": {"$in": ["Ibuprofen"]}}):
+        expected = [doc.page_content for doc in chroma.similarity_search("stomach bleeding", k=2, filter=where)]
+        assert [doc.page_content for doc in store.similarity_search("stomach bleeding", k=2, filter=where)] == expected
+    assert [doc.page_content for doc in store.as_retriever(search_kwargs={"k": 1}).invoke("take with food")] == \
+        ["take with food"]
+
+    vectorstore.update_vector_store(docs[:3], persist_directory, embeddings)
+    assert len(vectorstore.open_vector_store(persist_directory, backend="numpy").index) == 3
+    # An index left behind by the chunks it covers is not served
+    vectorstore.save_manifest(persist_directory, {"other": {}}, vectorstore.load_store_embedding(persist_directory))
+    assert not isinstance(vectorstore.open_vector_store(persist_directory, backend="numpy"), NumpyVectorStore)
+
+
+def test_mask_cache_keeps_only_recent_filters(monkeypatch):
+    monkeypatch.setattr(numpy_store, "MASK_CACHE_SIZE", 2)
+    ids, vectors, documents, _ = _corpus()
+    index = VectorIndex.build(ids, vectors, documents)
+    first = index.mask({"file": "Drug 0"})
+    index.mask({"file": "Drug 1"})
+    assert index.mask({"file": "Drug 0"}) is first  # Reused, and now the most recent
+    index.mask({"file": "Drug 2"})
+    assert list(index._masks) == ['{"file": "Drug 0"}', '{"file": "Drug 2"}']
+
+
+def test_updates_keep_the_index_precision_it_was_built_with(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    embeddings = HashingEmbeddings(dimensions=64)
+    docs = [Document(page_content=f"chunk {i}", metadata={"file": f"Drug {i}", "section": "S"}) for i in range(4)]
+    vectorstore.create_vector_store(docs[:3], persist_directory, embeddings, vector_dtype="int8")
+    vectorstore.update_vector_store(docs, persist_directory, embeddings)
+    index = VectorIndex.load(persist_directory)
+    assert len(index) == 4 and index.dtype == "int8"
+
+    vectorstore.update_vector_store(docs, persist_directory, embeddings, vector_dtype="float16")
+    assert VectorIndex.load(persist_directory).dtype == "float16"
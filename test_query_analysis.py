@@ -0,0 +1,49 @@
+from langchain.schema import Document
+
+import vectorstore
+from embedding_backends import HashingEmbeddings
+from label_sections import canonical_section
+from query_analysis import QueryAnalyzer, filtered_search, get_query_analyzer
+
+
+FILES = ["Metformin Hydrochloride Oral Solution", "Amlodipine Besylate and Olmesartan Medoxomil Tablets",
+         "Olmesartan Medoxomil Tablets, USP", "Celecoxib capsules"]
+SECTIONS = ["6 ADVERSE REACTIONS", "6.1 Clinical Trials Experience", "2 DOSAGE AND ADMINISTRATION", "Nursing Mothers"]
+
+
+def test_canonical_sections():
+    assert canonical_section("6.1\tClinical Trials Experience") == "adverse_reactions"
+    assert canonical_section("5.1 Lactic Acidosis") == "warnings"
+    assert canonical_section("Nursing Mothers") == "specific_populations"
+    assert canonical_section("CONTRAINDICATIONS") == "contraindications"  # Not "indications"
+    assert canonical_section("Label:CELECOXIB- celecoxib capsule") is None
+
+
+def test_analysis_detects_drugs_and_section_intent():
+    analyzer = QueryAnalyzer(FILES, SECTIONS)
+
+    analysis = analyzer.analyze("What are the side effects of metfromin?")
+    assert analysis.files == ["Metformin Hydrochloride Oral Solution"]
+    assert analysis.intents == ["adverse_reactions"]
+    assert analysis.sections == ["6 ADVERSE REACTIONS", "6.1 Clinical Trials Experience"]
+
+    assert analyzer.analyze("Dose of amlodipine and olmesartan").files == [FILES[1]]
+    assert analyzer.analyze("olmesartan dosage").files == sorted(FILES[1:3])
+    assert analyzer.analyze("Recommend something for allergies").filters() == [None]
+
+
+def test_filtered_search_narrows_to_the_drug_and_relaxes_when_short(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    docs = [Document(page_content=f"{file} {section} text", metadata={"file": file, "section": section})
+            for file in FILES for section in SECTIONS]
+    store, _ = vectorstore.update_vector_store(docs, persist_directory, HashingEmbeddings())
+
+    analysis = get_query_analyzer(persist_directory).analyze("celecoxib side effects")
+    embedding = HashingEmbeddings().embed_query("celecoxib side effects")
+
+    found = filtered_search(store, embedding, 2, analysis)
+    assert {(doc.metadata["file"], canonical_section(doc.metadata["section"])) for doc in found} == \
+        {("Celecoxib capsules", "adverse_reactions")}
+
+    found = filtered_search(store, embedding, 4, analysis)
+    assert [doc.metadata["file"] for doc in found] == ["Celecoxib capsules"] * 4
@@ -0,0 +1,74 @@
+import json
+
+from embedding_backends import HashingEmbeddings
+from refresh import diff_label, label_version, load_label_versions, refresh
+from vectorstore import load_manifest
+
+LABELS = {
+    f"Drug {name} Tablets": {
+        "product_name": f"Drug {name} Tablets",
+        "HIGHLIGHTS OF PRESCRIBING INFORMATION": f"Updated April 24, 2023 Drug {name} tablets, for oral use.",
+        "1 INDICATIONS AND USAGE": f"Drug {name} is indicated for the treatment of condition {name}.",
+        "2 DOSAGE AND ADMINISTRATION": f"The recommended dose of drug {name} is {len(name) * 100} mg once daily.",
+    }
+    for name in ("Alpha", "Beta", "Gamma", "Delta")
+}
+
+
+def _write_labels(json_dir, labels):
+    json_dir.mkdir(exist_ok=True)
+    for name, data in labels.items():
+        with open(json_dir / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+def test_diff_label_reports_sections_and_stamp():
+    old = label_version(LABELS["Drug Alpha Tablets"])
+    changed = dict(LABELS["Drug Alpha Tablets"], **{
+        "HIGHLIGHTS OF PRESCRIBING INFORMATION": "Updated May 2, 2024 Drug Alpha tablets, for oral use.",
+        "5 WARNINGS AND PRECAUTIONS": "Monitor renal function."})
+    diff = diff_label(old, label_version(changed))
+    assert diff["status"] == "changed"
+    assert diff["added"] == ["5 WARNINGS AND PRECAUTIONS"]
+    assert diff["changed"] == ["HIGHLIGHTS OF PRESCRIBING INFORMATION"]
+    assert diff["updated"] == ["April 24, 2023", "May 2, 2024"]
+    assert diff_label(old, old)["status"] == "unchanged"
+    assert diff_label(None, old)["status"] == "new" and diff_label(old, None)["status"] == "removed"
+
+
+def test_refresh_reindexes_only_changed_labels(tmp_path):
+    json_dir, persist_directory = tmp_path / "labels", str(tmp_path / "chroma_db")
+    _write_labels(json_dir, LABELS)
+    report = refresh(str(json_dir), persist_directory, HashingEmbeddings())
+    assert report["counts"]["new"] == 4
+    chunks_before = load_manifest(persist_directory)
+
+    # Two labels change one section each; the other two cost nothing
+    _write_labels(json_dir, {
+        "Drug Beta Tablets": dict(LABELS["Drug Beta Tablets"], **{"2 DOSAGE AND ADMINISTRATION": "Take 5 mg."}),
+        "Drug Delta Tablets": dict(LABELS["Drug Delta Tablets"], **{"4 CONTRAINDICATIONS": "Hypersensitivity."}),
+    })
+    report = refresh(str(json_dir), persist_directory, HashingEmbeddings())
+    assert report["counts"] == {"new": 0, "changed": 2, "removed": 0, "unchanged": 2}
+    assert report["sections_changed"] == 2
+    assert report["index"]["added"] == 2 and report["index"]["dropped"] == 1
+
+    chunks_after = load_manifest(persist_directory)
+    untouched = {chunk_id for chunk_id, entry in chunks_before.items() if entry["file"] in ("Drug Alpha Tablets",
+                                                                                             "Drug Gamma Tablets")}
+    assert untouched <= set(chunks_after)
+    assert load_label_versions(persist_directory)["Drug Delta Tablets"]["sections"].keys() >= {"4 CONTRAINDICATIONS"}
+
+    assert refresh(str(json_dir), persist_directory, HashingEmbeddings())["labels"] == {}
+
+
+def test_removed_label_is_dropped_from_the_index(tmp_path):
+    json_dir, persist_directory = tmp_path / "labels", str(tmp_path / "chroma_db")
+    _write_labels(json_dir, LABELS)
+    refresh(str(json_dir), persist_directory, HashingEmbeddings())
+    (json_dir / "Drug Gamma Tablets.json").unlink()
+
+    report = refresh(str(json_dir), persist_directory, HashingEmbeddings())
+    assert report["labels"]["Drug Gamma Tablets"]["status"] == "removed"
+    assert {entry["file"] for entry in load_manifest(persist_directory).values()} == {
+        "Drug Alpha Tablets", "Drug Beta Tablets", "Drug Delta Tablets"}
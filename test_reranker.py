@@ -0,0 +1,46 @@
+from langchain.schema import Document
+
+from label_chunker import count_tokens
+from query_analysis import QueryAnalysis
+from reranker import pack_context, rerank, rerank_and_pack
+
+LACTIC = "Lactic acidosis has been reported with metformin. Risk increases with renal impairment."
+DOCS = [
+    Document(page_content=LACTIC, metadata={"file": "Metformin Oral Solution", "section": "5 WARNINGS AND PRECAUTIONS"}),
+    Document(page_content=LACTIC + " Stop the drug if acidosis is suspected.",
+             metadata={"file": "Metformin Oral Solution", "section": "Drug Label Information",
+                       "section_path": "5 WARNINGS AND PRECAUTIONS > 5.1 Lactic Acidosis"}),
+    Document(page_content="The most common adverse reactions are diarrhea, nausea and vomiting.",
+             metadata={"file": "Metformin Oral Solution", "section": "6 ADVERSE REACTIONS"}),
+    Document(page_content="Store at 20 to 25 C. Dispense in a tight container.",
+             metadata={"file": "Metformin Oral Solution", "section": "16 HOW SUPPLIED/STORAGE AND HANDLING"}),
+    Document(page_content="Common adverse reactions include headache and dizziness.",
+             metadata={"file": "Glimepiride Tablets", "section": "6 ADVERSE REACTIONS"}),
+]
+
+
+def test_rerank_prefers_asked_section_and_drug_and_demotes_near_duplicates():
+    analysis = QueryAnalysis(files=["Metformin Oral Solution"], intents=["adverse_reactions"],
+                             drug_terms=["metformin"])
+    ranked = rerank("What are the side effects of metformin?", DOCS, "QA", analysis)
+    assert ranked[:2] == [DOCS[2], DOCS[0]]
+    assert ranked.index(DOCS[1]) > ranked.index(DOCS[3])  # Mostly repeats DOCS[0]
+
+
+def test_packing_trims_repeated_sentences_and_respects_the_budget():
+    packed = pack_context(DOCS[:2], budget=1000)
+    assert [doc.page_content for doc in packed.documents] == [LACTIC, "Stop the drug if acidosis is suspected."]
+    assert packed.dropped_sentences == 2
+
+    budget = count_tokens(LACTIC) + 5
+    packed = pack_context(DOCS, budget=budget)
+    assert packed.tokens <= budget
+    assert sum(count_tokens(doc.page_content) for doc in packed.documents) <= budget
+
+
+def test_packed_context_never_exceeds_the_old_top_k():
+    packed = rerank_and_pack("metformin lactic acidosis", DOCS, "Summarizer", baseline_k=2)
+    assert packed.baseline_tokens == count_tokens(DOCS[0].page_content) + count_tokens(DOCS[1].page_content)
+    assert packed.tokens <= packed.baseline_tokens
+    assert packed.tokens_saved == packed.baseline_tokens - packed.tokens
+    assert packed.candidates == len(DOCS)
@@ -0,0 +1,50 @@
+import time
+
+from embedding_backends import HashingEmbeddings
+from response_cache import ResponseCache, normalize_query
+
+
+def make_cache(**kwargs):
+    return ResponseCache(embeddings=HashingEmbeddings(dimensions=512), **kwargs)
+
+
+def test_exact_match_after_normalization():
+    cache = make_cache()
+    cache.put("What are the side effects of Celecoxib?", "v1", "QA", "[Tool: QA] nausea", latency=4.0)
+
+    hit = cache.get("  what are the SIDE effects of celecoxib ", "v1")
+    assert normalize_query("Side-effects?") == "side effects"
+    assert hit["response"] == "[Tool: QA] nausea"
+    assert hit["match"] == "exact"
+    assert hit["tool"] == "QA"
+    assert cache.stats()["latency_saved"] == 4.0
+
+
+def test_semantic_match_respects_threshold_and_numbers():
+    cache = make_cache(similarity_threshold=0.6)
+    cache.put("What are the common side effects of Celecoxib capsules", "v1", "QA", "answer")
+
+    assert cache.get("What are common side effects of Celecoxib capsules", "v1")["match"] == "semantic"
+    assert cache.get("How is Metformin oral solution stored", "v1") is None
+
+    cache.put("Dosage of Roflumilast 250 mcg tablets", "v1", "QA", "starting dose")
+    assert cache.get("Dosage of Roflumilast 500 mcg tablets", "v1") is None
+
+
+def test_corpus_version_tool_ttl_and_lru():
+    cache = make_cache(ttl_seconds=0.05, max_entries=2)
+    cache.put("summarize amoxicillin", "v1", "Summarizer", "summary")
+    assert cache.get("summarize amoxicillin", "v2") is None
+    assert cache.get("summarize amoxicillin", "v1", tool="QA") is None
+
+    time.sleep(0.06)
+    assert cache.get("summarize amoxicillin", "v1") is None
+
+    cache = make_cache(max_entries=2)
+    cache.put("a", "v1", "QA", "1")
+    cache.put("b", "v1", "QA", "2")
+    cache.get("a", "v1")
+    cache.put("c", "v1", "QA", "3")
+    assert cache.get("a", "v1") is not None
+    assert cache.get("b", "v1") is None
+    assert cache.stats()["entries"] == 2
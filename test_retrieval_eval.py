@@ -0,0 +1,53 @@
+import shutil
+
+from langchain.schema import Document
+
+from embedding_backends import HashingEmbeddings
+from retrieval_eval import (EvalQuestion, EvalResult, build_store, drug_phrase, evaluate, generate_questions,
+                            pick_configuration, run_evaluation)
+
+
+def _labels(tmp_path):
+    json_dir = tmp_path / "labels"
+    json_dir.mkdir()
+    for name in ("Amoxicillin Capsules, USP.json", "Ramelteon Tablets.json"):
+        shutil.copy(f"datasets/microlabs_usa/{name}", json_dir / name)
+    return str(json_dir)
+
+
+def test_questions_come_from_label_sections(tmp_path):
+    assert drug_phrase("Amlodipine Besylate and Olmesartan Medoxomil Tablets") == "amlodipine and olmesartan"
+    questions = {(question.drug, question.section): question for question in generate_questions(_labels(tmp_path))}
+    side_effects = questions[("ramelteon", "adverse_reactions")]
+    assert side_effects.query == "What are the side effects of ramelteon?"
+    assert side_effects.files == {"Ramelteon Tablets"}
+    assert ("amoxicillin", "dosage") in questions
+    assert {drug for drug, _ in questions} == {"amoxicillin", "ramelteon"}
+
+
+def test_recall_mrr_and_tokens():
+    questions = [EvalQuestion("What is the dose of aspirin?", "aspirin", {"Aspirin"}, "dosage"),
+                 EvalQuestion("Who should not take aspirin?", "aspirin", {"Aspirin"}, "contraindications")]
+    docs = [Document(page_content="Aspirin may cause bleeding.", metadata={"file": "Aspirin", "section": "WARNINGS"}),
+            Document(page_content="Take 81 mg daily.",
+                     metadata={"file": "Aspirin", "section": "Drug Label Information", "section_path": "2 DOSAGE"})]
+    result = evaluate(lambda query, embedding, k: docs, questions, [[0.0], [0.0]], 2, "store", "fixed")
+    assert (result.recall, result.drug_recall, result.mrr) == (0.5, 1.0, 0.25)
+    assert result.misses == ["Who should not take aspirin?"]
+    assert result.context_tokens > 0
+
+    cheap = EvalResult("store", "a", 3, recall=0.81, context_tokens=300)
+    best = EvalResult("store", "b", 8, recall=0.82, context_tokens=700)
+    worse = EvalResult("store", "c", 1, recall=0.5, context_tokens=100)
+    assert pick_configuration([best, cheap, worse]) is cheap
+
+
+def test_filtered_retrieval_beats_plain_vector_search(tmp_path):
+    json_dir = _labels(tmp_path)
+    store = build_store(json_dir, str(tmp_path / "store"), HashingEmbeddings(), max_chunk_tokens=256)
+    questions = generate_questions(json_dir)
+    results = {result.retriever: result
+               for result in run_evaluation(store, questions, ["vector", "hybrid_filtered", "reranked"], [5], "test")}
+    assert results["hybrid_filtered"].recall > results["vector"].recall
+    assert results["hybrid_filtered"].drug_recall == 1.0
+    assert results["reranked"].context_tokens <= results["hybrid_filtered"].context_tokens
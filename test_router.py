@@ -0,0 +1,37 @@
+import time
+
+from langchain_core.language_models.fake import FakeListLLM
+
+import router
+
+
+def test_parse_route_accepts_loose_replies():
+    assert router.parse_route("QA") == "QA"
+    assert router.parse_route(" Recommender.\n") == "Recommender"
+    assert router.parse_route("The best tool is Alternative Search") == "Alternative Search"
+    assert router.parse_route("no idea", default="Summarizer") == "Summarizer"
+
+
+def test_local_classifier_is_accurate_and_fast():
+    classifier = router.get_intent_classifier()
+    queries, labels = router.load_intent_examples(router.INTENT_EVAL_FILE)
+
+    start = time.perf_counter()
+    predictions = [classifier.predict(query)[0] for query in queries]
+    per_query = (time.perf_counter() - start) / len(queries)
+
+    accuracy = sum(p == label for p, label in zip(predictions, labels)) / len(labels)
+    assert accuracy >= 0.85
+    assert per_query < 0.001
+
+
+def test_llm_is_consulted_only_below_threshold():
+    classifier = router.get_intent_classifier()
+    llm = FakeListLLM(responses=["Alternative Search"])
+
+    tool, confidence, source = router.route_query("Recommend an alternative to atorvastatin", llm, classifier)
+    assert (tool, source) == ("Recommender", "local")
+
+    tool, confidence, source = router.route_query("Recommend an alternative to atorvastatin", llm, classifier,
+                                                  threshold=1.01)
+    assert (tool, source) == ("Alternative Search", "llm")
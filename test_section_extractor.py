@@ -0,0 +1,59 @@
+import os
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+from section_extractor import extract_sections, sibling_walk_sections, tree_sections
+from web_scrapper import process_prescribing_html, process_prescribing_soup
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "datasets", "html_fixtures")
+FIXTURES = sorted(name for name in os.listdir(FIXTURE_DIR) if name.endswith(".html"))
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_extractors_match_the_sibling_walk_on_saved_pages(fixture):
+    with open(os.path.join(FIXTURE_DIR, fixture), "r", encoding="utf-8") as f:
+        html = f.read()
+    expected = sibling_walk_sections(BeautifulSoup(html, "html.parser"))
+    assert len(expected) > 1
+    assert tree_sections(BeautifulSoup(html, "html.parser")) == expected
+    assert extract_sections(html) == expected
+    assert list(extract_sections(html)) == list(expected)
+
+
+# Random tag soup: unclosed and stray tags, empty elements, nested and duplicate headers,
+# entities, comments, CDATA and string-container tags
+def _random_html(rng: random.Random, depth: int = 0) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        choice = rng.random()
+        if choice < 0.2:
+            parts.append(rng.choice(["Dose", "  ", "5.1 Risk", "a &amp; b", "&#150;", "&nbsp;", "x &bogus; y", "\n"]))
+        elif choice < 0.35:
+            parts.append(f"<{rng.choice(['h1', 'h2', 'h3'])}>{rng.choice(['WARNINGS', 'Dosage', ''])}"
+                         + ("" if rng.random() < 0.2 else f"</{rng.choice(['h1', 'h2', 'h3'])}>"))
+        elif choice < 0.45:
+            parts.append(rng.choice(["<br>", "<br/>", "<img src='a'>", "<hr>", "</p>", "</div>", "<!-- note -->",
+                                     "<![CDATA[raw]]>", "<script>var h = '<h2>x</h2>';</script>",
+                                     "<style>p { }</style>", "<template><p>t</p></template>", "<rt>ruby</rt>"]))
+        elif depth < 4:
+            tag = rng.choice(["div", "p", "span", "table", "td", "li", "h4"])
+            closing = "" if rng.random() < 0.15 else f"</{tag}>"
+            parts.append(f"<{tag}>{_random_html(rng, depth + 1)}{closing}")
+    return "".join(parts)
+
+
+def test_streaming_extractor_matches_on_random_markup():
+    rng = random.Random(14)
+    for _ in range(300):
+        html = _random_html(rng)
+        assert extract_sections(html) == sibling_walk_sections(BeautifulSoup(html, "html.parser")), html
+
+
+def test_scraper_parses_html_without_a_soup():
+    with open(os.path.join(FIXTURE_DIR, "methenamine_hippurate_tablets.html"), "r", encoding="utf-8") as f:
+        html = f.read()
+    result = process_prescribing_html("Methenamine Hippurate Tablets, USP", html)
+    assert result == process_prescribing_soup("Methenamine Hippurate Tablets, USP", BeautifulSoup(html, "html.parser"))
+    assert result["product_name"] == "Methenamine Hippurate Tablets, USP"
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+import async_pipeline
+import tracing
+from llm_client import LMStudioLLM
+from tracing import configure_tracing, load_spans, span, stage_stats
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    configure_tracing(path)
+    yield path
+    configure_tracing(None)
+
+
+def test_spans_nest_within_tasks_and_record_errors(trace_path):
+    async def stage(name):
+        with span(name, chunks=3):
+            await asyncio.sleep(0.01)
+
+    async def request():
+        with span("request"):
+            await asyncio.gather(stage("embed_query"), stage("classify_query"))
+            with pytest.raises(ValueError), span("llm"):
+                raise ValueError("server error")
+
+    asyncio.run(request())
+    spans = {record["name"]: record for record in load_spans(trace_path)}
+    root = spans["request"]
+    assert root["parent_id"] is None
+    # Concurrent tasks both hang off the request span, not off each other
+    for name in ("embed_query", "classify_query", "llm"):
+        assert (spans[name]["parent_id"], spans[name]["trace_id"]) == (root["span_id"], root["trace_id"])
+    assert spans["embed_query"]["duration_ms"] >= 10
+    assert spans["llm"]["error"] == "ValueError: server error"
+
+
+def test_stage_stats_percentiles():
+    spans = [{"name": "retrieve", "duration_ms": float(ms), "attributes": {"chunks": 5}, "error": None}
+             for ms in range(1, 101)]
+    spans.append({"name": "llm", "duration_ms": 900.0, "error": "timeout",
+                  "attributes": {"prompt_tokens": 700, "completion_tokens": 120}})
+    stats = stage_stats(spans)
+    assert stats["retrieve"]["count"] == 100
+    assert stats["retrieve"]["p50"] == pytest.approx(50.5)
+    assert stats["retrieve"]["p99"] == pytest.approx(99.01)
+    assert stats["retrieve"]["chunks"] == 5
+    assert (stats["llm"]["errors"], stats["llm"]["prompt_tokens"]) == (1, 700)
+    report = tracing.stats_report(stats)
+    assert report.splitlines()[1].startswith("llm")  # Slowest stage first
+
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeStore:
+    embeddings = FixedEmbeddings()
+
+    def similarity_search_by_vector(self, embedding, k):
+        return [Document(page_content="Take aspirin with food.", metadata={"file": "Aspirin", "section": "DOSAGE"})]
+
+
+def test_request_spans_cover_each_stage(trace_path, monkeypatch):
+    async def classify(query, llm):
+        return "Summarizer"
+
+    async def apost(self, payload):
+        return self._content({"choices": [{"message": {"content": "Aspirin is taken with food."}}],
+                              "usage": {"prompt_tokens": 42, "completion_tokens": 6}}, attempt=0)
+
+    monkeypatch.setattr(async_pipeline, "aclassify_query", classify)
+    monkeypatch.setattr(LMStudioLLM, "_apost", apost)
+    asyncio.run(async_pipeline.ahandle_query("Give me an overview of aspirin", FakeStore(),
+                                             LMStudioLLM(endpoint="http://stub"), log=lambda _: None))
+
+    spans = {record["name"]: record for record in load_spans(trace_path)}
+    assert set(spans) == {"handle_query", "embed_query", "classify_query", "summarize", "retrieve", "rerank_pack",
+                          "llm"}
+    assert spans["handle_query"]["attributes"]["tool"] == "Summarizer"
+    assert spans["retrieve"]["attributes"]["chunks"] == 1
+    assert spans["llm"]["attributes"]["prompt_tokens"] == 42  # Reported by the server
+    assert spans["llm"]["parent_id"] == spans["summarize"]["span_id"]
+    assert len({record["trace_id"] for record in spans.values()}) == 1
+
+
+def test_spans_are_mirrored_to_opentelemetry(tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    configure_tracing(str(tmp_path / "traces.jsonl"), sinks=[tracing.OpenTelemetrySink(provider.get_tracer("test"))])
+    try:
+        with span("request"), span("retrieve", chunks=4, mode="hybrid"):
+            pass
+    finally:
+        configure_tracing(None)
+    exported = {item.name: item for item in exporter.get_finished_spans()}
+    assert exported["retrieve"].parent.span_id == exported["request"].context.span_id
+    assert dict(exported["retrieve"].attributes) == {"chunks": 4, "mode": "hybrid"}
+    assert len(load_spans(str(tmp_path / "traces.jsonl"))) == 2
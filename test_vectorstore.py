@@ -0,0 +1,93 @@
+import os
+import hashlib
+
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+import vectorstore
+from embedding_backends import HashingEmbeddings
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:8]]
+
+
+def make_docs(texts, file="Aspirin", section="WARNINGS"):
+    return [Document(page_content=text, metadata={"file": file, "section": section}) for text in texts]
+
+
+def test_chunk_ids_are_stable_and_distinct():
+    docs = make_docs(["a", "b", "a"])
+    ids = vectorstore.assign_chunk_ids(docs)
+    assert ids == vectorstore.assign_chunk_ids(make_docs(["a", "b", "a"]))
+    assert len(set(ids)) == 3
+    assert vectorstore.assign_chunk_ids(make_docs(["a"], section="DOSAGE")) != ids[:1]
+
+
+def test_incremental_update_reports_added_kept_dropped(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    embeddings = FakeEmbeddings()
+
+    _, report = vectorstore.update_vector_store(make_docs(["one", "two", "three"]), persist_directory, embeddings)
+    assert report == {"added": 3, "kept": 0, "dropped": 0}
+
+    store, report = vectorstore.update_vector_store(make_docs(["one", "three", "four"]), persist_directory, embeddings)
+    assert report == {"added": 1, "kept": 2, "dropped": 1}
+    assert store._collection.count() == 3
+    assert len(vectorstore.load_manifest(persist_directory)) == 3
+
+
+def test_corpus_version_changes_with_indexed_chunks(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    assert vectorstore.get_corpus_version(persist_directory) == "unversioned"
+
+    vectorstore.save_manifest(persist_directory, {"a": {}, "b": {}})
+    first = vectorstore.get_corpus_version(persist_directory)
+    vectorstore.save_manifest(persist_directory, {"a": {}, "c": {}})
+    assert vectorstore.get_corpus_version(persist_directory) != first
+
+
+def test_store_records_its_embeddings_and_rejects_others(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    vectorstore.update_vector_store(make_docs(["one", "two"]), persist_directory, HashingEmbeddings(dimensions=64))
+    assert vectorstore.load_store_embedding(persist_directory)["model"] == "hashing-64"
+    assert isinstance(vectorstore.open_vector_store(persist_directory).embeddings, HashingEmbeddings)
+
+    with pytest.raises(Exception, match="--migrate --embedding-backend hashing"):
+        vectorstore.open_vector_store(persist_directory, HashingEmbeddings(dimensions=32))
+    with pytest.raises(Exception, match="was embedded with hashing"):
+        vectorstore.update_vector_store(make_docs(["three"]), persist_directory, HashingEmbeddings(dimensions=32))
+
+
+def test_migrate_re_embeds_the_stored_chunks(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    vectorstore.update_vector_store(make_docs(["take with food", "may cause bleeding"]), persist_directory,
+                                    HashingEmbeddings(dimensions=64))
+    before = vectorstore.load_manifest(persist_directory)
+
+    store = vectorstore.migrate_vector_store(persist_directory, HashingEmbeddings(dimensions=32))
+    assert vectorstore.load_store_embedding(persist_directory)["model"] == "hashing-32"
+    assert vectorstore.load_manifest(persist_directory) == before
+    assert os.path.exists(os.path.join(persist_directory, "bm25_index.npz"))  # Side indexes carried over
+    assert vectorstore.load_store_embedding(persist_directory + ".bak")["model"] == "hashing-64"
+    docs = store.similarity_search("may cause bleeding", k=1)
+    assert docs[0].page_content == "may cause bleeding"
+
+
+def test_resumed_build_drops_chunks_no_longer_in_the_corpus(tmp_path):
+    persist_directory = str(tmp_path / "chroma_db")
+    embeddings = HashingEmbeddings(dimensions=32)
+    vectorstore.update_vector_store(make_docs(["one", "two", "three"]), persist_directory, embeddings)
+
+    docs = make_docs(["one", "four"])
+    store = vectorstore.create_vector_store(docs, persist_directory, embeddings)
+    assert store._collection.count() == 2
+    assert set(vectorstore.load_manifest(persist_directory)) == set(vectorstore.assign_chunk_ids(docs))
+    # The side indexes cover the same chunks as the manifest, so they are served
+    assert type(vectorstore.open_vector_store(persist_directory, backend="numpy")).__name__ == "NumpyVectorStore"
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# Finished spans, one JSON object per line
+DEFAULT_TRACE_PATH = "./traces.jsonl"
+PERCENTILES = (50, 95, 99)
+# Span attributes averaged per stage by the CLI
+REPORTED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "chunks")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start: float = 0.0  # Epoch seconds
+    duration_ms: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    handle: Any = None  # The exporter's own span, when one is configured
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start": self.start, "duration_ms": round(self.duration_ms, 3), "attributes": self.attributes,
+                "error": self.error}
+
+
+# Appends finished spans to a local JSONL file; safe to share between threads
+class JSONLSink:
+    def __init__(self, path: str = DEFAULT_TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent: Optional[Span]):
+        pass
+
+    def on_end(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# Mirrors spans onto an OpenTelemetry tracer, keeping their parents, timing and attributes
+class OpenTelemetrySink:
+    def __init__(self, tracer=None):
+        from opentelemetry import trace
+        from opentelemetry.trace import Status, StatusCode
+
+        self._trace, self._status, self._error = trace, Status, StatusCode.ERROR
+        self.tracer = tracer or trace.get_tracer("druglabel-agent")
+
+    def on_start(self, span: Span, parent: Optional[Span]):
+        context = self._trace.set_span_in_context(parent.handle) if parent is not None and parent.handle else None
+        span.handle = self.tracer.start_span(span.name, context=context, start_time=int(span.start * 1e9))
+
+    def on_end(self, span: Span):
+        if span.handle is None:
+            return
+        span.handle.set_attributes({key: value for key, value in span.attributes.items()
+                                    if isinstance(value, (str, bool, int, float))})
+        if span.error:
+            span.handle.set_status(self._status(self._error, span.error))
+        span.handle.end(end_time=int((span.start + span.duration_ms / 1000) * 1e9))
+
+
+# Tracer exporting over OTLP/gRPC (e.g. to a local collector or Jaeger on port 4317)
+def otlp_tracer(endpoint: str, service_name: str = "druglabel-agent"):
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        raise Exception(f"[ERROR] OTLP export needs opentelemetry-sdk and opentelemetry-exporter-otlp: {e}")
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, insecure=True)))
+    return provider.get_tracer(service_name)
+
+
+# The span of the running task or thread; asyncio tasks inherit it when they are created
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_sinks: List = []
+
+
+# Spans are written to the JSONL file and, given an OTLP endpoint, exported as well. Without a call
+# to this, spans are still timed but go nowhere.
+def configure_tracing(path: Optional[str] = DEFAULT_TRACE_PATH, otlp_endpoint: Optional[str] = None, sinks=None):
+    configured = list(sinks or [])
+    if path:
+        configured.append(JSONLSink(path))
+    if otlp_endpoint:
+        configured.append(OpenTelemetrySink(otlp_tracer(otlp_endpoint)))
+    _sinks[:] = configured
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    parent = _current_span.get()
+    current = Span(name=name, trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+                   span_id=uuid.uuid4().hex[:16], parent_id=parent.span_id if parent else None,
+                   start=time.time(), attributes=attributes)
+    for sink in _sinks:
+        sink.on_start(current, parent)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - started) * 1000
+        _current_span.reset(token)
+        for sink in _sinks:
+            try:
+                sink.on_end(current)
+            except Exception as e:
+                print(f"[WARNING] Trace sink {type(sink).__name__} failed: {e}")
+
+
+# Attributes for the enclosing span, from code that doesn't own it (e.g. the router's confidence)
+def annotate(**attributes: Any):
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def load_spans(path: str = DEFAULT_TRACE_PATH) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Latency percentiles per stage (span name), with error counts and mean token/chunk counts
+def stage_stats(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for record in spans:
+        by_name.setdefault(record["name"], []).append(record)
+    stats = {}
+    for name, records in by_name.items():
+        durations = np.array([record["duration_ms"] for record in records])
+        row = {"count": len(records), "errors": sum(1 for record in records if record.get("error"))}
+        row.update({f"p{p}": float(np.percentile(durations, p)) for p in PERCENTILES})
+        for attribute in REPORTED_ATTRIBUTES:
+            values = [record["attributes"][attribute] for record in records
+                      if isinstance(record["attributes"].get(attribute), (int, float))]
+            if values:
+                row[attribute] = float(np.mean(values))
+        stats[name] = row
+    return stats
+
+
+def stats_report(stats: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'stage':<22}{'count':>7}{'errors':>8}" + "".join(f"{'p' + str(p) + ' ms':>11}" for p in PERCENTILES) +
+             "".join(f"{'avg ' + attribute:>20}" for attribute in REPORTED_ATTRIBUTES)]
+    for name, row in sorted(stats.items(), key=lambda item: -item[1]["p50"]):
+        lines.append(f"{name:<22}{row['count']:>7}{row['errors']:>8}" +
+                     "".join(f"{row[f'p{p}']:>11.1f}" for p in PERCENTILES) +
+                     "".join(f"{row[attribute]:>20.1f}" if attribute in row else f"{'-':>20}"
+                             for attribute in REPORTED_ATTRIBUTES))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency percentiles per stage from the trace file.")
+    parser.add_argument("--path", default=DEFAULT_TRACE_PATH)
+    parser.add_argument("--since", type=float, default=None, help="Only spans started in the last N hours")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    if args.since is not None:
+        spans = [record for record in spans if record["start"] >= time.time() - args.since * 3600]
+    if not spans:
+        print(f"[WARNING] No spans in {args.path}.")
+    else:
+        print(f"[INFO] {len(spans)} spans over {len({record['trace_id'] for record in spans})} traces.")
+        print(stats_report(stage_stats(spans)))
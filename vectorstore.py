@@ -1,9 +1,26 @@
 import os
 import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
 from langchain_community.vectorstores import Chroma
 from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from bm25_index import BM25Index
+from dedup import dedupe_sections, near_duplicate_filter
+from embedding_backends import EMBEDDING_BACKENDS, describe_embeddings, get_embeddings
+from embedding_cache import DEFAULT_CACHE_PATH
+from embedding_pipeline import EmbeddingPipeline
+from label_chunker import MAX_CHUNK_TOKENS, chunk_section, load_token_encoding
+from numpy_store import VECTOR_DTYPES, NumpyVectorStore, VectorIndex, get_vector_index
+
+
+MANIFEST_FILE = "index_manifest.json"
+DELETE_BATCH_SIZE = 500
+# "numpy" serves queries from the in-process index next to the store (numpy_store.py)
+VECTOR_BACKENDS = ["chroma", "numpy"]
 
 
 # Flush ChromaDB
@@ -21,56 +38,462 @@ def flush_chroma_db(persist_directory):
 
 
 # Preprocess JSON Files
-def preprocess_json_files(json_dir):
+# dedupe: drop boilerplate sections and collapse sections repeated inside others (e.g. "Drug Label Information")
+# near_duplicate_threshold: if set, also drop chunks whose MinHash Jaccard to an earlier chunk of the same file is above it
+# report: optional dict that receives the dedup statistics
+# chunker: "label" splits on the label's numbered sections/subsections with a token budget and no overlap,
+# "recursive" is the original 1000-character splitter with 200 characters of overlap
+# files: optional label names (JSON file names without ".json") to process instead of the whole directory
+def preprocess_json_files(json_dir, dedupe=True, near_duplicate_threshold=None, skip_sections=None, report=None,
+                          chunker="label", max_chunk_tokens=MAX_CHUNK_TOKENS, files=None):
     print("[INFO] Starting JSON preprocessing...")
     documents = []
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    if chunker == "label":
+        def split(section, content):
+            return chunk_section(section, content, max_tokens=max_chunk_tokens)
+    elif chunker == "recursive":
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+        def split(section, content):
+            return [(section, chunk) for chunk in splitter.split_text(content)]
+    else:
+        raise ValueError(f"Unknown chunker: {chunker}")
+    stats = {"chunks_before": 0}
 
     for idx, file_name in enumerate(os.listdir(json_dir)):
-        if file_name.endswith(".json"):
+        if file_name.endswith(".json") and (files is None or file_name.split(".json")[0] in files):
             file_path = os.path.join(json_dir, file_name)
             with open(file_path, "r", encoding="utf-8") as file:
                 data = json.load(file)
 
                 # Flatten JSON sections
-                for section, content in data.items():
-                    if isinstance(content, str) and content.strip():
-                        # Split into chunks
-                        for chunk in splitter.split_text(content):
-                            documents.append(
-                                Document(page_content=chunk, metadata={
-                                    "section": section,
-                                    "file": file_name.split(".json")[0]  # Store medicine name as metadata
-                                })
-                            )
+                sections = {section: content for section, content in data.items()
+                            if isinstance(content, str) and content.strip()}
+                if dedupe:
+                    stats["chunks_before"] += sum(len(split(section, content)) for section, content in sections.items())
+                    sections, file_stats = dedupe_sections(sections, skip_sections=skip_sections)
+                    for key, value in file_stats.items():
+                        stats[key] = stats.get(key, 0) + value
+
+                for section, content in sections.items():
+                    # Split into chunks
+                    for path, chunk in split(section, content):
+                        documents.append(
+                            Document(page_content=chunk, metadata={
+                                "section": section,
+                                "section_path": path,  # e.g. "5 WARNINGS AND PRECAUTIONS > 5.1 Lactic Acidosis"
+                                "file": file_name.split(".json")[0]  # Store medicine name as metadata
+                            })
+                        )
             print(f"[INFO] Processed {file_name} ({idx + 1}/{len(os.listdir(json_dir))})")
+
+    if not dedupe:
+        stats["chunks_before"] = len(documents)
+    if near_duplicate_threshold:
+        keep = near_duplicate_filter([doc.page_content for doc in documents], threshold=near_duplicate_threshold,
+                                     groups=[doc.metadata["file"] for doc in documents])
+        stats["near_duplicate_chunks"] = len(documents) - len(keep)
+        documents = [documents[i] for i in keep]
+    stats["chunks_after"] = len(documents)
+    stats["embedding_calls_saved"] = stats["chunks_before"] - stats["chunks_after"]
+
+    if dedupe or near_duplicate_threshold:
+        print(f"[INFO] Dedup removed {stats.get('boilerplate_sections', 0)} boilerplate sections, "
+              f"collapsed {stats.get('collapsed_sections', 0)} sections, dropped "
+              f"{stats.get('duplicate_sections', 0) + stats.get('dropped_containers', 0)} duplicate sections "
+              f"and {stats.get('near_duplicate_chunks', 0)} near-duplicate chunks.")
+        print(f"[INFO] Chunks: {stats['chunks_before']} -> {stats['chunks_after']} "
+              f"({stats['embedding_calls_saved']} embedding calls saved)")
+    if report is not None:
+        report.update(stats)
     print(f"[INFO] JSON preprocessing completed. Total chunks: {len(documents)}")
     return documents
 
 
+# Content-hashed chunk IDs: the same (file, section, chunk text) always maps to the same ID.
+# Identical chunks inside one section get an occurrence counter so their IDs stay distinct.
+def assign_chunk_ids(documents):
+    ids = []
+    seen = {}
+    for doc in documents:
+        key = "\x1f".join([doc.metadata["file"], doc.metadata["section"], doc.page_content])
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(hashlib.sha256(f"{key}\x1f{occurrence}".encode("utf-8")).hexdigest())
+    return ids
+
+
+def _read_manifest(persist_directory):
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+# Manifest of the chunk IDs currently held by the store
+def load_manifest(persist_directory):
+    return _read_manifest(persist_directory).get("chunks", {})
+
+
+# The embedding backend and model the store was built with (embedding_backends.describe_embeddings),
+# or None for a store built before this was recorded
+def load_store_embedding(persist_directory):
+    return _read_manifest(persist_directory).get("embedding")
+
+
+def corpus_version_of(chunk_ids):
+    return hashlib.sha256("".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()[:16]
+
+
+def save_manifest(persist_directory, chunks, embedding=None):
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    manifest = {
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "corpus_version": corpus_version_of(chunks),
+        "chunks": chunks,
+    }
+    if embedding:
+        manifest["embedding"] = embedding
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+# Vectors from different models are not comparable even when their dimensions match, so a store is
+# only ever queried or extended with the embeddings it was built with
+def check_store_embeddings(persist_directory, embeddings):
+    recorded = load_store_embedding(persist_directory)
+    current = describe_embeddings(embeddings)
+    if recorded is None:
+        if load_manifest(persist_directory):
+            print(f"[WARNING] {persist_directory} does not record its embedding model; assuming {current['model']}.")
+        return
+    if (recorded["backend"], recorded["model"]) != (current["backend"], current["model"]):
+        raise Exception(f"[ERROR] {persist_directory} was embedded with {recorded['backend']} ({recorded['model']}), "
+                        f"not {current['backend']} ({current['model']}). Load it with the same backend, or re-embed "
+                        f"it with `python vectorstore.py --migrate --embedding-backend {current['backend']}`.")
+
+
+# The embeddings a store was built with; stores that predate the record were built with OpenAI
+def store_embeddings(persist_directory, cache_path=None):
+    recorded = load_store_embedding(persist_directory) or {"backend": "openai", "options": {}}
+    return get_embeddings(recorded["backend"], cache_path=cache_path, **recorded["options"])
+
+
+# Open a built store. Without `embeddings`, queries are embedded with the store's own backend;
+# with them, they must match it. backend="numpy" searches the store's NumPy index in process, and
+# falls back to Chroma when the index is missing or out of date.
+def open_vector_store(persist_directory, embeddings=None, cache_path=None, backend="chroma"):
+    if embeddings is None:
+        embeddings = store_embeddings(persist_directory, cache_path=cache_path)
+    else:
+        check_store_embeddings(persist_directory, embeddings)
+    if backend == "numpy":
+        index = get_vector_index(persist_directory)
+        if index is not None and index.corpus_version == get_corpus_version(persist_directory):
+            return NumpyVectorStore(persist_directory, embeddings, index)
+        print("[WARNING] NumPy vector index is missing or out of date with the vector store; using Chroma. "
+              "Rebuild with vectorstore.py to refresh it.")
+    elif backend != "chroma":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    return Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+
+
+# Version of the indexed corpus: changes whenever the set of indexed chunks changes.
+# Memoised on the manifest's mtime so per-request callers don't re-read it.
+_corpus_version_cache = {}
+
+
+def get_corpus_version(persist_directory):
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return "unversioned"
+    mtime = os.stat(manifest_path).st_mtime_ns
+    cached = _corpus_version_cache.get(manifest_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    version = manifest.get("corpus_version") or manifest.get("updated_at", "unversioned")
+    _corpus_version_cache[manifest_path] = (mtime, version)
+    return version
+
+
+# Embed documents through the batched pipeline and write each finished batch to the store.
+# The manifest is saved after every batch and doubles as the build checkpoint.
+def embed_into_store(vector_store, documents_by_id, ids, manifest, persist_directory, embeddings,
+                     batch_size=64, max_workers=4):
+    embedding = describe_embeddings(embeddings)
+
+    def on_batch(batch_ids, vectors):
+        docs = [documents_by_id[chunk_id] for chunk_id in batch_ids]
+        vector_store._collection.upsert(
+            ids=batch_ids,
+            embeddings=vectors,
+            metadatas=[doc.metadata for doc in docs],
+            documents=[doc.page_content for doc in docs],
+        )
+        for chunk_id, doc in zip(batch_ids, docs):
+            manifest[chunk_id] = {"file": doc.metadata["file"], "section": doc.metadata["section"]}
+        save_manifest(persist_directory, manifest, embedding)
+
+    pipeline = EmbeddingPipeline(embeddings, batch_size=batch_size, max_workers=max_workers)
+    texts = [documents_by_id[chunk_id].page_content for chunk_id in ids]
+    return pipeline.run(ids, texts, on_batch, skip_ids=manifest)
+
+
+# Rebuild the BM25 keyword index over exactly the chunks now in the store.
+# Tokenizing the whole corpus takes about a second, so it is rebuilt rather than patched.
+def sync_bm25_index(documents, ids, persist_directory):
+    index = BM25Index.build(ids, documents, corpus_version=corpus_version_of(ids))
+    index.save(persist_directory)
+    print(f"[INFO] BM25 index saved: {len(index)} chunks, {len(index.vocab)} terms.")
+    return index
+
+
+# Delete chunks from the store and the manifest
+def drop_chunks(vector_store, manifest, to_drop, persist_directory, embeddings):
+    print(f"[INFO] Deleting {len(to_drop)} removed chunks...")
+    for start in range(0, len(to_drop), DELETE_BATCH_SIZE):
+        vector_store.delete(ids=to_drop[start:start + DELETE_BATCH_SIZE])
+    for chunk_id in to_drop:
+        del manifest[chunk_id]
+    save_manifest(persist_directory, manifest, describe_embeddings(embeddings))
+
+
+# Precision of the store's current NumPy index; float32 when it has none yet
+def stored_vector_dtype(persist_directory):
+    index = get_vector_index(persist_directory)
+    return index.dtype if index is not None else "float32"
+
+
+# Rewrite the NumPy vector index (numpy_store.py) over exactly the chunks now in the store, with the
+# vectors Chroma holds for them. Without a dtype the index keeps the precision it was built with.
+def sync_vector_index(vector_store, documents, ids, persist_directory, embeddings, dtype=None):
+    if not ids:
+        return None
+    dtype = dtype or stored_vector_dtype(persist_directory)
+    vectors = {}
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        stored = vector_store._collection.get(ids=ids[start:start + DELETE_BATCH_SIZE], include=["embeddings"])
+        vectors.update(zip(stored["ids"], stored["embeddings"]))
+    index = VectorIndex.build(ids, [vectors[chunk_id] for chunk_id in ids], documents, dtype=dtype,
+                              corpus_version=corpus_version_of(ids), embedding=describe_embeddings(embeddings))
+    index.save(persist_directory)
+    print(f"[INFO] Vector index saved: {len(index)} chunks, {index.dtype}, {index.kind}.")
+    return index
+
+
 # Create Vector Store
-def create_vector_store(documents, persist_directory):
+# If a manifest is already present (a previous build crashed part way), finished batches are skipped.
+def create_vector_store(documents, persist_directory, embeddings=None, batch_size=64, max_workers=4,
+                        vector_dtype=None):
     print("[INFO] Creating embeddings and vector store...")
-    embeddings = OpenAIEmbeddings()
-    vector_store = Chroma.from_documents(documents, embeddings, persist_directory=persist_directory)
+    embeddings = embeddings or OpenAIEmbeddings()
+    vector_store = open_vector_store(persist_directory, embeddings)
+    manifest = load_manifest(persist_directory)
+    if manifest:
+        print(f"[INFO] Resuming build: {len(manifest)} chunks already embedded.")
+    ids = assign_chunk_ids(documents)
+    # Chunks the crashed build embedded that are no longer in the corpus would keep the manifest's
+    # corpus version from ever matching the side indexes
+    current = set(ids)
+    stale = [chunk_id for chunk_id in manifest if chunk_id not in current]
+    if stale:
+        drop_chunks(vector_store, manifest, stale, persist_directory, embeddings)
+    report = embed_into_store(vector_store, dict(zip(ids, documents)), ids, manifest, persist_directory,
+                              embeddings, batch_size=batch_size, max_workers=max_workers)
+    print(f"[INFO] Embedded {report['embedded']} chunks in {report['batches']} batches "
+          f"({report['retries']} retries, {report['seconds']}s).")
+    sync_bm25_index(documents, ids, persist_directory)
+    sync_vector_index(vector_store, documents, ids, persist_directory, embeddings, dtype=vector_dtype)
     print("[INFO] Vector store created and persisted successfully.")
     return vector_store
 
 
+# Chunks already in the store, as Documents
+def stored_documents(vector_store, ids):
+    documents = []
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        stored = vector_store.get(ids=ids[start:start + DELETE_BATCH_SIZE], include=["documents", "metadatas"])
+        by_id = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                 for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+        documents.extend(by_id[chunk_id] for chunk_id in ids[start:start + DELETE_BATCH_SIZE])
+    return documents
+
+
+# Incrementally update the Vector Store: embed only new/changed chunks, delete removed ones
+# files: when set, `documents` are the chunks of just these labels; chunks of other labels are left alone
+def update_vector_store(documents, persist_directory, embeddings=None, batch_size=64, max_workers=4, files=None,
+                        vector_dtype=None):
+    print("[INFO] Updating vector store incrementally...")
+    embeddings = embeddings or OpenAIEmbeddings()
+    manifest = load_manifest(persist_directory)
+    vector_store = open_vector_store(persist_directory, embeddings)
+
+    # A store built before manifests existed has random IDs we cannot diff against
+    if not manifest and vector_store._collection.count() > 0:
+        print("[WARNING] Existing vector store has no manifest. Rebuilding from scratch.")
+        vector_store.delete_collection()
+        vector_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+
+    ids = assign_chunk_ids(documents)
+    current = dict(zip(ids, documents))
+    to_add = [chunk_id for chunk_id in ids if chunk_id not in manifest]
+    to_drop = [chunk_id for chunk_id, entry in manifest.items()
+               if chunk_id not in current and (files is None or entry["file"] in files)]
+    kept = len(ids) - len(to_add)
+    untouched = [] if files is None else [chunk_id for chunk_id, entry in manifest.items()
+                                          if entry["file"] not in files]
+
+    if to_drop:
+        drop_chunks(vector_store, manifest, to_drop, persist_directory, embeddings)
+
+    if to_add:
+        embed_into_store(vector_store, current, to_add, manifest, persist_directory, embeddings,
+                         batch_size=batch_size, max_workers=max_workers)
+
+    all_documents = stored_documents(vector_store, untouched) + documents
+    sync_bm25_index(all_documents, untouched + ids, persist_directory)
+    sync_vector_index(vector_store, all_documents, untouched + ids, persist_directory, embeddings, dtype=vector_dtype)
+
+    report = {"added": len(to_add), "kept": kept + len(untouched), "dropped": len(to_drop)}
+    print(f"[INFO] Incremental update complete. Added: {report['added']}, "
+          f"kept: {report['kept']}, dropped: {report['dropped']}")
+    return vector_store, report
+
+
+# Re-embed every chunk of a store with other embeddings (e.g. OpenAI -> local). The new store is built
+# next to the old one, resumably like any build, then swapped in; the old one is kept as <dir>.bak.
+# Chunk IDs, metadata and the side indexes (BM25, attribute index, drug graph, ...) carry over as is.
+def migrate_vector_store(persist_directory, embeddings, batch_size=64, max_workers=4, keep_backup=True,
+                         vector_dtype=None):
+    manifest = load_manifest(persist_directory)
+    if not manifest:
+        raise Exception(f"[ERROR] {persist_directory} has no manifest to migrate; rebuild it from the JSON files.")
+    target = describe_embeddings(embeddings)
+    vector_dtype = vector_dtype or stored_vector_dtype(persist_directory)
+    recorded = load_store_embedding(persist_directory)
+    if recorded and (recorded["backend"], recorded["model"]) == (target["backend"], target["model"]):
+        print(f"[INFO] {persist_directory} is already embedded with {target['model']}.")
+        return open_vector_store(persist_directory, embeddings)
+
+    print(f"[INFO] Migrating {len(manifest)} chunks to {target['backend']} ({target['model']})...")
+    ids = list(manifest)
+    old_store = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    documents = stored_documents(old_store, ids)
+
+    directory = os.path.normpath(persist_directory)
+    staging, backup = directory + ".migrating", directory + ".bak"
+    os.makedirs(staging, exist_ok=True)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and name != MANIFEST_FILE and not name.startswith("chroma.sqlite3") \
+                and not name.endswith(".tmp"):
+            shutil.copy2(path, os.path.join(staging, name))
+    new_store = open_vector_store(staging, embeddings)
+    report = embed_into_store(new_store, dict(zip(ids, documents)), ids, load_manifest(staging), staging,
+                              embeddings, batch_size=batch_size, max_workers=max_workers)
+    print(f"[INFO] Embedded {report['embedded']} chunks in {report['batches']} batches ({report['seconds']}s).")
+    sync_vector_index(new_store, documents, ids, staging, embeddings, dtype=vector_dtype)
+
+    # Chroma keeps one client per path; drop them so the swapped directories are reopened fresh
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+    if os.path.exists(backup):
+        shutil.rmtree(backup)
+    os.replace(directory, backup)
+    os.replace(staging, directory)
+    if not keep_backup:
+        shutil.rmtree(backup)
+    print("[INFO] Migration complete." + (f" Previous store kept at {backup}." if keep_backup else ""))
+    return open_vector_store(persist_directory, embeddings)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ChromaDB vector store from the label JSON files.")
+    parser.add_argument("--json-dir", default="/Users/ashwin/Desktop/LLM_Hackathon/datasets/microlabs_usa")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Embed only new or changed chunks instead of flushing and rebuilding")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue a crashed full build from its manifest instead of flushing first")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Re-embed the existing store's chunks with --embedding-backend instead of rebuilding")
+    parser.add_argument("--embedding-backend", default=None, choices=EMBEDDING_BACKENDS,
+                        help="Defaults to the backend the store was built with (openai for a new store)")
+    parser.add_argument("--embedding-cache", default=DEFAULT_CACHE_PATH,
+                        help="SQLite embedding cache shared with the retrievers")
+    parser.add_argument("--no-embedding-cache", action="store_true")
+    parser.add_argument("--vector-dtype", default=None, choices=VECTOR_DTYPES,
+                        help="Precision of the NumPy vector index written next to the store "
+                             "(defaults to the existing index's, float32 for a new store)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding request")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent embedding requests")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Chunk every section as scraped, including boilerplate and repeated sections")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=None,
+                        help="Also drop chunks whose MinHash Jaccard similarity to an earlier chunk exceeds this")
+    parser.add_argument("--chunker", default="label", choices=["label", "recursive"],
+                        help="Label-aware section chunking, or the original recursive character splitter")
+    parser.add_argument("--max-chunk-tokens", type=int, default=MAX_CHUNK_TOKENS,
+                        help="Token budget per chunk for the label chunker")
+    args = parser.parse_args()
+
+    # Chunk budgets and the app's token counts use tiktoken's encoding; fetch it now if it isn't cached
+    load_token_encoding(download=True)
+
     # Configuration
-    json_dir = "/Users/ashwin/Desktop/LLM_Hackathon/datasets/microlabs_usa"
-    persist_directory = "./chroma_db"
+    json_dir = args.json_dir
+    persist_directory = args.persist_directory
+    cache_path = None if args.no_embedding_cache else args.embedding_cache
+    if args.embedding_backend:
+        embeddings = get_embeddings(args.embedding_backend, cache_path=cache_path)
+    elif args.migrate:
+        parser.error("--migrate needs --embedding-backend")
+    else:
+        embeddings = store_embeddings(persist_directory, cache_path=cache_path)
 
-    # Step 1: Flush Vector Store
-    flush_chroma_db(persist_directory)
+    if args.migrate:
+        # Only the embeddings change; chunks and the side indexes are carried over
+        migrate_vector_store(persist_directory, embeddings, batch_size=args.batch_size, max_workers=args.workers,
+                             vector_dtype=args.vector_dtype)
+    elif args.incremental:
+        # Incremental mode: keep the store online and only touch what changed
+        print("[INFO] Preprocessing JSON files...")
+        documents = preprocess_json_files(json_dir, dedupe=not args.no_dedupe,
+                                          near_duplicate_threshold=args.near_duplicate_threshold,
+                                          chunker=args.chunker, max_chunk_tokens=args.max_chunk_tokens)
+        update_vector_store(documents, persist_directory, embeddings,
+                            batch_size=args.batch_size, max_workers=args.workers, vector_dtype=args.vector_dtype)
+    else:
+        # Step 1: Flush Vector Store
+        if args.resume:
+            print("[INFO] Resuming previous build; skipping flush.")
+        else:
+            flush_chroma_db(persist_directory)
 
-    # Step 2: Preprocess JSON Files
-    print("[INFO] Preprocessing JSON files...")
-    documents = preprocess_json_files(json_dir)
-    print(f"[INFO] Processed {len(documents)} document chunks.")
+        # Step 2: Preprocess JSON Files
+        print("[INFO] Preprocessing JSON files...")
+        documents = preprocess_json_files(json_dir, dedupe=not args.no_dedupe,
+                                          near_duplicate_threshold=args.near_duplicate_threshold,
+                                          chunker=args.chunker, max_chunk_tokens=args.max_chunk_tokens)
+        print(f"[INFO] Processed {len(documents)} document chunks.")
 
-    # Step 3: Create Vector Store
-    print("[INFO] Creating vector store...")
-    create_vector_store(documents, persist_directory)
+        # Step 3: Create Vector Store
+        print("[INFO] Creating vector store...")
+        create_vector_store(documents, persist_directory, embeddings,
+                            batch_size=args.batch_size, max_workers=args.workers, vector_dtype=args.vector_dtype)
+    if not args.migrate:
+        # (drug, section) index for direct QA answers, built from the same JSON files
+        from attribute_index import build_attribute_index, save_attribute_index
+        save_attribute_index(persist_directory, build_attribute_index(json_dir))
+        # Drug class / indication / interaction graph for the Recommender
+        from drug_graph import DrugGraph
+        DrugGraph.build(json_dir).save(persist_directory)
+    if hasattr(embeddings, "stats"):
+        print(f"[INFO] Embedding cache: {embeddings.stats()}")
     print("[INFO] Vector store setup complete.")
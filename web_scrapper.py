@@ -1,11 +1,14 @@
 import json
 import os
+import argparse
 import re  # Import the re module
 import requests
 from bs4 import BeautifulSoup
+from section_extractor import extract_sections, tree_sections
 
 DATASETS_PATH = r"/Users/ashwin/Desktop/LLM_Hackathon/datasets"
 DATASETS_MICROLABS_USA = os.path.join(DATASETS_PATH, "microlabs_usa")
+REQUEST_TIMEOUT = 30  # seconds
 
 URLS = {
     "Acetazolamide Extended-Release Capsules": "https://www.microlabsusa.com/products/acetazolamide-extended-release-capsules/",
@@ -56,7 +59,22 @@ URLS = {
 
 }
 
-def setup_prescribing_info_urls(urls_map):
+# Link under the "Prescribing Information" heading of a product page, or None
+def find_prescribing_info_url(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for h2_item in soup.findAll("h2"):
+        txt = h2_item.get_text()
+        if txt and txt.strip().lower() == "Prescribing Information".lower():
+            child_url = h2_item.findAll("a")
+            if child_url:
+                href = child_url[0].get("href")
+                if not href.startswith("http"):
+                    print(f"[ERROR] Invalid prescribing info URL: {href}")
+                    continue
+                return href
+    return None
+
+def setup_prescribing_info_urls(urls_map, timeout=REQUEST_TIMEOUT):
     updated_urls = {}
 
     print("[INFO] Starting to process URLs...")
@@ -64,31 +82,18 @@ def setup_prescribing_info_urls(urls_map):
         print(f"[INFO] Processing product: {key}")
         updated_urls[key] = {"product_url": value}
         try:
-            data = requests.get(value)
+            data = requests.get(value, timeout=timeout)
             if data.status_code != 200:
                 print(f"[ERROR] Failed to fetch URL: {value} (Status Code: {data.status_code})")
                 continue
-            soup = BeautifulSoup(data.text, "html.parser")
-            h2 = soup.findAll("h2")
-
-            got = False
-            for h2_item in h2:
-                txt = h2_item.get_text()
-                if txt and txt.strip().lower() == "Prescribing Information".lower():
-                    child_url = h2_item.findAll("a")
-                    if child_url:
-                        href = child_url[0].get("href")
-                        if not href.startswith("http"):
-                            print(f"[ERROR] Invalid prescribing info URL: {href}")
-                            continue
-                        updated_urls[key]["prescribing_info_url"] = href
-                        html = requests.get(href)
-                        prescribing_soup = BeautifulSoup(html.text, "html.parser")
-                        updated_urls[key]["prescribing_soup"] = prescribing_soup
-                        print(f"[INFO] Found prescribing info for {key}")
-                        got = True
-                        break  # Move this break inside the if block
-            if not got:
+            href = find_prescribing_info_url(data.text)
+            if href:
+                updated_urls[key]["prescribing_info_url"] = href
+                html = requests.get(href, timeout=timeout)
+                prescribing_soup = BeautifulSoup(html.text, "html.parser")
+                updated_urls[key]["prescribing_soup"] = prescribing_soup
+                print(f"[INFO] Found prescribing info for {key}")
+            else:
                 print(f"[WARNING] No prescribing information found for {key}")
 
         except Exception as e:
@@ -96,18 +101,9 @@ def setup_prescribing_info_urls(urls_map):
     print("[INFO] Finished processing URLs.")
     return updated_urls
 
+# Section title -> text of the tags that follow it, for every h1/h2/h3 (see section_extractor)
 def get_all_sections(soup):
-    headers = soup.find_all(['h1', 'h2', 'h3'])
-    info = {}
-    for header in headers:
-        section_title = header.get_text(strip=True)
-        content = []
-        for sibling in header.find_next_siblings():
-            if sibling.name in ['h1', 'h2', 'h3']:
-                break
-            content.append(sibling.get_text(strip=True))
-        info[section_title] = "\n".join(content)
-    return info
+    return tree_sections(soup)
 
 def process_prescribing_soup(name, soup):
     print(f"[INFO] Parsing prescribing information for {name}")
@@ -120,20 +116,56 @@ def process_prescribing_soup(name, soup):
         print(f"[ERROR] Failed to process prescribing soup for {name}: {e}")
         return {}
 
+def dataset_file_path(pth, product_name):
+    sanitized_name = re.sub(r'[<>:"/\\|?*]', '_', product_name)
+    return os.path.join(pth, sanitized_name + ".json")
+
+# Same as process_prescribing_soup, straight from the page HTML without building a tree
+def process_prescribing_html(name, html):
+    print(f"[INFO] Parsing prescribing information for {name}")
+    try:
+        results = extract_sections(html)
+        results["product_name"] = name
+        print(f"[INFO] Successfully parsed prescribing info for {name}")
+        return results
+    except Exception as e:
+        print(f"[ERROR] Failed to process prescribing info for {name}: {e}")
+        return {}
+
+# Returns whether the file was written
 def create_dataset_file(pth, result):
     try:
-        sanitized_name = re.sub(r'[<>:"/\\|?*]', '_', result["product_name"])
-        fname = os.path.join(pth, sanitized_name + ".json")
+        fname = dataset_file_path(pth, result["product_name"])
         with open(fname, "w", encoding="utf-8") as f:
             json.dump(result, f, indent=4)
         print(f"[INFO] Dataset file created at {fname}")
+        return True
     except Exception as e:
         print(f"[ERROR] Failed to create dataset file for {result.get('product_name', 'unknown')}: {e}")
+        return False
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrape the Micro Labs prescribing-information labels.")
+    parser.add_argument("--output-dir", default=DATASETS_MICROLABS_USA)
+    parser.add_argument("--sequential", action="store_true",
+                        help="Fetch every page one by one and parse at the end (the original scraper)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent product crawls")
+    parser.add_argument("--min-interval", type=float, default=1.0, help="Seconds between requests to one host")
+    parser.add_argument("--cache-dir", default="./http_cache", help="On-disk HTTP cache for conditional requests")
+    parser.add_argument("--resume", action="store_true", help="Skip products finished by the previous crawl")
+    args = parser.parse_args()
+
     print("[INFO] Script started.")
-    os.makedirs(DATASETS_MICROLABS_USA, exist_ok=True)
-    print(f"[INFO] Output directory ensured: {DATASETS_MICROLABS_USA}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"[INFO] Output directory ensured: {args.output_dir}")
+
+    if not args.sequential:
+        from crawler import Crawler
+        crawler = Crawler(args.cache_dir, max_workers=args.workers, min_interval=args.min_interval)
+        report = crawler.crawl(URLS, args.output_dir, resume=args.resume)
+        print(f"[INFO] Crawl report: {report['counts']}")
+        print("[INFO] Script completed.")
+        raise SystemExit(0)
 
     modified_urls = setup_prescribing_info_urls(URLS)
     print("[INFO] Processing prescribing soups...")
@@ -143,8 +175,8 @@ if __name__ == '__main__':
             continue
         results = process_prescribing_soup(k, v["prescribing_soup"])
         if results:
-            create_dataset_file(DATASETS_MICROLABS_USA, results)
+            create_dataset_file(args.output_dir, results)
         else:
             print(f"[WARNING] No data extracted for {k}, skipping file creation.")
 
-    print("[INFO] Script completed.")
\ No newline at end of file
+    print("[INFO] Script completed.")